@@ -7,9 +7,16 @@ import time
 import numpy as np
 import math
 import pickle
-from scipy import stats
 
+import es_client
+import hit_fields
+import rescore_window
+import search_templates
+import setrank_script
 import setRank_ESR
+import sweep_engine
+
+FLAGS_MSEARCH_TEMPLATE = True # Send the parts of the search bodies shared by all parameters once, as a search template
 
 def string2dict(s):
   d = {ele.split(":")[0]: float(ele.split(":")[1]) for ele in s.split(",")}
@@ -19,21 +26,50 @@ def dict2string(d):
   s = ",".join(str(k)+":"+str(d[k]) for k in d)
   return s
 
-def multiSetRank(query_words_string, query_entities_string, kb, params_set, DEBUG=False):
-  bulk = []
+def multiSetRank(query_words_string, query_entities_string, kb, params_set, DEBUG=False, index_name=setRank_ESR.FLAGS_INDEX_NAME,
+                 sweep_mode="es", topk=setRank_ESR.FLAGS_TOPK, window_size=setRank_ESR.FLAGS_RESCORE_WINDOW_SIZE,
+                 adaptive_window=False):
+  ''' Rank a query with every parameter of params_set.
+
+  :param sweep_mode: "es" to run one search per parameter, "local" to score all parameters at once over the rescore
+                     window of the first parameter, see sweep_engine.py
+  :param topk: number of documents ranked with each parameter
+  :param window_size: number of documents rescored, or the maximum number if adaptive_window is True
+  :param adaptive_window: True to grow the rescore window of each parameter only while its top-k changes, see
+                          rescore_window.py, which requires sweep_mode "es"
+  :return: a list of document id rankings, one per parameter
+  '''
+  rescore_window.check_sizes(topk, window_size)
+  ## global term statistics are shared by all parameters, so they are obtained once per query
+  global_ttfs = setRank_ESR.query_global_ttfs(query_words_string, query_entities_string, index_name=index_name)
+  if sweep_mode == "local":
+    if adaptive_window:
+      raise ValueError("Adaptive rescore windows require sweep mode es")
+    start = time.time()
+    rankings = sweep_engine.sweep(setRank_ESR, query_words_string, query_entities_string, kb, params_set, index_name,
+                                  global_ttfs=global_ttfs, topk=topk, window_size=window_size, request_timeout=600,
+                                  DEBUG=DEBUG)
+    print("Finish scoring %s pre-rankers' results locally using %s seconds" % (len(params_set), time.time() - start))
+    return rankings
+  elif sweep_mode != "es":
+    raise ValueError("Unsupported sweep mode: %s" % sweep_mode)
+
+  headers = []
+  bodies = []
+  retrieval_queries = []
   for params in params_set:
     retrieval_query = setRank_ESR.generate_retrieval_query(
       query_string=query_words_string, entity_string=query_entities_string, field_weights=params, DEBUG=DEBUG
     )
     rescore_query = setRank_ESR.generate_rescore_query(
-      query_string=query_words_string, entity_string=query_entities_string, kb=kb, params=params, DEBUG=DEBUG
+      query_string=query_words_string, entity_string=query_entities_string, kb=kb, params=params, DEBUG=DEBUG,
+      global_ttfs=global_ttfs
     )
     search_body = {
-      "size": 20,
-      "_source": ["docno"],
+      "size": topk,
       "query": retrieval_query,
       "rescore": {
-        "window_size": 1000,
+        "window_size": window_size,
         "query": {
           "rescore_query": rescore_query,
           "query_weight": 0,
@@ -41,18 +77,45 @@ def multiSetRank(query_words_string, query_entities_string, kb, params_set, DEBU
         }
       }
     }
-    op_dict = {"index": setRank_ESR.FLAGS_INDEX_NAME, "type": setRank_ESR.FLAGS_TYPE_NAME}
-    bulk.append(op_dict)
-    bulk.append(search_body)
+    hit_fields.id_only(search_body, setRank_ESR.FLAGS_ID_FIELD)
+    op_dict = {"index": index_name, "type": setRank_ESR.FLAGS_TYPE_NAME}
+    if global_ttfs is not None:
+      op_dict["search_type"] = "dfs_query_then_fetch"
+    headers.append(op_dict)
+    bodies.append(search_body)
+    retrieval_queries.append(retrieval_query)
 
   start = time.time()
-  resp = setRank_ESR.es.msearch(body=bulk, request_timeout=600)["responses"]
+  windows = None
+  totals = None
+  if global_ttfs is not None:
+    ## the rescore window applies to each shard, so only the documents of the global window are rescored
+    windows = rescore_window.global_windows(es_client.get_es(), headers, retrieval_queries,
+                                            setRank_ESR.FLAGS_ID_FIELD, window_size, request_timeout=600)
+    totals = [total for _, total in windows]
+
+  def run(indices, size):
+    for i in indices:
+      bodies[i]["rescore"]["window_size"] = size
+      if windows is not None:
+        bodies[i]["query"] = rescore_window.window_query(retrieval_queries[i], windows[i][0][:size],
+                                                         setRank_ESR.FLAGS_ID_FIELD)
+    return search_templates.msearch(es_client.get_es(), [headers[i] for i in indices], [bodies[i] for i in indices],
+                                    request_timeout=600, templated=FLAGS_MSEARCH_TEMPLATE)
+
+  if adaptive_window:
+    resp, sizes = rescore_window.adaptive_search(run, len(bodies), setRank_ESR.FLAGS_ID_FIELD, topk, window_size,
+                                                 totals=totals)
+  else:
+    resp = run(list(range(len(bodies))), window_size)
   end = time.time()
-  print("Finish retrieve %s pre-rankers' results using %s seconds" % (len(bulk)/2, (end-start)))
+  print("Finish retrieve %s pre-rankers' results using %s seconds" % (len(bodies), (end-start)))
+  if adaptive_window:
+    print("Rescore window sizes: %s" % sorted(Counter(sizes).items()))
 
   rankings = []
   for res in resp:
-    ranking = [hit["_source"]["docno"] for hit in res["hits"]["hits"]]
+    ranking = [hit_fields.hit_id(hit, setRank_ESR.FLAGS_ID_FIELD) for hit in res["hits"]["hits"]]
     rankings.append(ranking)
 
   return rankings
@@ -176,6 +239,7 @@ def rankAggregate(doc_rankings, maxIters=10, distanceMetric='KT', checkConverge=
     Z = sum(alphas)
     alphas = alphas / Z
     uniform_dist = np.ones(p) / p
+    from scipy import stats # scipy is slow to import, so only when it is used
     kl = stats.entropy(pk=alphas, qk=uniform_dist)
     print("Iteration: %s, confidence scores normalizer = %s" % (iter, Z))
     print("Iteration: %s, kl to uniform = %s" % (iter, kl))
@@ -273,6 +337,27 @@ def rankAggregateCorpus(corpus_doc_rankings, maxIters=10, distanceMetric="KT", c
 
   return alphas
 
+def evaluateRankings(all_docno_rankings, params_set, qrel_file, cutoffs=(5, 10, 15, 20)):
+  ''' Evaluate the candidate rankings of every parameter against relevance judgments, with the NumPy kernel of
+  pytrec_eval instead of writing a run per parameter and calling trec_eval.
+
+  :param all_docno_rankings: query_id -> a list of docno rankings, one per parameter in params_set
+  :param qrel_file: file name of the query relevance file
+  :return: a dict of measure -> a (number of parameters x number of cutoffs) array of the mean over judged queries
+  '''
+  import pytrec_eval
+  from pytrec_eval import kernel
+
+  dense_qrel = kernel.DenseQrel(pytrec_eval.parse_qrel_file(qrel_file))
+  rankings = [{query_id: all_docno_rankings[query_id][i] for query_id in all_docno_rankings}
+              for i in range(len(params_set))]
+  doc_idxs, present = dense_qrel.encode(rankings, depth=max(cutoffs))
+
+  ## queries without relevance judgments are left out, as in trec_eval
+  evaluated = present[0]
+  values = dense_qrel.evaluate(doc_idxs[:, evaluated], cutoffs=cutoffs)
+  return {measure: value.mean(axis=1) for measure, value in values.items()}
+
 def main(args):
   queries = setRank_ESR.load_query(args)
   kb = setRank_ESR.load_kb(args)
@@ -350,7 +435,10 @@ def main(args):
       if saved_result:
         rankings = all_docno_rankings[query_id]
       else:
-        rankings = multiSetRank(query_string, query_entities_string, kb, params_set, DEBUG=False)
+        rankings = multiSetRank(query_string, query_entities_string, kb, params_set, DEBUG=False,
+                                index_name=args.index, sweep_mode=args.sweep_mode,
+                                topk=int(args.topk), window_size=int(args.window_size),
+                                adaptive_window=args.adaptive_window)
         all_docno_rankings[query_id] = rankings
       (confidences, aggregated_rank) = rankAggregate(rankings, DEBUG=True)
       confidence_over_all_queries += confidences
@@ -358,10 +446,12 @@ def main(args):
       if args.mode == "tune-best-rank": # use the best parameter to rank this query again
         best_parameter = params_set[np.argmax(confidences)]
         print("Best parameters for query %s: %s" % (query_id, best_parameter))
-        res = setRank_ESR.setRank(query_string, query_entities_string, kb, best_parameter)
+        res = setRank_ESR.setRank(query_string, query_entities_string, kb, best_parameter,
+                                   index_name=args.index, topk=int(args.topk), window_size=int(args.window_size),
+                                   adaptive_window=args.adaptive_window)
         rank = 1
         for hit in res['hits']['hits']:
-          result_all.append([query_id, "Q0", hit["_source"]["docno"], str(rank), str(hit["_score"]), "autoSetRank"])
+          result_all.append([query_id, "Q0", hit_fields.hit_id(hit, setRank_ESR.FLAGS_ID_FIELD), str(rank), str(hit["_score"]), "autoSetRank"])
           rank += 1
       else:
         rank = 1
@@ -393,7 +483,10 @@ def main(args):
         query_entities_string = " ".join(query_entities_list)
 
         print("=== Running query %s (id = %s) ===" % (query_string, query_id))
-        rankings = multiSetRank(query_string, query_entities_string, kb, params_set, DEBUG=False)
+        rankings = multiSetRank(query_string, query_entities_string, kb, params_set, DEBUG=False,
+                                index_name=args.index, sweep_mode=args.sweep_mode,
+                                topk=int(args.topk), window_size=int(args.window_size),
+                                adaptive_window=args.adaptive_window)
         all_docno_rankings.append(rankings)
 
       with open(args.pre_saved_rankings, "wb") as fout:
@@ -409,6 +502,21 @@ def main(args):
   for ele in sorted(params2confidence, key = lambda x:-x[1])[0:10]:
     print("Confidence = %s, parameters = %s" % (ele[1], ele[0]))
 
+  if args.qrel: ## compare the confidences with the (held-out) effectiveness of every candidate parameter
+    if isinstance(all_docno_rankings, list): # corpus level rankings are in the order of queries
+      all_docno_rankings = {query[0]: rankings for query, rankings in zip(queries, all_docno_rankings)}
+    start = time.time()
+    mean_values = evaluateRankings(all_docno_rankings, params_set, args.qrel)
+    print("=== Evaluated %s candidate parameters in %.3f seconds ===" % (len(params_set), time.time() - start))
+    ndcg20 = mean_values["ndcg_cut"][:, 3]
+    from scipy import stats
+    print("Spearman correlation between confidence and NDCG@20 = %s" %
+          stats.spearmanr(confidence_over_all_queries, ndcg20)[0])
+    for i in np.argsort(-ndcg20, kind="stable")[0:10]:
+      print("NDCG@20 = %.4f, MAP@20 = %.4f, success@5 = %.4f, confidence = %s, parameters = %s" %
+            (ndcg20[i], mean_values["map_cut"][i, 3], mean_values["success"][i, 0],
+             confidence_over_all_queries[i], params_set[i]))
+
   if args.mode == "query": # save results only for query level aggregation
     setRank_ESR.save_results(args, result_all)
     print("Finish saving results to path: %s" % args.output)
@@ -435,6 +543,30 @@ if __name__ == "__main__":
                       help="name of (previously saved OR about to be saved) ranking results")
   parser.add_argument('-load_pre_saved_rankings', required=False, default="0",
                       help="set load_pre_saved_rankings to True if using presaved rankings")
+  parser.add_argument('-index', required=False, default=setRank_ESR.FLAGS_INDEX_NAME,
+                      help="name of the index to search, which can have multiple shards")
+  parser.add_argument('-sweep_mode', required=False, default="es", choices=["es", "local"],
+                      help="es: one search per candidate parameter, "
+                           "local: score all candidate parameters at once over a single rescore window")
+  parser.add_argument('-topk', required=False, default=setRank_ESR.FLAGS_TOPK,
+                      help="number of documents ranked with each candidate parameter")
+  parser.add_argument('-window_size', required=False, default=setRank_ESR.FLAGS_RESCORE_WINDOW_SIZE,
+                      help="number of documents rescored with each candidate parameter, the maximum one with "
+                           "-adaptive_window")
+  parser.add_argument('-adaptive_window', required=False, action='store_true',
+                      help="grow the rescore window of each candidate parameter from %s documents only while its "
+                           "top-k changes, with -sweep_mode es" % rescore_window.INITIAL_WINDOW_SIZE)
+  parser.add_argument('-qrel', required=False, default="",
+                      help="optional relevance judgments, used to report the effectiveness of every candidate "
+                           "parameter next to its confidence")
+  es_client.add_arguments(parser)
+  setrank_script.add_arguments(parser)
   args = parser.parse_args()
-  sys.exit(main(args))
+  es_client.configure_from_args(args)
+  setrank_script.configure_from_args(args)
+  try:
+    status = main(args)
+  finally:
+    search_templates.delete_templates(es_client.get_es())
+  sys.exit(status)
 
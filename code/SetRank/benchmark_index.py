@@ -0,0 +1,243 @@
+'''
+__author__: Jiaming Shen
+__description__: Benchmark the index-building pipeline on a synthetic corpus with the S2-CS or TREC-BIO schema.
+    Reports docs/s, MB/s, the time spent in each stage (parse, build, serialize, send) and the peak RSS.
+'''
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import dataset_schema
+import doc_reader
+import es_client
+import indexer
+
+def zipf_sampler(rng, prefix, vocab_size, alpha=1.1):
+    ''' Return a function which samples tokens "<prefix><rank>" following a Zipf distribution.
+    '''
+    weights = [1.0 / (r ** alpha) for r in range(1, vocab_size + 1)]
+    cum_weights = []
+    total = 0.0
+    for w in weights:
+        total += w
+        cum_weights.append(total)
+    tokens = ["%s%s" % (prefix, r) for r in range(vocab_size)]
+    def sample(k):
+        return rng.choices(tokens, cum_weights=cum_weights, k=k)
+    return sample
+
+def split_counts(total, fractions, rng):
+    ''' Split an integer total into len(fractions) parts, proportional to fractions with some noise.
+    '''
+    counts = [int(rng.gauss(total * f, total * f * 0.3 + 0.5)) for f in fractions]
+    return [max(c, 0) for c in counts]
+
+def generate_s2_doc(idx, rng, sample_word, sample_entity, ana_density):
+    ''' Generate one document with the same structure as s2_doc.json.
+    '''
+    title = " ".join(sample_word(max(2, int(rng.gauss(9, 3)))))
+    abstract = " ".join(sample_word(max(10, int(rng.gauss(150, 50)))))
+    keyphrases = [" ".join(sample_word(rng.randint(1, 3))) for _ in range(rng.randint(0, 6))]
+    ana = {}
+    fields = ["title", "paperAbstract", "keyPhrases", "bodyText"]
+    for field, num_mentions in zip(fields, split_counts(ana_density, [0.02, 0.08, 0.02, 0.88], rng)):
+        if num_mentions == 0:
+            continue
+        mentions = {}
+        for eid in sample_entity(num_mentions):
+            mentions[eid] = mentions.get(eid, 0) + 1
+        ana[field] = mentions
+    return {
+        "docno": "%040x" % idx,
+        "venue": [" ".join(sample_word(rng.randint(0, 3)))],
+        "numCitedBy": rng.randint(0, 500),
+        "numKeyCitations": rng.randint(0, 50),
+        "title": [title],
+        "paperAbstract": [abstract],
+        "keyPhrases": keyphrases,
+        "ana": ana
+    }
+
+def generate_trec_doc(idx, rng, sample_word, sample_entity, ana_density):
+    ''' Generate one document with the same structure as trec_doc.json.
+    '''
+    title = " ".join(sample_word(max(2, int(rng.gauss(12, 4)))))
+    abstract = " ".join(sample_word(max(10, int(rng.gauss(220, 70)))))
+    entity = []
+    for position, num_mentions in zip(["title", "abstract"], split_counts(ana_density, [0.1, 0.9], rng)):
+        for name in sample_entity(num_mentions):
+            entity.append({"name": name.replace("_", " "), "position": position})
+    return {
+        "pmid": str(10000000 + idx),
+        "title": title,
+        "abstract": abstract,
+        "date": "2004-%02d-%02d" % (rng.randint(1, 12), rng.randint(1, 28)),
+        "author": ";".join(" ".join(sample_word(2)) for _ in range(rng.randint(0, 6))),
+        "journal": " ".join(sample_word(rng.randint(1, 4))),
+        "mesh_heading": " ".join(sample_word(rng.randint(0, 10))),
+        "entity": entity
+    }
+
+def generate_corpus(path, dataset, num_docs, ana_density, seed=19):
+    ''' Write a synthetic corpus of num_docs documents to path, one JSON document per line.
+
+    :param dataset: either "s2" or "trec", which decides the document schema
+    :param ana_density: mean number of entity annotations per document
+    '''
+    rng = random.Random(seed)
+    sample_word = zipf_sampler(rng, "w", 50000)
+    if dataset == "s2":
+        sample_entity = zipf_sampler(rng, "/m/0", 20000)
+        generate_doc = generate_s2_doc
+    else:
+        sample_entity = zipf_sampler(rng, "entity_", 20000)
+        generate_doc = generate_trec_doc
+    with open(path, "w") as fout:
+        for idx in range(num_docs):
+            fout.write(json.dumps(generate_doc(idx, rng, sample_word, sample_entity, ana_density)) + "\n")
+
+class NullSink(object):
+    ''' In-process stand-in for Elasticsearch which only counts what it receives.
+    '''
+    def __init__(self):
+        self.num_requests = 0
+        self.num_bytes = 0
+
+    def send(self, body):
+        self.num_requests += 1
+        self.num_bytes += len(body.encode("utf-8"))
+
+class ESSink(object):
+    ''' Send each bulk body to an Elasticsearch index.
+    '''
+    def __init__(self, index_name, request_timeout=180):
+        self.es = es_client.get_es()
+        self.index_name = index_name
+        self.request_timeout = request_timeout
+        self.num_requests = 0
+        self.num_bytes = 0
+
+    def send(self, body):
+        self.num_requests += 1
+        self.num_bytes += len(body.encode("utf-8"))
+        res = self.es.bulk(index=self.index_name, body=body, request_timeout=self.request_timeout)
+        if res.get("errors"):
+            print("[ERROR] Bulk request %s has failed items" % self.num_requests)
+
+def run_benchmark(corpus_path, dataset, sink, index_name, bulk_size=500, json_backend="auto"):
+    ''' Run the index-building pipeline over the corpus and time each of its stages.
+
+    :return: a dict of measurements
+    '''
+    schema = dataset_schema.SCHEMAS[dataset]
+    targets = [(index_name, schema["type_name"])]
+    loads = doc_reader.get_json_loads(json_backend)
+    dumps = doc_reader.get_json_dumps(json_backend)
+
+    stage_times = {"read": 0.0, "parse": 0.0, "build": 0.0, "serialize": 0.0, "send": 0.0}
+    num_docs = 0
+    start = time.time()
+    ## the lines are read as by indexer.index_corpus(), and parsed separately to time both stages
+    batches = doc_reader.read_line_batches(corpus_path, batch_size=max(1, bulk_size // len(targets)))
+    while True:
+        t0 = time.time()
+        lines = next(batches, None)
+        t1 = time.time()
+        if lines is None:
+            break
+        stage_times["read"] += t1 - t0
+        if not lines: # a batch of blank lines, which the indexer skips as well
+            continue
+        paperInfos = [loads(line) for line in lines]
+        t2 = time.time()
+        data_dicts = [indexer.build_doc(paperInfo, schema) for paperInfo in paperInfos]
+        t3 = time.time()
+        body = indexer.bulk_body(data_dicts, schema, targets, dumps)
+        t4 = time.time()
+        sink.send(body)
+        t5 = time.time()
+
+        num_docs += len(lines)
+        stage_times["parse"] += t2 - t1
+        stage_times["build"] += t3 - t2
+        stage_times["serialize"] += t4 - t3
+        stage_times["send"] += t5 - t4
+    total_time = time.time() - start
+
+    input_mb = os.path.getsize(corpus_path) / (1024.0 * 1024.0)
+    return {
+        "num_docs": num_docs,
+        "input_mb": input_mb,
+        "bulk_mb": sink.num_bytes / (1024.0 * 1024.0),
+        "num_requests": sink.num_requests,
+        "total_time": total_time,
+        "docs_per_second": num_docs / total_time if total_time > 0 else 0.0,
+        "mb_per_second": input_mb / total_time if total_time > 0 else 0.0,
+        "stage_times": stage_times,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 # ru_maxrss is in KB on Linux
+    }
+
+def print_report(res):
+    print("=== Index Benchmark ===")
+    print("  Documents: %s (%.2f MB input, %.2f MB bulk bodies in %s requests)" %
+          (res["num_docs"], res["input_mb"], res["bulk_mb"], res["num_requests"]))
+    print("  Total time: %.3f (seconds)" % res["total_time"])
+    print("  Throughput: %.1f docs/s, %.2f MB/s" % (res["docs_per_second"], res["mb_per_second"]))
+    for stage in ["read", "parse", "build", "serialize", "send"]:
+        t = res["stage_times"][stage]
+        print("  Stage %-9s : %.3f (seconds), %5.1f%%" % (stage, t, 100.0 * t / max(res["total_time"], 1e-9)))
+    print("  Peak RSS: %.1f MB" % res["peak_rss_mb"])
+
+def main(args):
+    corpus_path = args.corpus
+    if not corpus_path:
+        fd, corpus_path = tempfile.mkstemp(prefix="%s_bench_" % args.dataset, suffix=".json")
+        os.close(fd)
+    if args.corpus and os.path.exists(args.corpus):
+        print("=== Reusing corpus %s ===" % corpus_path)
+    else:
+        print("=== Generating %s documents with %s annotations per document ===" % (args.num_docs, args.ana_density))
+        generate_corpus(corpus_path, args.dataset, int(args.num_docs), int(args.ana_density))
+
+    if args.sink == "null":
+        sink = NullSink()
+    elif args.sink == "es":
+        sink = ESSink(args.index)
+    else:
+        print("[ERROR] Unsupported sink: %s" % args.sink)
+        return 1
+
+    try:
+        res = run_benchmark(corpus_path, args.dataset, sink, args.index, bulk_size=int(args.bulk_size),
+                            json_backend=args.json_backend)
+    finally:
+        if not args.corpus:
+            os.remove(corpus_path)
+    print_report(res)
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump(res, fout, indent=2)
+
+if __name__ == "__main__":
+    # Example usage: python3 benchmark_index.py -dataset s2 -num_docs 20000 -ana_density 50 -sink null
+    parser = argparse.ArgumentParser(prog='benchmark_index.py', description='Benchmark index building throughput.')
+    parser.add_argument('-dataset', required=False, default="s2", choices=["s2", "trec"],
+                        help='schema of the synthetic corpus')
+    parser.add_argument('-num_docs', required=False, default=10000, help='number of synthetic documents')
+    parser.add_argument('-ana_density', required=False, default=50, help='mean number of annotations per document')
+    parser.add_argument('-corpus', required=False, default="",
+                        help='path of the corpus, generated if not exists and kept after the benchmark')
+    parser.add_argument('-sink', required=False, default="null", help="'null' (in-process) or 'es' (local ES)")
+    parser.add_argument('-index', required=False, default="bench", help='index name used with the es sink')
+    parser.add_argument('-bulk_size', required=False, default=500, help='number of documents in each bulk request')
+    parser.add_argument('-json_backend', required=False, default="auto", help='JSON parser used for the feed')
+    parser.add_argument('-output', required=False, default="", help='save the measurements as JSON')
+    es_client.add_arguments(parser)
+    args = parser.parse_args()
+    es_client.configure_from_args(args)
+    sys.exit(main(args))
@@ -3,13 +3,23 @@ __author__: Jiaming Shen
 __description__: Create index with static mapping in ES 5.4.0 (a.k.a. define schema).
 '''
 
-from elasticsearch import Elasticsearch
+import argparse
+import es_client
 
 if __name__ == '__main__':
-    INDEX_NAME = "trec"
+    parser = argparse.ArgumentParser(prog='create_index_TREC.py', description='create index for setRank.')
+    parser.add_argument('-index', required=False, default="trec", help='name of the index')
+    parser.add_argument('-shards', required=False, default=1,
+                        help='number of primary shards, keep this as one if no cluster')
+    parser.add_argument('-replicas', required=False, default=0, help='number of replicas of each shard')
+    es_client.add_arguments(parser)
+    args = parser.parse_args()
+    es_client.configure_from_args(args)
+
+    INDEX_NAME = args.index
     TYPE_NAME = "trec_papers"
-    NUMBER_SHARDS = 1 # keep this as one if no cluster
-    NUMBER_REPLICAS = 0
+    NUMBER_SHARDS = int(args.shards) # setRank uses global term statistics if this is larger than one
+    NUMBER_REPLICAS = int(args.replicas)
 
     '''
     following is the defined schema
@@ -75,7 +85,7 @@ if __name__ == '__main__':
         }
     }
 
-    es = Elasticsearch()
+    es = es_client.get_es()
     if es.indices.exists(INDEX_NAME):
         res = es.indices.delete(index = INDEX_NAME)
         print("Deleting index %s , Response: %s" % (INDEX_NAME, res))
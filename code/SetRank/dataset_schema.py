@@ -0,0 +1,89 @@
+'''
+__author__: Jiaming Shen
+__description__: Schema description of each dataset, which drives the shared indexer (see indexer.py).
+
+Each schema lists how the fields of one indexed document are derived from a raw line of the document feed.
+Supported field types:
+    "copy": copy the source value (optionally its first element, or a default for empty values)
+    "text": copy the source text and add a "<name>_length" field with its number of tokens
+    "join": join a list of strings with spaces and add a "<name>_length" field
+    "split": split the source string with a separator into a list of keywords
+    "ana_counts": expand the annotation dict {field: {eid: count}} into whitespace separated entity strings,
+                  one per target field, each with a "<target>_length" field
+    "ana_mentions": collect the entity mentions [{"name": ..., "position": ...}] into whitespace separated
+                    entity strings, one per position, each with a "<target>_length" field
+The length of every "text", "join" and annotation field contributes to the "total_length" field.
+'''
+
+S2_CS = {
+    "name": "s2",
+    "type_name": "s2_papers",
+    "id_field": "docno",
+    "fields": [
+        {"name": "docno", "type": "copy", "source": "docno"},
+        {"name": "venue", "type": "copy", "source": "venue", "first": True}, # can be empty
+        {"name": "numCitedBy", "type": "copy", "source": "numCitedBy"},
+        {"name": "numKeyCitations", "type": "copy", "source": "numKeyCitations"},
+        {"name": "title", "type": "text", "source": "title", "first": True},
+        {"name": "abstract", "type": "text", "source": "paperAbstract", "first": True},
+        {"name": "keyphrase", "type": "join", "source": "keyPhrases"},
+        # e.g., "keyPhrases": {"/m/04rbjc": 1, "/m/0cpvr": 1, "/m/02cjl": 1, "/m/03gj321": 1},
+        {"type": "ana_counts", "source": "ana", "targets": {
+            "title": "title_ana",
+            "paperAbstract": "abstract_ana",
+            "keyPhrases": "keyphrase_ana",
+            "bodyText": "bodytext_ana"
+        }}
+    ],
+    ## (name in stats file, summed length field), saved for later model usage
+    "stats": [
+        ("TITLE_LENGTH_SUM", "title_length"),
+        ("ABSTRACT_LENGTH_SUM", "abstract_length"),
+        ("KEYPHRASE_LENGTH_SUM", "keyphrase_length"),
+        ("TITLE_ANN_LENGTH_SUM", "title_ana_length"),
+        ("ABSTRACT_ANA_LENGTH_SUM", "abstract_ana_length"),
+        ("BODYTEXT_ANA_LENGTH_SUM", "bodytext_ana_length"),
+        ("KEYPHRASES_ANA_LENGTH_SUM", "keyphrase_ana_length"),
+        ("TOTAL_LENGTH_SUM", "total_length")
+    ]
+}
+
+TREC_BIO = {
+    "name": "trec",
+    "type_name": "trec_papers",
+    "id_field": "pmid",
+    "fields": [
+        {"name": "pmid", "type": "copy", "source": "pmid"},
+        {"name": "title", "type": "text", "source": "title"},
+        {"name": "abstract", "type": "text", "source": "abstract"},
+        {"name": "date", "type": "copy", "source": "date"},
+        {"name": "author_list", "type": "split", "source": "author", "sep": ";"},
+        {"name": "journal_name", "type": "copy", "source": "journal"},
+        {"name": "mesh", "type": "copy", "source": "mesh_heading", "default": ""},
+        {"type": "ana_mentions", "source": "entity", "targets": {
+            "title": "title_ana",
+            "abstract": "abstract_ana"
+        }}
+    ],
+    "stats": [
+        ("TITLE_LENGTH_SUM", "title_length"),
+        ("ABSTRACT_LENGTH_SUM", "abstract_length"),
+        ("TITLE_ANA_LENGTH_SUM", "title_ana_length"),
+        ("ABSTRACT_ANA_LENGTH_SUM", "abstract_ana_length"),
+        ("TOTAL_LENGTH_SUM", "total_length")
+    ]
+}
+
+SCHEMAS = {
+    "s2": S2_CS,
+    "trec": TREC_BIO
+}
+
+def ana_fields(schema):
+    ''' Return the names of the entity annotation ("_ana") fields of a dataset schema.
+    '''
+    fields = []
+    for field in schema["fields"]:
+        if field["type"] in ("ana_counts", "ana_mentions"):
+            fields.extend(field["targets"].values())
+    return fields
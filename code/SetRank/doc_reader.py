@@ -0,0 +1,142 @@
+'''
+__author__: Jiaming Shen
+__description__: Read line-delimited JSON document feeds (e.g., s2_doc.json, trec_doc.json).
+    The input can be plain, gzip or zstd compressed, and is parsed with the fastest available JSON backend.
+'''
+import gzip
+import io
+import itertools
+import json
+
+## Optional fast JSON backends, tried in this order when backend="auto"
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+## Optional zstd support, only needed for *.zst feeds
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+READ_HINT = 1 << 20 # number of bytes of lines read from the feed in one go
+
+def get_json_loads(backend="auto"):
+    ''' Return the JSON parsing function of a given backend.
+
+    :param backend: one of "auto", "orjson", "ujson", "json"
+    :return: a function that parses a bytes (or str) object into a python object
+    '''
+    if backend == "auto":
+        for name in ["orjson", "ujson"]:
+            if globals()[name] is not None:
+                return get_json_loads(name)
+        return json.loads
+    elif backend == "orjson":
+        if orjson is None:
+            raise ImportError("JSON backend orjson is not installed")
+        return orjson.loads
+    elif backend == "ujson":
+        if ujson is None:
+            raise ImportError("JSON backend ujson is not installed")
+        return ujson.loads
+    elif backend == "json":
+        return json.loads
+    else:
+        raise ValueError("Unsupported JSON backend: %s" % backend)
+
+def get_json_dumps(backend="auto"):
+    ''' Return the JSON serializing function of a given backend, used to build bulk request bodies.
+
+    :param backend: one of "auto", "orjson", "ujson", "json"
+    :return: a function that serializes a python object into a str
+    '''
+    if backend == "auto":
+        for name in ["orjson", "ujson"]:
+            if globals()[name] is not None:
+                return get_json_dumps(name)
+        return json.dumps
+    elif backend == "orjson":
+        if orjson is None:
+            raise ImportError("JSON backend orjson is not installed")
+        return lambda obj: orjson.dumps(obj).decode("utf-8")
+    elif backend == "ujson":
+        if ujson is None:
+            raise ImportError("JSON backend ujson is not installed")
+        return lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+    elif backend == "json":
+        return json.dumps
+    else:
+        raise ValueError("Unsupported JSON backend: %s" % backend)
+
+def open_feed(path):
+    ''' Open a document feed in binary mode, transparently decompressing gzip and zstd input.
+
+    The compression is detected from the magic bytes of the file, not its extension.
+
+    :param path: path to the feed
+    :return: a binary file object which can be iterated line by line
+    '''
+    with open(path, "rb") as fin:
+        magic = fin.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rb")
+    elif magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ImportError("Reading zstd compressed feed %s requires the zstandard package" % path)
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.BufferedReader(reader, buffer_size=READ_HINT)
+    else:
+        return open(path, "rb")
+
+def read_line_batches(path, batch_size=500):
+    ''' Read a document feed in batches of non-blank lines, the unparsed documents of read_doc_batches().
+
+    :param path: path to the feed, one JSON document per line
+    :param batch_size: maximum number of lines read for each batch
+    :return: a generator of line lists, which may be empty if all lines read are blank
+    '''
+    with open_feed(path) as fin:
+        while True:
+            lines = list(itertools.islice(fin, batch_size))
+            if not lines:
+                break
+            yield [line for line in lines if line.strip()]
+
+def read_doc_batches(path, batch_size=500, backend="auto"):
+    ''' Read a document feed in batches of parsed documents.
+
+    :param path: path to the feed, one JSON document per line
+    :param batch_size: maximum number of documents in each batch
+    :param backend: JSON backend, see get_json_loads()
+    :return: a generator of document lists
+    '''
+    loads = get_json_loads(backend)
+    for lines in read_line_batches(path, batch_size):
+        yield [loads(line) for line in lines]
+
+def read_docs(path, backend="auto"):
+    ''' Read a document feed one parsed document at a time.
+
+    :param path: path to the feed, one JSON document per line
+    :param backend: JSON backend, see get_json_loads()
+    :return: a generator of documents
+    '''
+    loads = get_json_loads(backend)
+    with open_feed(path) as fin:
+        while True:
+            lines = fin.readlines(READ_HINT)
+            if not lines:
+                break
+            for line in lines:
+                if line.strip():
+                    yield loads(line)
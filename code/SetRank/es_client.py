@@ -0,0 +1,117 @@
+'''
+__author__: Jiaming Shen
+__description__: The Elasticsearch client shared by all scripts that search or index.
+  The client (and the elasticsearch package) is only loaded on first use, so importing the scripts has no side effects.
+  Hosts are given by configure(), e.g., from the -es_hosts argument, or by the ES_HOSTS environment variable
+  (comma separated, e.g., "localhost:9200,otherhost:9200"), and default to localhost:9200.
+  The transport options (connection pool size, request compression, sniffing and retries) are set by configure(),
+  and by the -es_* arguments of add_arguments().
+'''
+import gzip
+import os
+
+COMPRESS_MIN_BYTES = 1024 # Request bodies smaller than this are not worth compressing
+SNIFFER_TIMEOUT = 60 # Seconds between two sniffs of the cluster nodes when sniffing is enabled
+
+_es = None # the client, created by get_es()
+_hosts = None # hosts set by configure(), None to use ES_HOSTS or the default
+_options = {} # transport options set by configure()
+
+
+def parse_hosts(s):
+  ''' Parse a comma separated list of hosts, None for an empty string. '''
+  hosts = [host.strip() for host in s.split(",") if host.strip()]
+  return hosts if hosts else None
+
+def configure(hosts=None, maxsize=None, compress=False, sniff=False, retry_on_timeout=False, max_retries=3):
+  ''' Set the hosts and transport options of the client, which is (re-)created on its next use.
+
+  :param hosts: a list of hosts or a comma separated string of hosts, None for ES_HOSTS or the default
+  :param maxsize: number of connections kept open to each host, which should be at least the number of concurrent
+                  requests; None for the default of 10
+  :param compress: gzip the bodies of large requests, such as bulk and msearch requests
+  :param sniff: discover the nodes of the cluster on start, on connection failures and every SNIFFER_TIMEOUT seconds
+  :param retry_on_timeout: retry requests that time out on another connection, up to max_retries times
+  '''
+  global _es, _hosts, _options
+  if isinstance(hosts, str):
+    hosts = parse_hosts(hosts)
+  _hosts = hosts
+  _options = {"maxsize": maxsize, "compress": compress, "sniff": sniff, "retry_on_timeout": retry_on_timeout,
+              "max_retries": max_retries}
+  _es = None
+
+def add_arguments(parser):
+  ''' Add the -es_* arguments of configure_from_args() to an argparse parser. '''
+  parser.add_argument('-es_hosts', required=False, default="",
+                      help="comma separated Elasticsearch hosts, defaults to $ES_HOSTS or localhost:9200")
+  parser.add_argument('-es_maxsize', required=False, default=0,
+                      help="number of connections kept open to each Elasticsearch host, 0 for the default")
+  parser.add_argument('-es_compress', required=False, action='store_true',
+                      help="gzip large request bodies sent to Elasticsearch")
+  parser.add_argument('-es_sniff', required=False, action='store_true',
+                      help="discover and use all nodes of the Elasticsearch cluster")
+  parser.add_argument('-es_retry_on_timeout', required=False, action='store_true',
+                      help="retry Elasticsearch requests that time out")
+  parser.add_argument('-es_max_retries', required=False, default=3,
+                      help="maximum number of retries of a failed Elasticsearch request")
+
+def configure_from_args(args, concurrency=None):
+  ''' Configure the client with the arguments of add_arguments().
+
+  :param concurrency: number of concurrent requests of the script, used as the pool size unless -es_maxsize is given
+  '''
+  maxsize = int(args.es_maxsize) if int(args.es_maxsize) > 0 else concurrency
+  configure(args.es_hosts, maxsize=maxsize, compress=args.es_compress, sniff=args.es_sniff,
+            retry_on_timeout=args.es_retry_on_timeout, max_retries=int(args.es_max_retries))
+
+def hosts():
+  if _hosts is not None:
+    return _hosts
+  return parse_hosts(os.environ.get("ES_HOSTS", ""))
+
+class _GzipPool(object):
+  ''' Wraps the urllib3 connection pool of a connection, and compresses the request bodies it sends. '''
+  def __init__(self, pool):
+    self.pool = pool
+
+  def urlopen(self, method, url, body=None, headers=None, **kwargs):
+    if body is not None and len(body) >= COMPRESS_MIN_BYTES:
+      body = gzip.compress(body, compresslevel=1)
+      headers = dict(headers)
+      headers["content-encoding"] = "gzip"
+    return self.pool.urlopen(method, url, body, headers=headers, **kwargs)
+
+  def __getattr__(self, name):
+    return getattr(self.pool, name)
+
+def _connection_class():
+  from elasticsearch import Urllib3HttpConnection
+
+  class GzipHttpConnection(Urllib3HttpConnection):
+    ''' A connection which sends large request bodies gzip compressed and accepts compressed responses. '''
+    def __init__(self, *args, **kwargs):
+      super(GzipHttpConnection, self).__init__(*args, **kwargs)
+      self.headers["accept-encoding"] = "gzip"
+      self.pool = _GzipPool(self.pool)
+
+  return GzipHttpConnection
+
+def get_es():
+  ''' Return the shared Elasticsearch client, created on first use. '''
+  global _es
+  if _es is None:
+    from elasticsearch import Elasticsearch
+    kwargs = {}
+    if _options.get("maxsize"):
+      kwargs["maxsize"] = _options["maxsize"]
+    if _options.get("compress"):
+      kwargs["connection_class"] = _connection_class()
+    if _options.get("sniff"):
+      kwargs.update(sniff_on_start=True, sniff_on_connection_fail=True, sniffer_timeout=SNIFFER_TIMEOUT)
+    if _options.get("retry_on_timeout"):
+      kwargs["retry_on_timeout"] = True
+    if "max_retries" in _options:
+      kwargs["max_retries"] = _options["max_retries"]
+    _es = Elasticsearch(hosts(), **kwargs)
+  return _es
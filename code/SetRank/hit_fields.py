@@ -0,0 +1,27 @@
+'''
+__author__: Jiaming Shen
+__description__: Request only the document id of search hits, instead of their _source.
+  The _source of a document includes its "_ana" fields, which can be megabytes per S2 document, while the scripts only
+  read the id field. Ids are keyword fields, so they are read from their doc values, and the _source is neither loaded
+  nor returned. Optionally, the hits carry the explanation of their score.
+'''
+import json
+
+
+def id_only(search_body, id_field, explain=False):
+  ''' Make a search body return only the id of each hit, and the explanation of its score if explain is True. '''
+  search_body["_source"] = False
+  search_body["docvalue_fields"] = [id_field]
+  if explain:
+    search_body["explain"] = True
+  return search_body
+
+def hit_id(hit, id_field):
+  ''' The id of a hit of a search body passed through id_only(). '''
+  return hit["fields"][id_field][0]
+
+def write_explanations(fout, query_id, hits, id_field):
+  ''' Write the explanations of the scores of hits as JSON lines, e.g., to the ".explain" file of a run. '''
+  for rank, hit in enumerate(hits, start=1):
+    fout.write(json.dumps({"qid": query_id, "docno": hit_id(hit, id_field), "rank": rank, "score": hit["_score"],
+                           "explanation": hit.get("_explanation")}) + "\n")
@@ -0,0 +1,133 @@
+'''
+__author__: Jiaming Shen
+__description__: Index settings for bulk loads. Refresh is disabled and replicas are dropped during the bulk ingest,
+    and restored afterwards. The loaded index can then be force-merged and the term dictionaries of the entity
+    annotation fields (the "_ana" fields used in the rescore script) warmed up.
+'''
+import argparse
+import json
+import sys
+import time
+
+import dataset_schema
+import es_client
+
+BULK_SETTINGS = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0
+}
+
+def prepare_bulk_load(es, index_names):
+    ''' Disable refresh and replicas on each index before the bulk ingest.
+
+    :param es: Elasticsearch client
+    :param index_names: a list of index names
+    :return: a dict of the original settings of each index, to be passed to finish_bulk_load()
+    '''
+    saved_settings = {}
+    for index_name in index_names:
+        res = es.indices.get_settings(index=index_name)
+        index_settings = res[index_name]["settings"]["index"]
+        ## None resets a setting which was not explicitly set to its default value
+        saved_settings[index_name] = {key: index_settings.get(key) for key in BULK_SETTINGS}
+        es.indices.put_settings(index=index_name, body={"index": BULK_SETTINGS})
+        print("Prepare index %s for bulk load, original settings: %s" % (index_name, saved_settings[index_name]))
+    return saved_settings
+
+def finish_bulk_load(es, saved_settings, max_num_segments=0, request_timeout=3600):
+    ''' Restore the original settings after the bulk ingest, refresh and optionally force-merge each index.
+
+    :param saved_settings: return value of prepare_bulk_load()
+    :param max_num_segments: force-merge each index to this number of segments, 0 to skip merging
+    '''
+    for index_name, settings in saved_settings.items():
+        es.indices.put_settings(index=index_name, body={"index": settings})
+        es.indices.refresh(index=index_name)
+        print("Restore settings of index %s: %s" % (index_name, settings))
+        if max_num_segments > 0:
+            start = time.time()
+            es.indices.forcemerge(index=index_name, max_num_segments=max_num_segments,
+                                  request_timeout=request_timeout)
+            print("Force-merge index %s to %s segments using %s seconds" %
+                  (index_name, max_num_segments, time.time() - start))
+
+def load_query_entities(query_path):
+    ''' Load the entity string of each query, e.g., "/m/024hw2 /m/0b6xt".
+    '''
+    entity_strings = []
+    with open(query_path, "r") as fin:
+        for line in fin:
+            if line.strip():
+                queryInfo = json.loads(line)
+                entity_strings.append(" ".join(queryInfo["ana"].keys()))
+    return entity_strings
+
+def warm_up(es, index_name, schema, entity_strings, request_timeout=180):
+    ''' Load the term dictionaries of the "_ana" fields and the field length doc values into the caches.
+
+    Each query entity string is matched against every "_ana" field, which touches the same terms as the
+    _index[field][eid] lookups of the rescore script, and the length fields are summed once.
+
+    :param schema: a dataset schema, see dataset_schema.py
+    :param entity_strings: a list of query entity strings
+    '''
+    ana_fields = dataset_schema.ana_fields(schema)
+    start = time.time()
+    bulk = []
+    for entity_string in entity_strings:
+        search_body = {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "should": [{"match": {field: entity_string}} for field in ana_fields]
+                }
+            }
+        }
+        bulk.append({"index": index_name})
+        bulk.append(search_body)
+    if bulk:
+        es.msearch(body=bulk, request_timeout=request_timeout)
+
+    length_fields = [field + "_length" for field in ana_fields]
+    search_body = {
+        "size": 0,
+        "aggs": {field: {"sum": {"field": field}} for field in length_fields}
+    }
+    es.search(index=index_name, body=search_body, request_timeout=request_timeout)
+    print("Warm up index %s with %s queries using %s seconds" % (index_name, len(entity_strings), time.time() - start))
+
+def main(args):
+    es = es_client.get_es()
+    index_names = args.index.split(",")
+    if args.action == "prepare":
+        saved_settings = prepare_bulk_load(es, index_names)
+        with open(args.settings, "w") as fout:
+            json.dump(saved_settings, fout)
+    elif args.action == "finish":
+        with open(args.settings, "r") as fin:
+            saved_settings = json.load(fin)
+        finish_bulk_load(es, saved_settings, max_num_segments=int(args.max_num_segments))
+    elif args.action == "warmup":
+        entity_strings = load_query_entities(args.query)
+        for index_name in index_names:
+            warm_up(es, index_name, dataset_schema.SCHEMAS[args.dataset], entity_strings)
+    else:
+        print("[ERROR] Unsupported action: %s" % args.action)
+        return 1
+
+if __name__ == '__main__':
+    # Example usage: python3 index_lifecycle.py -action warmup -index s2 -dataset s2 -query ../../data/S2-CS/s2_query.json
+    parser = argparse.ArgumentParser(prog='index_lifecycle.py', description='Tune index settings around bulk loads.')
+    parser.add_argument('-action', required=True, help="one of 'prepare', 'finish', 'warmup'")
+    parser.add_argument('-index', required=True, help='index name, or a comma separated list of index names')
+    parser.add_argument('-settings', required=False, default="./saved_settings.json",
+                        help='file to save (prepare) or load (finish) the original index settings')
+    parser.add_argument('-max_num_segments', required=False, default=0,
+                        help='force-merge to this number of segments after the load, 0 to skip')
+    parser.add_argument('-dataset', required=False, default="s2", help="'s2' or 'trec', used by warmup")
+    parser.add_argument('-query', required=False, default="../../data/S2-CS/s2_query.json",
+                        help='query file whose entities are used by warmup')
+    es_client.add_arguments(parser)
+    args = parser.parse_args()
+    es_client.configure_from_args(args)
+    sys.exit(main(args))
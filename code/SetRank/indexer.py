@@ -0,0 +1,151 @@
+'''
+__author__: Jiaming Shen
+__description__: Schema-driven indexing engine shared by the setRank and baseline index_data scripts.
+    One pass over the document feed can write to several target indices, e.g., one per similarity module.
+'''
+import time
+
+import doc_reader
+
+def _length(text):
+    return len(text.split())
+
+def build_doc(paperInfo, schema):
+    ''' Build the document to be indexed from one parsed line of the feed.
+
+    :param paperInfo: a dict of the raw document
+    :param schema: a dataset schema, see dataset_schema.py
+    :return: a dict of indexed fields, including the length fields used in the rescore script
+    '''
+    data_dict = {}
+    total_length = 0
+    for field in schema["fields"]:
+        field_type = field["type"]
+        if field_type == "copy":
+            value = paperInfo[field["source"]]
+            if field.get("first"):
+                value = value[0]
+            if "default" in field and not value:
+                value = field["default"]
+            data_dict[field["name"]] = value
+        elif field_type == "text":
+            value = paperInfo[field["source"]]
+            if field.get("first"):
+                value = value[0]
+            data_dict[field["name"]] = value
+            data_dict[field["name"] + "_length"] = _length(value)
+            total_length += data_dict[field["name"] + "_length"]
+        elif field_type == "join":
+            value = " ".join(paperInfo.get(field["source"], []))
+            data_dict[field["name"]] = value
+            data_dict[field["name"] + "_length"] = _length(value)
+            total_length += data_dict[field["name"] + "_length"]
+        elif field_type == "split":
+            value = paperInfo[field["source"]]
+            data_dict[field["name"]] = value.split(field["sep"]) if value else []
+        elif field_type == "ana_counts":
+            annotations = paperInfo[field["source"]]
+            for ann_field in annotations:
+                ann_length = 0
+                ann_list = []
+                for k, v in annotations[ann_field].items():
+                    ann_length += v
+                    ann_list.extend([k] * v)
+                if ann_field in field["targets"]:
+                    target = field["targets"][ann_field]
+                    data_dict[target] = " ".join(ann_list)
+                    data_dict[target + "_length"] = ann_length
+                else:
+                    print("[ERROR] Wrong annotation field: %s" % ann_field)
+                total_length += ann_length
+            ## append zero for those papers without certain annotation fields
+            for target in field["targets"].values():
+                if target not in data_dict:
+                    data_dict[target] = ""
+                    data_dict[target + "_length"] = 0
+        elif field_type == "ana_mentions":
+            mentions = {target: [] for target in field["targets"].values()}
+            for ele in paperInfo[field["source"]]:
+                target = field["targets"].get(ele["position"])
+                if target is None:
+                    continue
+                mentions[target].append("_".join(ele["name"].split()).lower()) # use "_" to connect multi-tokens entity mention
+            for target, ann_list in mentions.items():
+                data_dict[target] = " ".join(ann_list)
+                data_dict[target + "_length"] = len(ann_list)
+                total_length += len(ann_list)
+        else:
+            raise ValueError("Unsupported field type: %s" % field_type)
+    data_dict["total_length"] = total_length
+    return data_dict
+
+def bulk_body(data_dicts, schema, targets, dumps):
+    ''' Serialize the documents into one bulk request body which indexes each of them into every target.
+
+    Each document is serialized only once, no matter how many targets it is written to.
+
+    :param targets: a list of (index name, type name)
+    :param dumps: JSON serializing function, see doc_reader.get_json_dumps()
+    :return: a newline delimited str
+    '''
+    id_field = schema["id_field"]
+    lines = []
+    for data_dict in data_dicts:
+        source = dumps(data_dict)
+        for index_name, type_name in targets:
+            op_dict = {
+                "index": {
+                    "_index": index_name,
+                    "_type": type_name,
+                    "_id": data_dict[id_field]
+                }
+            }
+            lines.append(dumps(op_dict))
+            lines.append(source)
+    return "\n".join(lines) + "\n"
+
+def index_corpus(es, input_path, schema, targets, log_path, bulk_size=500, json_backend="auto", request_timeout=180):
+    ''' Index the document feed into all the target indices in a single pass.
+
+    :param es: Elasticsearch client
+    :param input_path: path to the document feed
+    :param schema: a dataset schema, see dataset_schema.py
+    :param targets: a list of (index name, type name)
+    :param log_path: path to save the indexing log
+    :param bulk_size: number of index operations in each bulk request, i.e., documents times targets, such that
+                    writing to more targets does not grow the requests
+    :return: (number of documents, a dict of summed length fields)
+    '''
+    dumps = doc_reader.get_json_dumps(json_backend)
+    length_sums = {length_field: 0 for _, length_field in schema["stats"]}
+
+    with open(log_path, "w") as fout:
+        start = time.time()
+        cnt = 0
+        docs_per_bulk = max(1, bulk_size // len(targets))
+        for paperInfos in doc_reader.read_doc_batches(input_path, batch_size=docs_per_bulk, backend=json_backend):
+            data_dicts = [build_doc(paperInfo, schema) for paperInfo in paperInfos]
+            for data_dict in data_dicts:
+                for length_field in length_sums:
+                    length_sums[length_field] += data_dict[length_field]
+            cnt += len(data_dicts)
+
+            if data_dicts:
+                tmp = time.time()
+                es.bulk(body=bulk_body(data_dicts, schema, targets, dumps), request_timeout=request_timeout)
+                fout.write("bulk indexing... %s, escaped time %s (seconds) \n" % (cnt, tmp - start))
+                print("bulk indexing... %s, escaped time %s (seconds) " % (cnt, tmp - start))
+
+        end = time.time()
+        fout.write("Finish indexing. Total escaped time %s (seconds) \n" % (end - start))
+        print("Finish indexing. Total escaped time %s (seconds) " % (end - start))
+
+    return cnt, length_sums
+
+def save_stats(stat_path, schema, cnt, length_sums):
+    ''' Save the number of documents and the summed field lengths, used as model constants in setRank.
+    '''
+    with open(stat_path, "w") as fout:
+        fout.write("NUM_PAPER = %s\n" % cnt)
+        for stat_name, length_field in schema["stats"]:
+            fout.write("%s = %s\n" % (stat_name, length_sums[length_field]))
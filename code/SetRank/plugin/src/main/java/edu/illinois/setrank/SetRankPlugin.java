@@ -0,0 +1,16 @@
+package edu.illinois.setrank;
+
+import org.elasticsearch.common.settings.Settings;
+import org.elasticsearch.plugins.Plugin;
+import org.elasticsearch.plugins.ScriptPlugin;
+import org.elasticsearch.script.ScriptEngineService;
+
+/**
+ * Registers the native SetRank scoring function as the script language "setrank".
+ */
+public class SetRankPlugin extends Plugin implements ScriptPlugin {
+    @Override
+    public ScriptEngineService getScriptEngineService(Settings settings) {
+        return new SetRankScriptEngine();
+    }
+}
@@ -0,0 +1,58 @@
+package edu.illinois.setrank;
+
+import org.apache.lucene.index.LeafReaderContext;
+import org.elasticsearch.common.Nullable;
+import org.elasticsearch.script.LeafSearchScript;
+import org.elasticsearch.script.SearchScript;
+
+import java.io.IOException;
+import java.io.UncheckedIOException;
+import java.util.Map;
+
+/**
+ * The SetRank score of the documents of one shard for one query: the entity space score weighted by entity_lambda
+ * plus the word space score weighted by 1 - entity_lambda.
+ */
+public class SetRankScript implements SearchScript {
+    private final TermSpace entities;
+    private final TermSpace words;
+    private final double entityLambda;
+
+    public SetRankScript(@Nullable Map<String, Object> params) {
+        if (params == null) {
+            throw new IllegalArgumentException("the [" + SetRankScriptEngine.NAME + "] script requires params");
+        }
+        entities = TermSpace.parse(params, "entities", "entity");
+        words = TermSpace.parse(params, "words", "word");
+        entityLambda = TermSpace.getDouble(params, "entity_lambda");
+    }
+
+    @Override
+    public LeafSearchScript getLeafSearchScript(LeafReaderContext context) throws IOException {
+        final TermSpace.Leaf entityLeaf = entities.leaf(context);
+        final TermSpace.Leaf wordLeaf = words.leaf(context);
+        return new LeafSearchScript() {
+            private int doc = -1;
+
+            @Override
+            public void setDocument(int doc) {
+                this.doc = doc;
+            }
+
+            @Override
+            public double runAsDouble() {
+                try {
+                    double totalScore = entityLeaf.score(doc, entityLambda, 0.0);
+                    return wordLeaf.score(doc, 1.0 - entityLambda, totalScore);
+                } catch (IOException e) {
+                    throw new UncheckedIOException(e);
+                }
+            }
+        };
+    }
+
+    @Override
+    public boolean needsScores() {
+        return false;
+    }
+}
@@ -0,0 +1,60 @@
+package edu.illinois.setrank;
+
+import org.elasticsearch.common.Nullable;
+import org.elasticsearch.script.CompiledScript;
+import org.elasticsearch.script.ExecutableScript;
+import org.elasticsearch.script.ScriptEngineService;
+import org.elasticsearch.script.SearchScript;
+import org.elasticsearch.search.lookup.SearchLookup;
+
+import java.util.Map;
+
+/**
+ * Script engine with a single script, "setrank", which computes the same score as the Groovy rescore script of
+ * setRank_ESR.py and setRank_TREC.py from the same params:
+ *
+ * <pre>
+ * "script": {"lang": "setrank", "inline": "setrank", "params": {"entities": [...], "words": [...], ...}}
+ * </pre>
+ */
+public class SetRankScriptEngine implements ScriptEngineService {
+    public static final String NAME = "setrank";
+
+    @Override
+    public String getType() {
+        return NAME;
+    }
+
+    @Override
+    public String getExtension() {
+        return NAME;
+    }
+
+    @Override
+    public Object compile(String scriptName, String scriptSource, Map<String, String> params) {
+        if (NAME.equals(scriptSource) == false) {
+            throw new IllegalArgumentException("unknown script [" + scriptSource + "] of lang [" + NAME + "], the only script is ["
+                + NAME + "]");
+        }
+        return NAME;
+    }
+
+    @Override
+    public ExecutableScript executable(CompiledScript compiledScript, @Nullable Map<String, Object> vars) {
+        throw new UnsupportedOperationException("the [" + NAME + "] script can only score documents");
+    }
+
+    @Override
+    public SearchScript search(CompiledScript compiledScript, SearchLookup lookup, @Nullable Map<String, Object> vars) {
+        return new SetRankScript(vars);
+    }
+
+    @Override
+    public boolean isInlineScriptEnabled() {
+        return true;
+    }
+
+    @Override
+    public void close() {
+    }
+}
@@ -0,0 +1,263 @@
+package edu.illinois.setrank;
+
+import org.apache.lucene.index.DocValues;
+import org.apache.lucene.index.IndexReader;
+import org.apache.lucene.index.LeafReader;
+import org.apache.lucene.index.LeafReaderContext;
+import org.apache.lucene.index.PostingsEnum;
+import org.apache.lucene.index.ReaderUtil;
+import org.apache.lucene.index.SortedNumericDocValues;
+import org.apache.lucene.index.Term;
+
+import java.io.IOException;
+import java.util.Arrays;
+import java.util.List;
+import java.util.Map;
+
+/**
+ * The query terms of one space, entities or words, and the fields they are matched in, read from the params of the
+ * script with the names of the Groovy script, e.g., "words", "word_query_counts", "word_interactions", "word_fields",
+ * "word_field_relative_weights", "word_field_mus", "word_field_length_sums", "consider_word_set" and
+ * "word_field_ttfs" for the word space.
+ */
+public class TermSpace {
+    final String[] terms;
+    final double[] queryCounts;
+    final double[][] interactions;
+    final String[] fields;
+    final double[] fieldWeights;
+    final double[] fieldMus;
+    final double[] fieldLengthSums;
+    final boolean considerSet;
+    /** total term frequencies indexed by [term][field], given by the params or else those of the shard */
+    private double[][] ttfs;
+
+    TermSpace(String[] terms, double[] queryCounts, double[][] interactions, String[] fields, double[] fieldWeights,
+              double[] fieldMus, double[] fieldLengthSums, boolean considerSet, double[][] ttfs) {
+        this.terms = terms;
+        this.queryCounts = queryCounts;
+        this.interactions = interactions;
+        this.fields = fields;
+        this.fieldWeights = fieldWeights;
+        this.fieldMus = fieldMus;
+        this.fieldLengthSums = fieldLengthSums;
+        this.considerSet = considerSet;
+        this.ttfs = ttfs;
+        checkLength(queryCounts.length, terms.length, "query_counts");
+        checkLength(interactions.length, terms.length, "interactions");
+        for (double[] row : interactions) {
+            checkLength(row.length, terms.length, "interactions");
+        }
+        checkLength(fieldWeights.length, fields.length, "field_relative_weights");
+        checkLength(fieldMus.length, fields.length, "field_mus");
+        checkLength(fieldLengthSums.length, fields.length, "field_length_sums");
+        if (ttfs != null) {
+            checkLength(ttfs.length, terms.length, "field_ttfs");
+            for (double[] row : ttfs) {
+                checkLength(row.length, fields.length, "field_ttfs");
+            }
+        }
+    }
+
+    /**
+     * Read a space from the params of the script.
+     *
+     * @param termsName name of the list of terms, "entities" or "words"
+     * @param prefix prefix of the other params, "entity" or "word"
+     */
+    static TermSpace parse(Map<String, Object> params, String termsName, String prefix) {
+        String ttfsName = prefix + "_field_ttfs";
+        List<?> ttfs = params.containsKey(ttfsName) ? toList(params.get(ttfsName), ttfsName) : null;
+        return new TermSpace(
+            toStrings(get(params, termsName), termsName),
+            toDoubles(get(params, prefix + "_query_counts"), prefix + "_query_counts"),
+            toDoubleMatrix(get(params, prefix + "_interactions"), prefix + "_interactions"),
+            toStrings(get(params, prefix + "_fields"), prefix + "_fields"),
+            toDoubles(get(params, prefix + "_field_relative_weights"), prefix + "_field_relative_weights"),
+            toDoubles(get(params, prefix + "_field_mus"), prefix + "_field_mus"),
+            toDoubles(get(params, prefix + "_field_length_sums"), prefix + "_field_length_sums"),
+            getDouble(params, "consider_" + prefix + "_set") > 0,
+            // an empty list, like a missing one, selects the ttfs of the shard
+            ttfs == null || ttfs.isEmpty() ? null : toDoubleMatrix(ttfs, ttfsName));
+    }
+
+    /**
+     * The score of this space, added to totalScore term by term as in the Groovy script.
+     *
+     * @param tfs term frequencies of the document indexed by [term][field]
+     * @param fieldLengths lengths of the fields of the document
+     * @param spaceWeight weight of this space, entity_lambda or 1 - entity_lambda
+     */
+    double score(long[][] tfs, long[] fieldLengths, double spaceWeight, double totalScore) {
+        double[] baseScores = new double[terms.length];
+        boolean[] exists = new boolean[terms.length];
+        for (int i = 0; i < terms.length; ++i) {
+            double score = 0.0;
+            for (int k = 0; k < fields.length; ++k) {
+                long tf = tfs[i][k];
+                if (tf > 0) {
+                    exists[i] = true;
+                }
+                score = score + fieldWeights[k] * (tf + fieldMus[k] * (ttfs[i][k] / fieldLengthSums[k])) / (fieldLengths[k] + fieldMus[k]);
+            }
+            baseScores[i] = Math.pow(score, 0.5); // smoothing
+        }
+
+        for (int i = 0; i < terms.length; ++i) {
+            double weight = queryCounts[i];
+            if (considerSet) {
+                for (int j = 0; j < terms.length; ++j) {
+                    if (exists[j]) {
+                        weight = weight + interactions[i][j] * baseScores[j] * queryCounts[j];
+                    }
+                }
+            }
+            totalScore = totalScore + spaceWeight * weight * baseScores[i];
+        }
+        return totalScore;
+    }
+
+    /**
+     * Open the postings of the terms and the field lengths of one segment, and read the ttfs of the shard unless the
+     * params give them.
+     */
+    Leaf leaf(LeafReaderContext context) throws IOException {
+        if (ttfs == null) {
+            IndexReader shardReader = ReaderUtil.getTopLevelContext(context).reader();
+            double[][] shardTtfs = new double[terms.length][fields.length];
+            for (int i = 0; i < terms.length; ++i) {
+                for (int k = 0; k < fields.length; ++k) {
+                    shardTtfs[i][k] = shardReader.totalTermFreq(new Term(fields[k], terms[i]));
+                }
+            }
+            ttfs = shardTtfs;
+        }
+        return new Leaf(context.reader());
+    }
+
+    /**
+     * Scores the documents of one segment, which are usually visited in increasing order, such that each posting list
+     * is only advanced forward and read once. A posting list is reopened only if a document is visited after a greater
+     * one.
+     */
+    class Leaf {
+        private final LeafReader reader;
+        private final PostingsEnum[][] postings;
+        /** the last document whose tf was read from each posting list, indexed by [term][field] */
+        private final int[][] targets;
+        private final SortedNumericDocValues[] lengths;
+        /** term frequencies of the last scored document, indexed by [term][field] */
+        final long[][] tfs;
+        private final long[] fieldLengths;
+        /** number of posting lists reopened for documents visited out of order */
+        int numReopened;
+
+        Leaf(LeafReader reader) throws IOException {
+            this.reader = reader;
+            postings = new PostingsEnum[terms.length][fields.length];
+            targets = new int[terms.length][fields.length];
+            for (int i = 0; i < terms.length; ++i) {
+                Arrays.fill(targets[i], -1);
+                for (int k = 0; k < fields.length; ++k) {
+                    postings[i][k] = reader.postings(new Term(fields[k], terms[i]), PostingsEnum.FREQS);
+                }
+            }
+            lengths = new SortedNumericDocValues[fields.length];
+            for (int k = 0; k < fields.length; ++k) {
+                lengths[k] = DocValues.getSortedNumeric(reader, fields[k] + "_length");
+            }
+            tfs = new long[terms.length][fields.length];
+            fieldLengths = new long[fields.length];
+        }
+
+        double score(int doc, double spaceWeight, double totalScore) throws IOException {
+            for (int k = 0; k < fields.length; ++k) {
+                lengths[k].setDocument(doc);
+                fieldLengths[k] = lengths[k].count() > 0 ? lengths[k].valueAt(0) : 0; // a missing length is 0, as doc[field].value
+            }
+            for (int i = 0; i < terms.length; ++i) {
+                for (int k = 0; k < fields.length; ++k) {
+                    tfs[i][k] = freq(i, k, doc);
+                }
+            }
+            return TermSpace.this.score(tfs, fieldLengths, spaceWeight, totalScore);
+        }
+
+        private int freq(int i, int k, int doc) throws IOException {
+            PostingsEnum termPostings = postings[i][k];
+            if (termPostings == null) {
+                return 0;
+            }
+            // the posting list may be past doc after advancing to an earlier document which lacks the term, so only a
+            // document before the last one starts over
+            if (doc < targets[i][k]) {
+                termPostings = postings[i][k] = reader.postings(new Term(fields[k], terms[i]), PostingsEnum.FREQS);
+                ++numReopened;
+            }
+            targets[i][k] = doc;
+            if (termPostings.docID() < doc) {
+                termPostings.advance(doc);
+            }
+            return termPostings.docID() == doc ? termPostings.freq() : 0;
+        }
+    }
+
+    static Object get(Map<String, Object> params, String name) {
+        Object value = params.get(name);
+        if (value == null) {
+            throw new IllegalArgumentException("missing param [" + name + "] of the [" + SetRankScriptEngine.NAME + "] script");
+        }
+        return value;
+    }
+
+    static double getDouble(Map<String, Object> params, String name) {
+        return toDouble(get(params, name), name);
+    }
+
+    private static double toDouble(Object value, String name) {
+        if (value instanceof Number == false) {
+            throw new IllegalArgumentException("param [" + name + "] must be a number, got [" + value + "]");
+        }
+        return ((Number) value).doubleValue();
+    }
+
+    private static List<?> toList(Object value, String name) {
+        if (value instanceof List == false) {
+            throw new IllegalArgumentException("param [" + name + "] must be a list, got [" + value + "]");
+        }
+        return (List<?>) value;
+    }
+
+    private static String[] toStrings(Object value, String name) {
+        List<?> list = toList(value, name);
+        String[] strings = new String[list.size()];
+        for (int i = 0; i < strings.length; ++i) {
+            strings[i] = String.valueOf(list.get(i));
+        }
+        return strings;
+    }
+
+    private static double[] toDoubles(Object value, String name) {
+        List<?> list = toList(value, name);
+        double[] doubles = new double[list.size()];
+        for (int i = 0; i < doubles.length; ++i) {
+            doubles[i] = toDouble(list.get(i), name);
+        }
+        return doubles;
+    }
+
+    private static double[][] toDoubleMatrix(Object value, String name) {
+        List<?> list = toList(value, name);
+        double[][] matrix = new double[list.size()][];
+        for (int i = 0; i < matrix.length; ++i) {
+            matrix[i] = toDoubles(list.get(i), name);
+        }
+        return matrix;
+    }
+
+    private static void checkLength(int length, int expected, String name) {
+        if (length != expected) {
+            throw new IllegalArgumentException("param [" + name + "] has " + length + " entries instead of " + expected);
+        }
+    }
+}
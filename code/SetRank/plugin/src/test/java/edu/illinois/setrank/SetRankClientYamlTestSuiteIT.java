@@ -0,0 +1,20 @@
+package edu.illinois.setrank;
+
+import com.carrotsearch.randomizedtesting.annotations.Name;
+import com.carrotsearch.randomizedtesting.annotations.ParametersFactory;
+import org.elasticsearch.test.rest.yaml.ClientYamlTestCandidate;
+import org.elasticsearch.test.rest.yaml.ESClientYamlSuiteTestCase;
+
+/**
+ * Runs the REST tests of src/test/resources/rest-api-spec/test against a single-node cluster with the plugin.
+ */
+public class SetRankClientYamlTestSuiteIT extends ESClientYamlSuiteTestCase {
+    public SetRankClientYamlTestSuiteIT(@Name("yaml") ClientYamlTestCandidate testCandidate) {
+        super(testCandidate);
+    }
+
+    @ParametersFactory
+    public static Iterable<Object[]> parameters() throws Exception {
+        return ESClientYamlSuiteTestCase.createParameters();
+    }
+}
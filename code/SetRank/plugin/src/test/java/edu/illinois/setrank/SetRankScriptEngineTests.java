@@ -0,0 +1,15 @@
+package edu.illinois.setrank;
+
+import org.elasticsearch.test.ESTestCase;
+
+public class SetRankScriptEngineTests extends ESTestCase {
+    public void testCompile() {
+        SetRankScriptEngine engine = new SetRankScriptEngine();
+        assertEquals(SetRankScriptEngine.NAME, engine.compile(null, "setrank", null));
+        expectThrows(IllegalArgumentException.class, () -> engine.compile(null, "return _score;", null));
+    }
+
+    public void testMissingParams() {
+        expectThrows(IllegalArgumentException.class, () -> new SetRankScript(null));
+    }
+}
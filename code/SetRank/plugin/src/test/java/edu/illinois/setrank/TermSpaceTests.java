@@ -0,0 +1,158 @@
+package edu.illinois.setrank;
+
+import org.apache.lucene.analysis.MockAnalyzer;
+import org.apache.lucene.document.Document;
+import org.apache.lucene.document.Field;
+import org.apache.lucene.document.SortedNumericDocValuesField;
+import org.apache.lucene.document.TextField;
+import org.apache.lucene.index.DirectoryReader;
+import org.apache.lucene.index.IndexWriter;
+import org.apache.lucene.index.IndexWriterConfig;
+import org.apache.lucene.store.Directory;
+import org.elasticsearch.test.ESTestCase;
+
+import java.io.IOException;
+import java.util.Arrays;
+import java.util.Collections;
+import java.util.HashMap;
+import java.util.Map;
+
+public class TermSpaceTests extends ESTestCase {
+    private static Map<String, Object> wordParams() {
+        Map<String, Object> params = new HashMap<>();
+        params.put("words", Arrays.asList("deep", "learning"));
+        params.put("word_query_counts", Arrays.asList(1, 2));
+        params.put("word_interactions", Arrays.asList(Arrays.asList(0, 1), Arrays.asList(1, 0)));
+        params.put("word_fields", Arrays.asList("title", "abstract"));
+        params.put("word_field_relative_weights", Arrays.asList(0.8, 0.2));
+        params.put("word_field_mus", Arrays.asList(1000.0, 1000.0));
+        params.put("word_field_length_sums", Arrays.asList(70641.0, 1261159.0));
+        params.put("consider_word_set", 1.0);
+        params.put("word_field_ttfs", Arrays.asList(Arrays.asList(10, 100), Arrays.asList(20, 200)));
+        return params;
+    }
+
+    /** The Groovy script, with the tfs, lengths and ttfs of one document. */
+    private static double groovyScore(long[][] tfs, long[] lengths, double[][] ttfs, double spaceWeight, boolean considerSet) {
+        double[] weights = {0.8, 0.2};
+        double[] mus = {1000.0, 1000.0};
+        double[] lengthSums = {70641.0, 1261159.0};
+        int[] counts = {1, 2};
+        double[] baseScores = new double[2];
+        boolean[] exists = new boolean[2];
+        for (int i = 0; i < 2; ++i) {
+            double score = 0.0;
+            for (int k = 0; k < 2; ++k) {
+                exists[i] |= tfs[i][k] > 0;
+                score += weights[k] * (tfs[i][k] + mus[k] * (ttfs[i][k] / lengthSums[k])) / (lengths[k] + mus[k]);
+            }
+            baseScores[i] = Math.sqrt(score);
+        }
+        double total = 0.0;
+        for (int i = 0; i < 2; ++i) {
+            double weight = counts[i];
+            int j = 1 - i;
+            if (considerSet && exists[j]) {
+                weight += baseScores[j] * counts[j];
+            }
+            total += spaceWeight * weight * baseScores[i];
+        }
+        return total;
+    }
+
+    public void testScore() {
+        TermSpace space = TermSpace.parse(wordParams(), "words", "word");
+        long[][] tfs = {{1, 3}, {0, 0}};
+        long[] lengths = {8, 120};
+        double[][] ttfs = {{10, 100}, {20, 200}};
+        assertEquals(groovyScore(tfs, lengths, ttfs, 0.5, true), space.score(tfs, lengths, 0.5, 0.0), 1e-12);
+        assertEquals(1.0 + groovyScore(tfs, lengths, ttfs, 0.5, true), space.score(tfs, lengths, 0.5, 1.0), 1e-12);
+
+        long[][] allTfs = {{1, 3}, {2, 0}};
+        assertEquals(groovyScore(allTfs, lengths, ttfs, 0.3, true), space.score(allTfs, lengths, 0.3, 0.0), 1e-12);
+    }
+
+    public void testScoreWithoutSet() {
+        Map<String, Object> params = wordParams();
+        params.put("consider_word_set", 0.0);
+        TermSpace space = TermSpace.parse(params, "words", "word");
+        long[][] tfs = {{1, 3}, {2, 0}};
+        long[] lengths = {8, 120};
+        double[][] ttfs = {{10, 100}, {20, 200}};
+        assertEquals(groovyScore(tfs, lengths, ttfs, 0.5, false), space.score(tfs, lengths, 0.5, 0.0), 1e-12);
+    }
+
+    public void testEmptySpace() {
+        Map<String, Object> params = wordParams();
+        params.put("words", Collections.emptyList());
+        params.put("word_query_counts", Collections.emptyList());
+        params.put("word_interactions", Collections.emptyList());
+        params.put("word_field_ttfs", Collections.emptyList());
+        TermSpace space = TermSpace.parse(params, "words", "word");
+        assertEquals(0.25, space.score(new long[0][], new long[] {8, 120}, 0.5, 0.25), 0.0);
+    }
+
+    public void testInvalidParams() {
+        Map<String, Object> missing = wordParams();
+        missing.remove("word_field_mus");
+        IllegalArgumentException e = expectThrows(IllegalArgumentException.class, () -> TermSpace.parse(missing, "words", "word"));
+        assertTrue(e.getMessage().contains("word_field_mus"));
+
+        Map<String, Object> notNumbers = wordParams();
+        notNumbers.put("word_query_counts", Arrays.asList("1", "2"));
+        expectThrows(IllegalArgumentException.class, () -> TermSpace.parse(notNumbers, "words", "word"));
+
+        Map<String, Object> wrongLength = wordParams();
+        wrongLength.put("word_field_mus", Collections.singletonList(1000.0));
+        expectThrows(IllegalArgumentException.class, () -> TermSpace.parse(wrongLength, "words", "word"));
+    }
+
+    public void testLeafReadsPostingsInOrder() throws IOException {
+        // title and abstract of each document, some of which lack "deep" or "learning"
+        String[][] docs = {
+            {"deep learning", "learning learning"},
+            {"graph", "graph mining"},
+            {"deep deep", "networks"},
+            {"networks", "learning"},
+            {"learning deep deep deep", "graph"}
+        };
+        long[][][] expectedTfs = {
+            {{1, 0}, {1, 2}},
+            {{0, 0}, {0, 0}},
+            {{2, 0}, {0, 0}},
+            {{0, 0}, {0, 1}},
+            {{3, 0}, {1, 0}}
+        };
+        TermSpace space = TermSpace.parse(wordParams(), "words", "word");
+        double[][] ttfs = {{10, 100}, {20, 200}};
+
+        try (Directory directory = newDirectory()) {
+            try (IndexWriter writer = new IndexWriter(directory, new IndexWriterConfig(new MockAnalyzer(random())))) {
+                for (String[] doc : docs) {
+                    Document document = new Document();
+                    document.add(new TextField("title", doc[0], Field.Store.NO));
+                    document.add(new TextField("abstract", doc[1], Field.Store.NO));
+                    document.add(new SortedNumericDocValuesField("title_length", doc[0].split(" ").length));
+                    document.add(new SortedNumericDocValuesField("abstract_length", doc[1].split(" ").length));
+                    writer.addDocument(document);
+                }
+            }
+            try (DirectoryReader reader = DirectoryReader.open(directory)) {
+                assertEquals(1, reader.leaves().size());
+                TermSpace.Leaf leaf = space.leaf(reader.leaves().get(0));
+                for (int doc = 0; doc < docs.length; ++doc) {
+                    long[] lengths = {docs[doc][0].split(" ").length, docs[doc][1].split(" ").length};
+                    double score = leaf.score(doc, 0.5, 0.0);
+                    assertArrayEquals("tfs of document " + doc, expectedTfs[doc], leaf.tfs);
+                    assertEquals(groovyScore(expectedTfs[doc], lengths, ttfs, 0.5, true), score, 1e-12);
+                }
+                assertEquals(0, leaf.numReopened);
+
+                // visiting an earlier document starts over
+                leaf.score(0, 0.5, 0.0);
+                assertArrayEquals(expectedTfs[0], leaf.tfs);
+                assertTrue(leaf.numReopened > 0);
+            }
+        }
+    }
+}
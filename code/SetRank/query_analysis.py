@@ -0,0 +1,49 @@
+'''
+__author__: Jiaming Shen
+__description__: Tokenize query strings into the words used by the retrieval and rescore queries.
+  Produces the same words as TextBlob(query_string).words, i.e., the NLTK Treebank tokens stripped of surrounding
+  punctuation, without importing TextBlob/NLTK. Each query string is tokenized once and shared by all query builders.
+'''
+import re
+import string
+from functools import lru_cache
+
+## Characters (and "--", "...") which the Treebank tokenizer always splits off, as well as ":" and "," unless
+## followed by a digit (e.g., "1,000" is a single token)
+SPLIT_REGEX = re.compile(r"""[\s(){}\[\]<>;?!"@#$%&]+|--|\.\.\.|[:,](?!\d)""")
+
+## Contractions which the Treebank tokenizer splits into two tokens, e.g., "alzheimer's" -> "alzheimer", "'s"
+CLITIC_REGEX = re.compile(r"^(.*[^'])?('s|'m|'d|'ll|'re|'ve|n't)$", re.IGNORECASE)
+CONTRACTIONS = {"cannot": ("can", "not"), "gimme": ("gim", "me"), "gonna": ("gon", "na"), "gotta": ("got", "ta"),
+                "lemme": ("lem", "me"), "wanna": ("wan", "na")}
+
+
+def _tokens(chunk):
+  contraction = CONTRACTIONS.get(chunk.lower())
+  if contraction is not None:
+    return [(chunk[:len(contraction[0])], False), (chunk[len(contraction[0]):], False)]
+  m = CLITIC_REGEX.match(chunk)
+  if m is not None:
+    return [(m.group(1) or "", False), (m.group(2), True)]
+  return [(chunk, False)]
+
+
+@lru_cache(maxsize=4096)
+def query_words(query_string):
+  ''' Tokenize a query string like TextBlob's .words.
+
+  :param query_string: a query string, e.g., "apoe, alzheimer's disease"
+  :return: a tuple of words, e.g., ("apoe", "alzheimer", "'s", "disease")
+  '''
+  words = []
+  for chunk in SPLIT_REGEX.split(query_string):
+    for token, is_clitic in _tokens(chunk):
+      word = token.strip(string.punctuation)
+      if word: # tokens consisting of punctuation only are dropped, clitics are kept with their apostrophe
+        words.append(token if is_clitic else word)
+  return tuple(words)
+
+
+def query_words_string(query_string):
+  ''' The words of a query string joined by spaces, as used in the match queries. '''
+  return " ".join(query_words(query_string))
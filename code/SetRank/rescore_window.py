@@ -0,0 +1,102 @@
+'''
+__author__: Jiaming Shen
+__description__: Grow the rescore window of a search only as far as its top-k needs.
+  The cost of a rescore search is linear in its window size, yet for most queries the top-k documents after rescoring
+  are found among the first few hundred documents of the retrieval query. An adaptive search starts with a small
+  window and doubles it, up to the maximum window size, until the top-k is stable, i.e., the documents added by the
+  last growth did not change it. This is a heuristic: the retrieval score does not bound the SetRank score, so a
+  document further down the retrieval ranking may still belong in the top-k. A search also stops, exactly, once its
+  window holds every document matched by the retrieval query.
+  On a multi-shard index, ES applies the rescore window to each shard, so a window of N documents rescores up to
+  N documents per shard rather than the global top N. Searches on such indices therefore first find the ids of the
+  global window and restrict their retrieval query to them, see window_query().
+'''
+import json
+
+import hit_fields
+
+INITIAL_WINDOW_SIZE = 100 # The window size of the first search of an adaptive search
+GROWTH_FACTOR = 2 # The factor by which the window grows while the top-k changes
+
+
+def check_sizes(topk, window_size):
+  if topk < 1 or window_size < topk:
+    raise ValueError("Invalid topk %s and window size %s, which must be positive and at least topk" %
+                     (topk, window_size))
+
+def window_sizes(topk, window_size, initial_window_size=INITIAL_WINDOW_SIZE):
+  ''' The increasing window sizes of an adaptive search, the last of which is window_size. '''
+  check_sizes(topk, window_size)
+  sizes = [min(max(initial_window_size, topk), window_size)]
+  while sizes[-1] < window_size:
+    sizes.append(min(sizes[-1] * GROWTH_FACTOR, window_size))
+  return sizes
+
+def is_exhaustive(res, window_size, total=None):
+  ''' Whether the window of a search holds all documents matched by its retrieval query.
+
+  :param total: number of documents matched by the retrieval query, by default the hits total of the response
+  '''
+  if total is None:
+    total = res["hits"]["total"]
+  return total <= window_size
+
+def global_windows(es, headers, retrieval_queries, id_field, window_size, request_timeout):
+  ''' Find the global top window_size documents of each retrieval query, in a single msearch request.
+
+  Equal retrieval queries, e.g., of parameters which only differ in their rescore query, are searched once.
+
+  :param headers: msearch header of each query, e.g., {"index": "s2", "search_type": "dfs_query_then_fetch"}
+  :return: a list of (list of document ids in retrieval order, number of documents matched), one per query
+  '''
+  keys = [json.dumps(query, sort_keys=True) for query in retrieval_queries]
+  firsts = {}
+  for i, key in enumerate(keys):
+    firsts.setdefault(key, i)
+  bulk = []
+  for i in sorted(firsts.values()):
+    body = {"size": window_size, "query": retrieval_queries[i]}
+    hit_fields.id_only(body, id_field)
+    bulk.extend([headers[i], body])
+  windows = {}
+  for i, res in zip(sorted(firsts.values()), es.msearch(body=bulk, request_timeout=request_timeout)["responses"]):
+    windows[keys[i]] = ([hit_fields.hit_id(hit, id_field) for hit in res["hits"]["hits"]], res["hits"]["total"])
+  return [windows[key] for key in keys]
+
+def window_query(retrieval_query, ids, id_field):
+  ''' Restrict a retrieval query to the documents of its global window, which are then all rescored on every shard.
+
+  The filter does not change the retrieval scores, and thus neither the order in which the window is rescored.
+  '''
+  return {"bool": {"must": retrieval_query, "filter": {"terms": {id_field: ids}}}}
+
+def adaptive_search(run, num_searches, id_field, topk, window_size, initial_window_size=INITIAL_WINDOW_SIZE,
+                    totals=None):
+  ''' Run searches with adaptive rescore windows, where each growth only reruns the searches whose top-k changed.
+
+  :param run: a function (indices of searches, window size) -> a list of responses, one per index, each with the
+              topk best hits of the search, passed through hit_fields.id_only()
+  :param num_searches: number of searches, e.g., 1 for setRank, one per parameter for autoSetRank
+  :param totals: number of documents matched by the retrieval query of each search, required if run() restricts
+                 the retrieval queries with window_query(), as their hits total is then at most the window size
+  :return: (a list of responses, one per search, a list of the final window size of each search)
+  '''
+  if totals is None:
+    totals = [None] * num_searches
+  sizes = window_sizes(topk, window_size, initial_window_size)
+  responses = run(list(range(num_searches)), sizes[0])
+  final_sizes = [sizes[0]] * num_searches
+  pending = [i for i in range(num_searches) if not is_exhaustive(responses[i], sizes[0], totals[i])]
+  for size in sizes[1:]:
+    if not pending:
+      break
+    unstable = []
+    for i, res in zip(pending, run(pending, size)):
+      ranking = [hit_fields.hit_id(hit, id_field) for hit in res["hits"]["hits"]]
+      previous_ranking = [hit_fields.hit_id(hit, id_field) for hit in responses[i]["hits"]["hits"]]
+      if ranking != previous_ranking and not is_exhaustive(res, size, totals[i]):
+        unstable.append(i)
+      responses[i] = res
+      final_sizes[i] = size
+    pending = unstable
+  return responses, final_sizes
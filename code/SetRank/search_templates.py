@@ -0,0 +1,171 @@
+'''
+__author__: Jiaming Shen
+__description__: Send many similar search bodies, e.g., those of one query for all candidate parameters of autoSetRank,
+  as a single stored search template and the differing values of each body.
+  The parts which are equal in all bodies (the entities, words, fields, length sums, term statistics, ...) are sent
+  once in the template, and each search of the msearch request only carries its own weights, mus, flags, ... as
+  template params, which shrinks the msearch request and its JSON encoding by an order of magnitude.
+  Templates are stored under an id which contains a hash of their source, like the rescore script in
+  setrank_script.py, such that repeated queries reuse the template compiled by ES instead of compiling a new one.
+  As the source holds the query, every query stores a template, so each process only keeps its MAX_STORED_TEMPLATES
+  most recently used templates and deletes the others, as well as all of its templates with delete_templates() when
+  it is done. The ids also contain a token of the process, such that no process deletes a template another one uses.
+'''
+import collections
+import hashlib
+import json
+import os
+import threading
+
+TEMPLATE_PREFIX = "setrank_sweep" # Prefix of the ids of the stored templates
+MAX_STORED_TEMPLATES = 64 # Number of templates each process keeps stored, the least recently used ones are deleted
+
+_process_token = os.urandom(3).hex() # Part of the template ids which is unique to this process
+_stored = collections.OrderedDict() # id -> number of msearch requests using the template, least recently used first
+_lock = threading.Lock()
+
+
+class _Placeholder(object):
+  ''' A value which differs between the bodies, rendered from the template param of the given name. '''
+  def __init__(self, name, values, kind):
+    self.name = name
+    self.values = values
+    self.kind = kind
+
+  def mustache(self):
+    if self.kind == "string":
+      return '"{{%s}}"' % self.name
+    if self.kind == "number":
+      return '{{%s}}' % self.name
+    return '{{#toJson}}%s{{/toJson}}' % self.name
+
+def _is_number(value):
+  return isinstance(value, (int, float)) # includes bool, which mustache renders as true/false
+
+def _kind(values):
+  if all(_is_number(value) for value in values):
+    return "number"
+  if all(isinstance(value, str) for value in values):
+    return "string"
+  if all(isinstance(value, (dict, list)) for value in values):
+    return "json"
+  raise ValueError("Values %s cannot be a template param" % (values[:3],))
+
+def _split(values, placeholders):
+  ''' Return the common structure of values, with a _Placeholder wherever they differ. '''
+  first = values[0]
+  if all(value == first for value in values[1:]):
+    return first
+  if all(isinstance(value, dict) for value in values) and all(value.keys() == first.keys() for value in values[1:]):
+    return {key: _split([value[key] for value in values], placeholders) for key in first}
+  if all(isinstance(value, list) and len(value) == len(first) for value in values) and \
+     any(isinstance(element, (dict, list)) for element in first): # lists of scalars, e.g., weights, are a single param
+    return [_split([value[i] for value in values], placeholders) for i in range(len(first))]
+  placeholder = _Placeholder("p%s" % len(placeholders), values, _kind(values))
+  placeholders.append(placeholder)
+  return placeholder
+
+def _render(value):
+  if isinstance(value, _Placeholder):
+    return value.mustache()
+  if isinstance(value, dict):
+    return "{" + ",".join("%s:%s" % (_render(key), _render(element)) for key, element in value.items()) + "}"
+  if isinstance(value, list):
+    return "[" + ",".join(_render(element) for element in value) + "]"
+  s = json.dumps(value)
+  if "{{" in s or "}}" in s:
+    raise ValueError("Value %s would be read as a mustache tag" % s)
+  return s
+
+def template_bodies(bodies):
+  ''' Split search bodies into a mustache template of their common parts and the params of each body.
+
+  :param bodies: a non-empty list of search bodies
+  :return: (template source, a list of template params, one per body)
+  :raise ValueError: if differing values cannot be template params, e.g., null values
+  '''
+  placeholders = []
+  source = _render(_split(bodies, placeholders))
+  params_list = [{placeholder.name: placeholder.values[i] for placeholder in placeholders} for i in range(len(bodies))]
+  return source, params_list
+
+def template_id(source):
+  return "%s_%s_%s" % (TEMPLATE_PREFIX, _process_token, hashlib.sha1(source.encode("utf-8")).hexdigest()[:12])
+
+def _delete(es, tids):
+  from elasticsearch import NotFoundError, TransportError
+  for tid in tids:
+    try:
+      es.delete_template(id=tid)
+    except NotFoundError:
+      pass
+    except TransportError as e:
+      print("[WARNING] Could not delete the search template %s: %s" % (tid, e))
+
+def acquire_template(es, source):
+  ''' Store a template in ES unless it is already stored, and mark it as used until release_template().
+
+  Stored templates beyond the MAX_STORED_TEMPLATES most recently used ones are deleted, unless they are in use.
+
+  :return: the id of the stored template
+  '''
+  tid = template_id(source)
+  with _lock:
+    is_stored = tid in _stored
+    if is_stored:
+      _stored[tid] += 1
+      _stored.move_to_end(tid)
+  if is_stored:
+    return tid
+
+  es.put_template(id=tid, body={"template": source})
+  with _lock:
+    _stored[tid] = _stored.get(tid, 0) + 1 # another thread may have stored it meanwhile
+    _stored.move_to_end(tid)
+    num_evicted = len(_stored) - MAX_STORED_TEMPLATES
+    evicted = [unused for unused, uses in _stored.items() if uses == 0][:max(num_evicted, 0)]
+    for unused in evicted:
+      del _stored[unused]
+  _delete(es, evicted)
+  return tid
+
+def release_template(tid):
+  with _lock:
+    if tid in _stored:
+      _stored[tid] -= 1
+
+def delete_templates(es):
+  ''' Delete all templates stored by this process which are not in use, e.g., when it is done searching. '''
+  with _lock:
+    unused = [tid for tid, uses in _stored.items() if uses == 0]
+    for tid in unused:
+      del _stored[tid]
+  _delete(es, unused)
+
+def msearch(es, headers, bodies, request_timeout, templated=True):
+  ''' Run the searches of bodies in a single msearch request, through a stored template of their common parts.
+
+  The template is stored on its first use and kept among the most recently used ones, such that the same searches,
+  e.g., of the same query in the service, reuse it. A single body, or bodies which cannot be templated, are sent by
+  a plain msearch.
+
+  :param headers: msearch header of each body, e.g., {"index": "s2", "type": "s2_papers"}
+  :param templated: False to always send a plain msearch
+  :return: the responses, one per body
+  '''
+  source = None
+  if templated and len(bodies) > 1:
+    try:
+      source, params_list = template_bodies(bodies)
+    except ValueError:
+      pass
+  if source is None:
+    bulk = [line for header, body in zip(headers, bodies) for line in (header, body)]
+    return es.msearch(body=bulk, request_timeout=request_timeout)["responses"]
+
+  tid = acquire_template(es, source)
+  try:
+    bulk = [line for header, params in zip(headers, params_list) for line in (header, {"id": tid, "params": params})]
+    return es.msearch_template(body=bulk, request_timeout=request_timeout)["responses"]
+  finally:
+    release_template(tid)
@@ -5,29 +5,47 @@ __description__: Implement unsupervised SetRank algorithm in ES 5.4.0.
 import argparse
 import json
 import sys
-from elasticsearch import Elasticsearch
 from collections import Counter
-from textblob import TextBlob
-
-es = Elasticsearch()
+import es_client
+import hit_fields
+import rescore_window
+import setrank_script
+import term_stats
+import query_analysis
 
 FLAGS_INDEX_NAME = 'trec'
 FLAGS_TYPE_NAME = 'trec_papers'
+FLAGS_ID_FIELD = 'pmid'  # The document id field saved in _source
 FLAGS_REQUEST_TIMEOUT = 180  # Timeout limit in seconds
 FLAGS_TOPK = 20  # The final number of documents returned
 FLAGS_RESCORE_WINDOW_SIZE = 1000  # The window size of rescoring results.
+FLAGS_STORED_SCRIPT = True # Refer to the rescore script stored in ES instead of sending its source
+FLAGS_DEFAULT_PARAMS = "title:20.0,abstract:5.0," \
+                       "title_ana:20.0,abstract_ana:5.0," \
+                       "title_mu:1000.0,abstract_mu:1000.0," \
+                       "title_ana_mu:1000.0,abstract_ana_mu:1000.0," \
+                       "entity_lambda:0.5,type_interaction:1.0," \
+                       "consider_entity_set:1.0,consider_word_set:1.0," \
+                       "consider_type:1.0,word_dependency:1.0"
+
+ENTITY_FIELDS = ["title_ana", "abstract_ana"] # The entity annotation fields used in rescoring
+WORD_FIELDS = ["title", "abstract"] # The word fields used in rescoring
 
 ### Following are model selection parameters
 FLAGS_QUERY_WEIGHT = 0  # The weight of retrieval query. Set 0 if you want to use our own model
 FLAGS_RESCORE_WEIGHT = 1  # The weight of rescore query. Set 1 if you want to use our own model.
 
 
+def parse_query(queryInfo):
+  return [queryInfo['qid'], queryInfo['query'].lower(), queryInfo["ana"]]
+
+
 def load_query(args):
   with open(args.query, "r") as fin:
     queries = []
     for line in fin:
       queryInfo = json.loads(line.strip())
-      queries.append([queryInfo['qid'], queryInfo['query'].lower(), queryInfo["ana"]])
+      queries.append(parse_query(queryInfo))
     return queries
 
 
@@ -77,8 +95,7 @@ def generate_retrieval_query(query_string, entity_string, field_weights, DEBUG=F
   :param DEBUG: debug flag
   :return: a retrieval query
   '''
-  blob = TextBlob(query_string)
-  query_string = " ".join([str(word) for word in blob.words])
+  query_string = query_analysis.query_words_string(query_string)
   retrieval_query = {
     "bool": {
       "should": [
@@ -94,105 +111,9 @@ def generate_retrieval_query(query_string, entity_string, field_weights, DEBUG=F
   return retrieval_query
 
 
-def generate_rescore_query(query_string, entity_string, kb, params, DEBUG=False):
-  ## Processing entities
-  c = Counter(entity_string.split())
-  eids = []
-  eid_counts = []
-  for ele in c.items():
-    eids.append(ele[0])
-    eid_counts.append(ele[1])
-
-  ## Processing words
-  blob = TextBlob(query_string)
-  query_string = " ".join([str(word) for word in blob.words])
-  c = Counter(query_string.split())
-  words = []
-  word_counts = []
-  for ele in c.items():
-    words.append(ele[0])
-    word_counts.append(ele[1])
-
-  ## obtain relative entity field weights
-  entity_fields_weights_sum = params["title_ana"] + params["abstract_ana"]
-  title_ana_relative_weight = 1.0 * params["title_ana"] / entity_fields_weights_sum
-  abstract_ana_relative_weight = 1.0 * params["abstract_ana"] / entity_fields_weights_sum
-  entity_field_relative_weights = [title_ana_relative_weight, abstract_ana_relative_weight]
-
-  ## obtain relative word field weights
-  word_fields_weights_sum = params["title"] + params["abstract"]
-  title_relative_weight = 1.0 * params["title"] / word_fields_weights_sum
-  abstract_relative_weight = 1.0 * params["abstract"] / word_fields_weights_sum
-  word_field_relative_weights = [title_relative_weight, abstract_relative_weight]
-
-  ## obtain entity interaction (based on type hierarchy) strength
-  eid_interactions = []
-  for i, eid1 in enumerate(eids):
-    eid_interaction = []
-    for j, eid2 in enumerate(eids):
-      if j == i:  # diagonal is zero
-        eid_interaction.append(0.0)
-      else:
-        if params["consider_type"]:
-          eid_interaction.append(type_dist(eid1, eid2, kb, params))
-        else:
-          eid_interaction.append(1.0)
-
-    eid_interactions.append(eid_interaction)
-
-  ## obtain word interaction (based on word similarity) strength or just all zeros
-  word_interactions = []
-  for i, word1 in enumerate(words):
-    word_interaction = []
-    for j, word2 in enumerate(words):
-      if j == i:  # diagonal is zero
-        word_interaction.append(0)
-      else:
-        word_interaction.append(1)
-    word_interactions.append(word_interaction)
-
-  if DEBUG:
-    print("=== Entity Information ===")
-    print("eids: ", eids)
-    print("eid_counts: ", eid_counts)
-    print("eid_interactions: ", eid_interactions)
-    print("entity_field_relative_weights: ", entity_field_relative_weights)
-    print("=== Word Information ===")
-    print("words: ", words)
-    print("word_counts: ", word_counts)
-    print("word_interactions: ", word_interactions)
-    print("word_field_relative_weights: ", word_field_relative_weights)
-
-  params = {
-    "entities": eids,
-    "entity_query_counts": eid_counts,
-    "entity_interactions": eid_interactions,
-    "entity_fields": ["title_ana", "abstract_ana"],
-    "entity_field_relative_weights": entity_field_relative_weights,
-    "entity_field_mus": [params["title_ana_mu"], params["abstract_ana_mu"]],
-    "entity_field_length_sums": [6163685.0, 43615331.0],
-    "consider_entity_set":params['consider_entity_set'],
-
-    "words": words,
-    "word_query_counts": word_counts,
-    "word_interactions": word_interactions,
-    "word_fields": ["title", "abstract"],
-    "word_field_relative_weights": word_field_relative_weights,
-    "word_field_mus": [params["title_mu"], params["abstract_mu"]],
-    "word_field_length_sums": [54350257.0, 650533454.0],
-    "consider_word_set": params['consider_word_set'],
-
-    # this should be a number in [0, 1]
-    "entity_lambda": params["entity_lambda"]
-  }
-
-  rescore_query = {
-    "function_score": {
-      "script_score": {
-        "script": {
-          "lang": "groovy",  ## need to explicitly state the usage of groovy
-          "params": params,
-          "inline": """
+## The rescore script implementing the SetRank scoring function, stored in ES by setrank_script.py
+RESCORE_SCRIPT_NAME = "setrank_trec"
+RESCORE_SCRIPT = """
             double total_score = 0.0;
 
             /* Entity space score */
@@ -216,7 +137,7 @@ def generate_rescore_query(query_string, entity_string, kb, params, DEBUG=False)
                 if (tf_d > 0) {;
                   eid_exist_flag = 1;
                 };
-                tf_D = _index[field][eid].ttf();
+                tf_D = (entity_field_ttfs.size() > 0) ? entity_field_ttfs[i][k] : _index[field][eid].ttf();
                 L_d = doc[field_length].value;
                 L_D = field_length_sum;
 
@@ -271,7 +192,7 @@ def generate_rescore_query(query_string, entity_string, kb, params, DEBUG=False)
                 if (tf_d > 0) {;
                   word_exist_flag = 1;
                 };
-                tf_D = _index[field][word].ttf();
+                tf_D = (word_field_ttfs.size() > 0) ? word_field_ttfs[i][k] : _index[field][word].ttf();
                 L_d = doc[field_length].value;
                 L_D = field_length_sum;
 
@@ -305,7 +226,120 @@ def generate_rescore_query(query_string, entity_string, kb, params, DEBUG=False)
 
             return total_score;
           """
-        }
+
+
+def generate_rescore_params(query_string, entity_string, kb, params, DEBUG=False, global_ttfs=None):
+  ''' Generate the params of the rescore script, which implements the SetRank scoring function.
+
+  :param global_ttfs: a dict of (field, term) -> total term frequency over all shards, see term_stats.py.
+                      None to use the ttf of the shard holding each document, which is exact on a single shard.
+  '''
+  ## Processing entities
+  c = Counter(entity_string.split())
+  eids = []
+  eid_counts = []
+  for ele in c.items():
+    eids.append(ele[0])
+    eid_counts.append(ele[1])
+
+  ## Processing words
+  c = Counter(query_analysis.query_words(query_string))
+  words = []
+  word_counts = []
+  for ele in c.items():
+    words.append(ele[0])
+    word_counts.append(ele[1])
+
+  ## obtain relative entity field weights
+  entity_fields_weights_sum = params["title_ana"] + params["abstract_ana"]
+  title_ana_relative_weight = 1.0 * params["title_ana"] / entity_fields_weights_sum
+  abstract_ana_relative_weight = 1.0 * params["abstract_ana"] / entity_fields_weights_sum
+  entity_field_relative_weights = [title_ana_relative_weight, abstract_ana_relative_weight]
+
+  ## obtain relative word field weights
+  word_fields_weights_sum = params["title"] + params["abstract"]
+  title_relative_weight = 1.0 * params["title"] / word_fields_weights_sum
+  abstract_relative_weight = 1.0 * params["abstract"] / word_fields_weights_sum
+  word_field_relative_weights = [title_relative_weight, abstract_relative_weight]
+
+  ## obtain entity interaction (based on type hierarchy) strength
+  eid_interactions = []
+  for i, eid1 in enumerate(eids):
+    eid_interaction = []
+    for j, eid2 in enumerate(eids):
+      if j == i:  # diagonal is zero
+        eid_interaction.append(0.0)
+      else:
+        if params["consider_type"]:
+          eid_interaction.append(type_dist(eid1, eid2, kb, params))
+        else:
+          eid_interaction.append(1.0)
+
+    eid_interactions.append(eid_interaction)
+
+  ## obtain word interaction (based on word similarity) strength or just all zeros
+  word_interactions = []
+  for i, word1 in enumerate(words):
+    word_interaction = []
+    for j, word2 in enumerate(words):
+      if j == i:  # diagonal is zero
+        word_interaction.append(0)
+      else:
+        word_interaction.append(1)
+    word_interactions.append(word_interaction)
+
+  if DEBUG:
+    print("=== Entity Information ===")
+    print("eids: ", eids)
+    print("eid_counts: ", eid_counts)
+    print("eid_interactions: ", eid_interactions)
+    print("entity_field_relative_weights: ", entity_field_relative_weights)
+    print("=== Word Information ===")
+    print("words: ", words)
+    print("word_counts: ", word_counts)
+    print("word_interactions: ", word_interactions)
+    print("word_field_relative_weights: ", word_field_relative_weights)
+
+  params = {
+    "entities": eids,
+    "entity_query_counts": eid_counts,
+    "entity_interactions": eid_interactions,
+    "entity_fields": ENTITY_FIELDS,
+    "entity_field_relative_weights": entity_field_relative_weights,
+    "entity_field_mus": [params["title_ana_mu"], params["abstract_ana_mu"]],
+    "entity_field_length_sums": [6163685.0, 43615331.0],
+    "consider_entity_set":params['consider_entity_set'],
+
+    "words": words,
+    "word_query_counts": word_counts,
+    "word_interactions": word_interactions,
+    "word_fields": WORD_FIELDS,
+    "word_field_relative_weights": word_field_relative_weights,
+    "word_field_mus": [params["title_mu"], params["abstract_mu"]],
+    "word_field_length_sums": [54350257.0, 650533454.0],
+    "consider_word_set": params['consider_word_set'],
+
+    # this should be a number in [0, 1]
+    "entity_lambda": params["entity_lambda"]
+  }
+
+  ## total term frequencies over all shards, indexed by [term][field]; empty lists let the script read the shard ttf
+  if global_ttfs is not None:
+    params["entity_field_ttfs"] = [[global_ttfs[(field, eid)] for field in params["entity_fields"]] for eid in eids]
+    params["word_field_ttfs"] = [[global_ttfs[(field, word)] for field in params["word_fields"]] for word in words]
+  else:
+    params["entity_field_ttfs"] = []
+    params["word_field_ttfs"] = []
+
+  return params
+
+def generate_rescore_query(query_string, entity_string, kb, params, DEBUG=False, global_ttfs=None):
+  ''' Generate the rescore query which implements the SetRank scoring function, see generate_rescore_params(). '''
+  script_params = generate_rescore_params(query_string, entity_string, kb, params, DEBUG=DEBUG, global_ttfs=global_ttfs)
+  rescore_query = {
+    "function_score": {
+      "script_score": {
+        "script": setrank_script.script(RESCORE_SCRIPT_NAME, RESCORE_SCRIPT, script_params, stored=FLAGS_STORED_SCRIPT)
       },
       "score_mode": "sum", # defines how the computed scores are combined if multiple functions present, not important in our case
       "boost_mode": "replace"  # defines how the original query score and newly computed function score are combined.
@@ -322,17 +356,43 @@ def entity_count(entity_string, entity_set):
   return ",".join([ele[0] + ":" + str(ele[1]) for ele in tmp])
 
 
-def setRank(query_words_string, query_entities_string, kb, params, DEBUG=False):
+def query_global_ttfs(query_words_string, query_entities_string, index_name=FLAGS_INDEX_NAME):
+  ''' Obtain the total term frequencies of the query terms summed over all shards of the index.
+
+  :return: None for a single shard index, otherwise a dict of (field, term) -> ttf used by generate_rescore_query()
+  '''
+  if not term_stats.is_sharded(es_client.get_es(), index_name):
+    return None
+  field_terms = {}
+  for field in ENTITY_FIELDS:
+    field_terms[field] = query_entities_string.split()
+  for field in WORD_FIELDS:
+    field_terms[field] = list(query_analysis.query_words(query_words_string)) # the words of generate_rescore_query()
+  return term_stats.global_ttfs(es_client.get_es(), index_name, FLAGS_TYPE_NAME, field_terms, request_timeout=FLAGS_REQUEST_TIMEOUT)
+
+
+def setRank(query_words_string, query_entities_string, kb, params, DEBUG=False, index_name=FLAGS_INDEX_NAME,
+            explain=False, topk=FLAGS_TOPK, window_size=FLAGS_RESCORE_WINDOW_SIZE, adaptive_window=False):
+  ''' Rank a query with the given parameters.
+
+  :param explain: True to also return the explanation of the score of each hit, in its "_explanation"
+  :param topk: number of documents returned
+  :param window_size: number of documents rescored, or the maximum number if adaptive_window is True
+  :param adaptive_window: True to grow the rescore window only while the top-k changes, see rescore_window.py
+  :return: the search response, whose hits only carry the id field, see hit_fields.hit_id()
+  '''
+  rescore_window.check_sizes(topk, window_size)
+  global_ttfs = query_global_ttfs(query_words_string, query_entities_string, index_name=index_name)
   retrieval_query = generate_retrieval_query(query_string=query_words_string, entity_string=query_entities_string,
                                              field_weights=params, DEBUG=DEBUG)
   rescore_query = generate_rescore_query(query_string=query_words_string, entity_string=query_entities_string, kb=kb,
-                                         params=params, DEBUG=DEBUG)
+                                         params=params, DEBUG=DEBUG, global_ttfs=global_ttfs)
 
   search_body = {
-    "size": FLAGS_TOPK,
+    "size": topk,
     "query": retrieval_query,
     "rescore": {
-      "window_size": FLAGS_RESCORE_WINDOW_SIZE,
+      "window_size": window_size,
       "query": {
         "rescore_query": rescore_query,
         "query_weight": FLAGS_QUERY_WEIGHT, # define how the scores of original retrieval query and rescore query are combined
@@ -340,15 +400,42 @@ def setRank(query_words_string, query_entities_string, kb, params, DEBUG=False):
       }
     }
   }
-
-  res = es.search(index=FLAGS_INDEX_NAME, request_timeout=FLAGS_REQUEST_TIMEOUT, body=search_body)
-  return res
+  hit_fields.id_only(search_body, FLAGS_ID_FIELD, explain=explain)
+
+  kwargs = {}
+  window = None
+  totals = None
+  if global_ttfs is not None:
+    ## also make the retrieval scores (and thus the rescore window) independent of the document distribution
+    kwargs["search_type"] = "dfs_query_then_fetch"
+    ## the rescore window applies to each shard, so only the documents of the global window are rescored
+    [(window, total)] = rescore_window.global_windows(
+      es_client.get_es(), [{"index": index_name, "search_type": "dfs_query_then_fetch"}], [retrieval_query],
+      FLAGS_ID_FIELD, window_size, FLAGS_REQUEST_TIMEOUT)
+    totals = [total]
+    search_body["query"] = rescore_window.window_query(retrieval_query, window, FLAGS_ID_FIELD)
+  if not adaptive_window:
+    return es_client.get_es().search(index=index_name, request_timeout=FLAGS_REQUEST_TIMEOUT, body=search_body,
+                                     **kwargs)
+
+  def run(indices, size):
+    search_body["rescore"]["window_size"] = size
+    if window is not None:
+      search_body["query"] = rescore_window.window_query(retrieval_query, window[:size], FLAGS_ID_FIELD)
+    return [es_client.get_es().search(index=index_name, request_timeout=FLAGS_REQUEST_TIMEOUT, body=search_body,
+                                      **kwargs)]
+  responses, sizes = rescore_window.adaptive_search(run, 1, FLAGS_ID_FIELD, topk, window_size, totals=totals)
+  if DEBUG:
+    print("Rescore window size: %s" % sizes[0])
+  return responses[0]
 
 
 def main(args):
   queries = load_query(args)
   kb = load_kb(args)
   result_all = []
+  if args.explain:
+    fout_explain = open(args.output + ".explain", "w")
   debug_flag = ( int(args.debug) == 1 )
   params = {ele.split(":")[0]: float(ele.split(":")[1]) for ele in args.params.split(",")}
   if debug_flag:
@@ -366,12 +453,18 @@ def main(args):
     query_entities_string = " ".join(query_entities_list)
 
     # print("Runing query %s: %s" % (query_id, query_string))
-    res = setRank(query_string, query_entities_string, kb, params, DEBUG=debug_flag)
+    res = setRank(query_string, query_entities_string, kb, params, DEBUG=debug_flag, index_name=args.index,
+                  explain=args.explain, topk=int(args.topk), window_size=int(args.window_size),
+                  adaptive_window=args.adaptive_window)
+    if args.explain:
+      hit_fields.write_explanations(fout_explain, query_id, res['hits']['hits'], FLAGS_ID_FIELD)
     rank = 1
     for hit in res['hits']['hits']:
-      result_all.append([query_id, "Q0", hit["_source"]["pmid"], str(rank), str(hit["_score"]), "setRank-TREC"])
+      result_all.append([query_id, "Q0", hit_fields.hit_id(hit, FLAGS_ID_FIELD), str(rank), str(hit["_score"]), "setRank-TREC"])
       rank += 1
 
+  if args.explain:
+    fout_explain.close()
   save_results(args, result_all)
 
 
@@ -383,18 +476,27 @@ if __name__ == "__main__":
   parser.add_argument('-output', required=False, default="../results/trec/setrank.run",
                       help='File name of output results.')
   parser.add_argument('-kb', required=False, default="../../data/TREC_BIO/trec_entity_type.tsv")
-  parser.add_argument('-params', required=False, default="title:20.0,abstract:5.0,"
-                                                         "title_ana:20.0,abstract_ana:5.0,"
-                                                         "title_mu:1000.0,abstract_mu:1000.0,"
-                                                         "title_ana_mu:1000.0,abstract_ana_mu:1000.0,"
-                                                         "entity_lambda:0.5,type_interaction:1.0,"
-                                                         "consider_entity_set:1.0,consider_word_set:1.0,"
-                                                         "consider_type:1.0,word_dependency:1.0",
+  parser.add_argument('-params', required=False, default=FLAGS_DEFAULT_PARAMS,
                       help="tunable parameters in our model")
   parser.add_argument('-debug', required=False, default=0, help="debug flag")
+  parser.add_argument('-index', required=False, default=FLAGS_INDEX_NAME,
+                      help="name of the index to search, which can have multiple shards")
+  parser.add_argument('-topk', required=False, default=FLAGS_TOPK, help="number of documents returned per query")
+  parser.add_argument('-window_size', required=False, default=FLAGS_RESCORE_WINDOW_SIZE,
+                      help="number of documents rescored per query, the maximum one with -adaptive_window")
+  parser.add_argument('-adaptive_window', required=False, action='store_true',
+                      help="grow the rescore window from %s documents only while the top-k changes"
+                           % rescore_window.INITIAL_WINDOW_SIZE)
+  parser.add_argument('-explain', required=False, action='store_true',
+                      help="also write the explanation of the score of each hit to <output>.explain as JSON lines")
+  es_client.add_arguments(parser)
+  setrank_script.add_arguments(parser)
   args = parser.parse_args()
+  es_client.configure_from_args(args)
+  setrank_script.configure_from_args(args)
   print("=== Arguments ===")
   print("  Input Query: %s" % args.query)
   print("  Output Run: %s" % args.output)
+  print("  Index: %s" % args.index)
   print("  Parameters: %s" % args.params)
   sys.exit(main(args))
\ No newline at end of file
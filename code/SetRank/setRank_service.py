@@ -0,0 +1,228 @@
+'''
+__author__: Jiaming Shen
+__description__: A long-running SetRank service which answers setRank and autoSetRank queries with warm state.
+  The KB, the default parameters, the query tokenizer, the term statistics caches and the Elasticsearch connection
+  pool are loaded once, instead of once per batch run. Requests are JSON objects with the fields of a line of the
+  query file, e.g., {"qid": "1", "query": "deep learning", "ana": {"/m/0h1fn8h": 1}}, and optionally:
+    "mode": "setRank" (default) or "autoSetRank",
+    "params": parameters overriding the default ones, for setRank,
+    "params_set": a list of such parameters, one per candidate ranking, for autoSetRank,
+    "sweep_mode": "es" (default) or "local", how autoSetRank ranks with every parameter, see sweep_engine.py,
+    "explain": true to add the explanation of its score to each hit, for setRank,
+    "topk": the number of documents ranked, "window_size": the number of documents rescored, defaulting to
+      FLAGS_TOPK and FLAGS_RESCORE_WINDOW_SIZE of setRank_ESR.py or setRank_TREC.py,
+    "adaptive_window": true to grow the rescore window up to window_size only while the top-k changes, see
+      rescore_window.py,
+    "index": the index to search.
+  They are read as JSON lines from stdin and answered as JSON lines on stdout, or with -port as HTTP POST requests.
+'''
+import argparse
+import importlib
+import json
+import sys
+import time
+
+import es_client
+import hit_fields
+import rescore_window
+import search_templates
+import setrank_script
+
+SETRANK_MODULES = {"s2": ("setRank_ESR", "autoSetRank_ESR"), "trec": ("setRank_TREC", "autoSetRank_TREC")}
+DEFAULT_KB = {"s2": "../../data/S2-CS/s2_entity_type.tsv", "trec": "../../data/TREC-BIO/trec_entity_type.tsv"}
+
+class RequestError(ValueError):
+  ''' A malformed request, answered with HTTP status 400. '''
+  pass
+
+class SetRankService(object):
+  def __init__(self, dataset, kb, params, index_name):
+    setRank_module_name, autoSetRank_module_name = SETRANK_MODULES[dataset]
+    self.setRank_module = importlib.import_module(setRank_module_name)
+    self.autoSetRank_module = importlib.import_module(autoSetRank_module_name)
+    self.kb = kb
+    self.params = params
+    self.index_name = index_name
+
+  def warm_up(self):
+    ''' Connect to Elasticsearch and cache the number of shards of the index. '''
+    self.setRank_module.term_stats.is_sharded(es_client.get_es(), self.index_name)
+
+  def merged_params(self, params):
+    merged = dict(self.params)
+    merged.update(params)
+    return merged
+
+  def parse_request(self, request):
+    ''' Read the query and the options of a request.
+
+    :return: a dict of the arguments of setRank or multiSetRank, and the "mode" and "query_id"
+    :raise RequestError: if the request is malformed, e.g., lacks a field or has an unknown mode
+    '''
+    try:
+      if not isinstance(request, dict):
+        raise RequestError("Request must be a JSON object")
+      query_id, query_string, ana = self.setRank_module.parse_query(request)
+      query_entities_list = []
+      for k, v in ana.items():
+        for i in range(v):
+          query_entities_list.append(k)
+      parsed = {
+        "mode": request.get("mode", "setRank"),
+        "query_id": query_id,
+        "query_words_string": query_string,
+        "query_entities_string": " ".join(query_entities_list),
+        "index_name": request.get("index", self.index_name),
+        "topk": int(request.get("topk", self.setRank_module.FLAGS_TOPK)),
+        "window_size": int(request.get("window_size", self.setRank_module.FLAGS_RESCORE_WINDOW_SIZE)),
+        "adaptive_window": bool(request.get("adaptive_window", False))
+      }
+      rescore_window.check_sizes(parsed["topk"], parsed["window_size"])
+
+      if parsed["mode"] == "setRank":
+        parsed["params"] = self.merged_params(request.get("params", {}))
+        parsed["explain"] = bool(request.get("explain", False))
+      elif parsed["mode"] == "autoSetRank":
+        parsed["params_set"] = [self.merged_params(params) for params in request["params_set"]]
+        parsed["sweep_mode"] = request.get("sweep_mode", "es")
+        if parsed["sweep_mode"] not in ("es", "local"):
+          raise RequestError("Unsupported sweep mode: %s" % parsed["sweep_mode"])
+        if parsed["sweep_mode"] == "local" and parsed["adaptive_window"]:
+          raise RequestError("Adaptive rescore windows require sweep mode es")
+      else:
+        raise RequestError("Unsupported mode: %s" % parsed["mode"])
+    except RequestError:
+      raise
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+      raise RequestError("%s: %s" % (type(e).__name__, e))
+    return parsed
+
+  def handle(self, request):
+    ''' Answer a single request.
+
+    :return: a dict with the query id, the ranked documents ("hits") and the time taken in milliseconds, or with an
+             "error" message and its HTTP "status", 400 for a malformed request and 500 for a failed search
+    '''
+    start = time.time()
+    try:
+      parsed = self.parse_request(request)
+      query_id = parsed["query_id"]
+      if parsed["mode"] == "setRank":
+        res = self.setRank_module.setRank(parsed["query_words_string"], parsed["query_entities_string"], self.kb,
+                                          parsed["params"], index_name=parsed["index_name"], explain=parsed["explain"],
+                                          topk=parsed["topk"], window_size=parsed["window_size"],
+                                          adaptive_window=parsed["adaptive_window"])
+        hits = []
+        for hit in res["hits"]["hits"]:
+          hits.append({"docno": hit_fields.hit_id(hit, self.setRank_module.FLAGS_ID_FIELD), "score": hit["_score"]})
+          if parsed["explain"]:
+            hits[-1]["explanation"] = hit["_explanation"]
+        response = {"qid": query_id, "hits": hits}
+      else:
+        rankings = self.autoSetRank_module.multiSetRank(parsed["query_words_string"], parsed["query_entities_string"],
+                                                        self.kb, parsed["params_set"], index_name=parsed["index_name"],
+                                                        sweep_mode=parsed["sweep_mode"], topk=parsed["topk"],
+                                                        window_size=parsed["window_size"],
+                                                        adaptive_window=parsed["adaptive_window"])
+        (confidences, aggregated_rank) = self.autoSetRank_module.rankAggregate(rankings)
+        response = {"qid": query_id, "hits": [{"docno": docno} for docno in aggregated_rank],
+                    "confidences": [float(confidence) for confidence in confidences]}
+    except RequestError as e:
+      response = {"qid": request.get("qid") if isinstance(request, dict) else None, "error": str(e), "status": 400}
+    except Exception as e:
+      ## e.g., Elasticsearch connection errors and timeouts, which a client may retry
+      response = {"qid": request.get("qid") if isinstance(request, dict) else None,
+                  "error": "%s: %s" % (type(e).__name__, e), "status": 500}
+    response["took_ms"] = round(1000.0 * (time.time() - start), 3)
+    return response
+
+  def handle_json(self, s):
+    try:
+      request = json.loads(s)
+    except ValueError as e:
+      return {"error": "Invalid JSON: %s" % e, "status": 400}
+    return self.handle(request)
+
+def serve_lines(service, fin, fout):
+  ''' Answer each JSON line of fin with one JSON line on fout, in the same order. '''
+  for line in fin:
+    line = line.strip()
+    if not line:
+      continue
+    fout.write(json.dumps(service.handle_json(line)) + "\n")
+    fout.flush()
+
+def serve_http(service, host, port, num_threads):
+  ''' Answer POST requests with a JSON body, each in its own thread, of which num_threads run at the same time. '''
+  from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+  import threading
+
+  ## at most as many concurrent requests as there are connections to each Elasticsearch host, see -es_maxsize
+  semaphore = threading.BoundedSemaphore(num_threads)
+
+  class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+      body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+      with semaphore:
+        response = service.handle_json(body.decode("utf-8"))
+      data = json.dumps(response).encode("utf-8")
+      self.send_response(response.get("status", 200))
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(data)))
+      self.end_headers()
+      self.wfile.write(data)
+
+  server = ThreadingHTTPServer((host, port), Handler)
+  print("=== Serving on http://%s:%s ===" % (host, server.server_address[1]))
+  server.serve_forever()
+
+def main(args):
+  if args.dataset not in SETRANK_MODULES:
+    print("[ERROR] Unsupported dataset: %s" % args.dataset)
+    return 1
+
+  ## JSON lines are answered on stdout, so everything printed goes to stderr, e.g., the rank aggregation log
+  fout = sys.stdout
+  sys.stdout = sys.stderr
+
+  setRank_module = importlib.import_module(SETRANK_MODULES[args.dataset][0])
+  if not args.kb:
+    args.kb = DEFAULT_KB[args.dataset]
+  kb = setRank_module.load_kb(args)
+  params = setRank_module.FLAGS_DEFAULT_PARAMS if not args.params else args.params
+  params = {ele.split(":")[0]: float(ele.split(":")[1]) for ele in params.split(",")}
+  index_name = setRank_module.FLAGS_INDEX_NAME if not args.index else args.index
+
+  service = SetRankService(args.dataset, kb, params, index_name)
+  service.warm_up()
+  print("=== Loaded %s KB entities, searching index %s ===" % (len(kb), index_name))
+
+  try:
+    if int(args.port) > 0:
+      serve_http(service, args.host, int(args.port), int(args.threads))
+    else:
+      serve_lines(service, sys.stdin, fout)
+  finally:
+    search_templates.delete_templates(es_client.get_es())
+  return 0
+
+if __name__ == "__main__":
+  # Example usage: python3 setRank_service.py -dataset s2 < queries.json > results.json
+  #                python3 setRank_service.py -dataset s2 -port 8080
+  parser = argparse.ArgumentParser(prog='setRank_service.py', description='Answer setRank queries in a long-running '
+                                                                          'process.')
+  parser.add_argument('-dataset', required=False, default="s2", help="'s2' or 'trec'")
+  parser.add_argument('-kb', required=False, default="", help="File name of the KB, defaults to the dataset's KB.")
+  parser.add_argument('-params', required=False, default="",
+                      help="default parameters of the model, defaults to those of setRank_ESR.py or setRank_TREC.py")
+  parser.add_argument('-index', required=False, default="", help="name of the index to search")
+  parser.add_argument('-port', required=False, default=0,
+                      help="port of the HTTP server, 0 to read JSON lines from stdin and answer them on stdout")
+  parser.add_argument('-host', required=False, default="localhost", help="address the HTTP server binds to")
+  parser.add_argument('-threads', required=False, default=16, help="number of HTTP requests answered concurrently")
+  es_client.add_arguments(parser)
+  setrank_script.add_arguments(parser)
+  args = parser.parse_args()
+  es_client.configure_from_args(args, concurrency=int(args.threads))
+  setrank_script.configure_from_args(args)
+  sys.exit(main(args))
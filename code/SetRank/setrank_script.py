@@ -0,0 +1,109 @@
+'''
+__author__: Jiaming Shen
+__description__: Store the SetRank rescore scripts in Elasticsearch, such that search requests refer to the script
+  by its id and only send its params, instead of sending (and having ES parse and look up) the full script source
+  with every request. The id contains a hash of the source, so a changed script is stored under a new id.
+  Storing Groovy scripts requires "script.stored: true" in elasticsearch.yml; if ES refuses to store a script,
+  the requests fall back to the inline script.
+  With -scorer native, the requests instead use the native SetRank scoring function of the Elasticsearch plugin in
+  ./plugin, which computes the same score from the same params.
+'''
+import argparse
+import hashlib
+import importlib
+import sys
+
+import es_client
+
+SETRANK_MODULES = {"s2": "setRank_ESR", "trec": "setRank_TREC"}
+SCRIPT_LANG = "groovy" # The scripts read term statistics with _index[field][term], which Painless does not support
+NATIVE_LANG = "setrank" # The script language of the native scoring plugin, whose only script is also "setrank"
+SCORERS = ("groovy", "native")
+
+_stored = {} # script id -> whether the script is stored in ES
+_scorer = "groovy" # scorer set by configure()
+
+
+def configure(scorer="groovy"):
+  ''' Select the scorer of the rescore queries, "groovy" for the rescore script, "native" for the scoring plugin. '''
+  global _scorer
+  if scorer not in SCORERS:
+    raise ValueError("Unsupported scorer: %s" % scorer)
+  _scorer = scorer
+
+def add_arguments(parser):
+  ''' Add the -scorer argument of configure_from_args() to an argparse parser. '''
+  parser.add_argument('-scorer', required=False, default="groovy", choices=SCORERS,
+                      help="'groovy' for the rescore script, 'native' for the SetRank scoring plugin")
+
+def configure_from_args(args):
+  configure(args.scorer)
+
+
+def script_id(name, source):
+  return "%s_%s" % (name, hashlib.sha1(source.encode("utf-8")).hexdigest()[:12])
+
+def store_script(es, name, source, lang=SCRIPT_LANG):
+  ''' Store a script in ES unless it is already stored.
+
+  :return: the id of the stored script
+  '''
+  from elasticsearch import NotFoundError
+  sid = script_id(name, source)
+  try:
+    es.get_script(lang=lang, id=sid)
+  except NotFoundError:
+    es.put_script(lang=lang, id=sid, body={"script": source})
+  return sid
+
+def script(name, source, params, stored=True, lang=SCRIPT_LANG):
+  ''' Return the script of the SetRank script_score function, which refers to the native scorer if it is selected by
+  configure(), or else to the script given by its source, see groovy_script().
+  '''
+  if _scorer == "native":
+    return {"lang": NATIVE_LANG, "inline": NATIVE_LANG, "params": params}
+  return groovy_script(name, source, params, stored=stored, lang=lang)
+
+def groovy_script(name, source, params, stored=True, lang=SCRIPT_LANG):
+  ''' Return a script which refers to the stored script if possible.
+
+  The script is stored on its first use in this process.
+
+  :param name: name of the script, e.g., "setrank_s2"
+  :param source: source of the script
+  :param params: params of the script
+  :param stored: False to always send the script inline
+  '''
+  if stored:
+    sid = script_id(name, source)
+    if sid not in _stored:
+      from elasticsearch import ConnectionError, TransportError
+      try:
+        store_script(es_client.get_es(), name, source, lang)
+        _stored[sid] = True
+      except ConnectionError:
+        raise
+      except TransportError as e:
+        print("[WARNING] Cannot store script %s, sending it inline: %s" % (sid, e))
+        _stored[sid] = False
+    if _stored[sid]:
+      return {"stored": sid, "lang": lang, "params": params}
+  return {"lang": lang, "params": params, "inline": source}
+
+def main(args):
+  if args.dataset not in SETRANK_MODULES:
+    print("[ERROR] Unsupported dataset: %s" % args.dataset)
+    return 1
+  setRank_module = importlib.import_module(SETRANK_MODULES[args.dataset])
+  sid = store_script(es_client.get_es(), setRank_module.RESCORE_SCRIPT_NAME, setRank_module.RESCORE_SCRIPT)
+  print("=== Stored script %s (%s characters) ===" % (sid, len(setRank_module.RESCORE_SCRIPT)))
+  return 0
+
+if __name__ == "__main__":
+  # Example usage: python3 setrank_script.py -dataset s2
+  parser = argparse.ArgumentParser(prog='setrank_script.py', description='Store the SetRank rescore script in ES.')
+  parser.add_argument('-dataset', required=False, default="s2", help="'s2' or 'trec'")
+  es_client.add_arguments(parser)
+  args = parser.parse_args()
+  es_client.configure_from_args(args)
+  sys.exit(main(args))
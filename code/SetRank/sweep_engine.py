@@ -0,0 +1,164 @@
+'''
+__author__: Jiaming Shen
+__description__: Score all candidate parameters of autoSetRank in a single pass over the rescore window of a query.
+  Instead of one search per parameter, each of which walks the same window and reads the same term frequencies, one
+  search returns the term frequencies and field lengths of the documents in the window (as a script field), and the
+  SetRank score of every document under every parameter is computed locally with NumPy.
+  All parameters share the window of the retrieval query of the first parameter, so a parameter with other retrieval
+  weights may rank documents that its own search would have cut off, and tied scores are ordered by the retrieval
+  rank instead of the Lucene document id.
+'''
+import numpy as np
+
+import es_client
+import hit_fields
+import setrank_script
+
+CHUNK_SIZE = 64 # Number of parameters scored at once, which bounds the memory to CHUNK_SIZE x window x terms floats
+STATS_SCRIPT_NAME = "setrank_stats"
+STATS_SCRIPT = """
+            stats = [:];
+            for (String space : ["entity", "word"]) {;
+              terms = (space == "entity") ? entities : words;
+              fields = (space == "entity") ? entity_fields : word_fields;
+              tfs = []; // indexed by [term][field]
+              ttfs = [];
+              for (int i = 0; i < terms.size(); ++i) {;
+                term_tfs = [];
+                term_ttfs = [];
+                for (int k = 0; k < fields.size(); ++k) {;
+                  term_tfs.add(_index[fields[k]][terms[i]].tf());
+                  term_ttfs.add(_index[fields[k]][terms[i]].ttf());
+                };
+                tfs.add(term_tfs);
+                ttfs.add(term_ttfs);
+              };
+              lengths = [];
+              for (int k = 0; k < fields.size(); ++k) {;
+                lengths.add(doc[fields[k] + "_length"].value);
+              };
+              stats[space + "_tfs"] = tfs;
+              stats[space + "_ttfs"] = ttfs;
+              stats[space + "_lengths"] = lengths;
+            };
+            return stats;
+          """
+
+
+def fetch_window(index_name, type_name, id_field, retrieval_query, rescore_params, window_size, request_timeout,
+                 search_type=None):
+  ''' Retrieve the window of a query with the term frequencies and field lengths of its documents.
+
+  :param rescore_params: the params of the rescore script, see generate_rescore_params() of setRank_ESR.py
+  :return: (list of document ids in retrieval order, dict of "<space>_tfs" -> (documents x terms x fields) array,
+            "<space>_lengths" -> (documents x fields) array and "<space>_ttfs" -> (terms x fields) array of the shard
+            holding the first document, for the spaces "entity" and "word")
+  '''
+  script_params = {name: rescore_params[name] for name in ["entities", "entity_fields", "words", "word_fields"]}
+  search_body = {
+    "size": window_size,
+    "query": retrieval_query,
+    "script_fields": {
+      "setrank_stats": {"script": setrank_script.groovy_script(STATS_SCRIPT_NAME, STATS_SCRIPT, script_params)}
+    }
+  }
+  hit_fields.id_only(search_body, id_field)
+  kwargs = {"search_type": search_type} if search_type else {}
+  res = es_client.get_es().search(index=index_name, doc_type=type_name, body=search_body,
+                                  request_timeout=request_timeout, **kwargs)
+
+  hits = res["hits"]["hits"]
+  docnos = [hit_fields.hit_id(hit, id_field) for hit in hits]
+  doc_stats = [hit["fields"]["setrank_stats"][0] for hit in hits]
+  stats = {}
+  for space, terms, fields in [("entity", script_params["entities"], script_params["entity_fields"]),
+                               ("word", script_params["words"], script_params["word_fields"])]:
+    stats[space + "_tfs"] = np.array([s[space + "_tfs"] for s in doc_stats], dtype=np.float64).reshape(
+      len(hits), len(terms), len(fields))
+    stats[space + "_lengths"] = np.array([s[space + "_lengths"] for s in doc_stats], dtype=np.float64).reshape(
+      len(hits), len(fields))
+    stats[space + "_ttfs"] = np.array(doc_stats[0][space + "_ttfs"] if hits else [], dtype=np.float64).reshape(
+      len(terms), len(fields))
+  return docnos, stats
+
+def space_scores(tfs, lengths, ttfs, variants, space):
+  ''' The score of one space, as computed by the rescore script, for every parameter and document.
+
+  :param tfs: (documents x terms x fields) array of term frequencies
+  :param lengths: (documents x fields) array of field lengths
+  :param ttfs: (terms x fields) array of total term frequencies
+  :param variants: the params of the rescore script of every parameter
+  :param space: "entity" or "word"
+  :return: a (parameters x documents) array
+  '''
+  num_docs, num_terms, num_fields = tfs.shape
+  if num_terms == 0:
+    return np.zeros((len(variants), num_docs))
+  counts = np.array(variants[0][space + "_query_counts"], dtype=np.float64)
+  weights = np.array([v[space + "_field_relative_weights"] for v in variants], dtype=np.float64)
+  mus = np.array([v[space + "_field_mus"] for v in variants], dtype=np.float64)
+  length_sums = np.array([v[space + "_field_length_sums"] for v in variants], dtype=np.float64)
+  interactions = np.array([v[space + "_interactions"] for v in variants], dtype=np.float64)
+  consider_set = np.array([v["consider_%s_set" % space] > 0 for v in variants], dtype=np.float64)
+
+  ## base score of each term: sqrt(sum_k weight_k * (tf_d + mu_k * tf_D / L_D) / (L_d + mu_k))
+  field_factors = weights[:, None, :] / (lengths[None, :, :] + mus[:, None, :]) # parameters x documents x fields
+  smoothed_ttfs = mus[:, None, :] * (ttfs[None, :, :] / length_sums[:, None, :]) # parameters x terms x fields
+  base_scores = np.sqrt(np.matmul(field_factors.transpose(1, 0, 2), tfs.transpose(0, 2, 1)).transpose(1, 0, 2) +
+                        np.matmul(field_factors, smoothed_ttfs.transpose(0, 2, 1))) # parameters x documents x terms
+
+  ## weight of each term: its query count, plus its interactions with the other terms present in the document
+  exists = (tfs > 0).any(axis=2) # documents x terms
+  set_scores = base_scores * (exists * counts)[None, :, :]
+  term_weights = counts + consider_set[:, None, None] * np.matmul(set_scores, interactions.transpose(0, 2, 1))
+  return (term_weights * base_scores).sum(axis=2)
+
+def score_variants(stats, variants):
+  ''' The SetRank score of every document in the window for every parameter.
+
+  :param stats: the stats of fetch_window()
+  :param variants: the params of the rescore script of every parameter, which must share the query terms and fields
+  :return: a (parameters x documents) float32 array, the precision of Elasticsearch scores
+  '''
+  num_docs = stats["entity_tfs"].shape[0]
+  scores = np.empty((len(variants), num_docs), dtype=np.float32)
+  for start in range(0, len(variants), CHUNK_SIZE):
+    chunk = variants[start:start + CHUNK_SIZE]
+    entity_lambdas = np.array([v["entity_lambda"] for v in chunk], dtype=np.float64)
+    total_scores = np.zeros((len(chunk), num_docs))
+    for space, space_weights in [("entity", entity_lambdas), ("word", 1.0 - entity_lambdas)]:
+      ## global ttfs of sharded indices are given by the params, and else read from the shard
+      ttfs = stats[space + "_ttfs"]
+      if chunk[0][space + "_field_ttfs"]:
+        ttfs = np.array(chunk[0][space + "_field_ttfs"], dtype=np.float64).reshape(ttfs.shape)
+      total_scores += space_weights[:, None] * space_scores(stats[space + "_tfs"], stats[space + "_lengths"], ttfs,
+                                                             chunk, space)
+    scores[start:start + len(chunk)] = total_scores
+  return scores
+
+def top_k(docnos, scores, k):
+  ''' The k best documents of every parameter, ties by retrieval rank. '''
+  order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+  return [[docnos[i] for i in row] for row in order]
+
+def sweep(setRank_module, query_words_string, query_entities_string, kb, params_set, index_name, global_ttfs=None,
+          topk=20, window_size=1000, request_timeout=600, DEBUG=False):
+  ''' Rank the window of a query with every parameter of params_set, like one rescore search per parameter.
+
+  :param setRank_module: setRank_ESR or setRank_TREC
+  :return: a list of document id rankings, one per parameter
+  '''
+  variants = [setRank_module.generate_rescore_params(query_words_string, query_entities_string, kb, params,
+                                                     DEBUG=DEBUG, global_ttfs=global_ttfs) for params in params_set]
+  for variant in variants[1:]:
+    for name in ["entities", "entity_query_counts", "entity_fields", "words", "word_query_counts", "word_fields"]:
+      if variant[name] != variants[0][name]:
+        raise ValueError("Parameters differ in %s, which must be the same for all parameters" % name)
+
+  retrieval_query = setRank_module.generate_retrieval_query(
+    query_string=query_words_string, entity_string=query_entities_string, field_weights=params_set[0], DEBUG=DEBUG
+  )
+  docnos, stats = fetch_window(index_name, setRank_module.FLAGS_TYPE_NAME, setRank_module.FLAGS_ID_FIELD,
+                               retrieval_query, variants[0], window_size, request_timeout,
+                               search_type="dfs_query_then_fetch" if global_ttfs is not None else None)
+  return top_k(docnos, score_variants(stats, variants), topk)
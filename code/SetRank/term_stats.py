@@ -0,0 +1,91 @@
+'''
+__author__: Jiaming Shen
+__description__: Collection statistics of an index which are global across its shards.
+  The rescore script reads the total term frequency with _index[field][term].ttf(), which is computed on the
+  shard holding the document. On a multi-shard index this changes the rankings, so for such indices we sum the
+  per-shard ttf of each query term once and pass it to the script as a parameter.
+'''
+
+_num_shards_cache = {} # index name -> number of shards
+_routings_cache = {} # index name -> a list of routing values, one hitting each shard
+_ttf_cache = {} # (index name, field, term) -> global total term frequency
+
+def number_of_shards(es, index_name):
+  ''' Return the number of primary shards of an index.
+  '''
+  if index_name not in _num_shards_cache:
+    res = es.indices.get_settings(index=index_name)
+    # the index name may be an alias, so take the settings of the only concrete index
+    settings = list(res.values())[0]["settings"]["index"]
+    _num_shards_cache[index_name] = int(settings["number_of_shards"])
+  return _num_shards_cache[index_name]
+
+def is_sharded(es, index_name):
+  return number_of_shards(es, index_name) > 1
+
+def shard_routings(es, index_name, max_tries=1000):
+  ''' Find one routing value for each shard of the index.
+
+  :return: a list of routing values, the i-th of which routes to a different shard than the others
+  '''
+  if index_name not in _routings_cache:
+    num_shards = number_of_shards(es, index_name)
+    shard2routing = {}
+    for r in range(max_tries):
+      res = es.search_shards(index=index_name, routing=str(r))
+      shard = res["shards"][0][0]["shard"]
+      if shard not in shard2routing:
+        shard2routing[shard] = str(r)
+        if len(shard2routing) == num_shards:
+          break
+    if len(shard2routing) != num_shards:
+      raise RuntimeError("Only found routing values for %s of %s shards of index %s" %
+                         (len(shard2routing), num_shards, index_name))
+    _routings_cache[index_name] = [shard2routing[shard] for shard in sorted(shard2routing)]
+  return _routings_cache[index_name]
+
+def global_ttfs(es, index_name, type_name, field_terms, request_timeout=180):
+  ''' Obtain the total term frequency of each (field, term) summed over all shards of the index.
+
+  Per-shard statistics come from the term vectors of an artificial document, routed to each shard in turn.
+  Terms are looked up as they are, just like _index[field][term] in the rescore script. A term which is
+  changed by the field's analyzer (e.g., upper case words in a text field) is not in the index and has a zero ttf.
+
+  :param field_terms: a dict of field name -> list of terms
+  :return: a dict of (field, term) -> ttf
+  '''
+  ttfs = {}
+  missing = {}
+  for field, terms in field_terms.items():
+    for term in terms:
+      if (field, term) in ttfs:
+        continue
+      key = (index_name, field, term)
+      if key in _ttf_cache:
+        ttfs[(field, term)] = _ttf_cache[key]
+      else:
+        missing.setdefault(field, []).append(term)
+        ttfs[(field, term)] = 0
+
+  if missing:
+    body = {
+      "doc": {field: " ".join(terms) for field, terms in missing.items()},
+      "fields": list(missing.keys()),
+      "term_statistics": True,
+      "field_statistics": False,
+      "positions": False,
+      "offsets": False
+    }
+    for routing in shard_routings(es, index_name):
+      res = es.termvectors(index=index_name, doc_type=type_name, body=body, routing=routing,
+                           request_timeout=request_timeout)
+      for field, terms in missing.items():
+        term_infos = res.get("term_vectors", {}).get(field, {}).get("terms", {})
+        for term in terms:
+          if term in term_infos:
+            ttfs[(field, term)] += term_infos[term].get("ttf", 0)
+    for field, terms in missing.items():
+      for term in terms:
+        _ttf_cache[(index_name, field, term)] = ttfs[(field, term)]
+
+  return ttfs
@@ -0,0 +1,131 @@
+'''
+__author__: Jiaming Shen
+__description__: Check that setRank returns the same rankings on a multi-shard index as on the single shard
+  reference index, e.g., after re-creating the index with create_index_ESR.py -shards 4 -index s2_sharded.
+  On the multi-shard index, setRank rescores the global window of the retrieval query rather than a window per shard
+  (see rescore_window.window_query()), so both indices rescore the same documents, except when documents tied in
+  retrieval score straddle the window cutoff.
+  With -reference_scorer, the reference index is searched with another scorer, e.g., to check the native scoring
+  plugin (-scorer native) against the Groovy script on the same index.
+'''
+import argparse
+import importlib
+import sys
+
+import es_client
+import hit_fields
+import setrank_script
+
+SETRANK_MODULES = {"s2": "setRank_ESR", "trec": "setRank_TREC"}
+DEFAULT_QUERY = {"s2": "../../data/S2-CS/s2_query.json", "trec": "../../data/TREC-BIO/trec_query.json"}
+DEFAULT_KB = {"s2": "../../data/S2-CS/s2_entity_type.tsv", "trec": "../../data/TREC-BIO/trec_entity_type.tsv"}
+
+def run_queries(setRank_module, queries, kb, params, index_name):
+  ''' Run setRank on every query against one index.
+
+  :return: a dict of query id -> list of (document id, score)
+  '''
+  results = {}
+  for query in queries:
+    query_id = query[0]
+    query_string = query[1]
+    query_entities_list = []
+    for k, v in query[2].items():
+      for i in range(v):
+        query_entities_list.append(k)
+    query_entities_string = " ".join(query_entities_list)
+
+    res = setRank_module.setRank(query_string, query_entities_string, kb, params, index_name=index_name)
+    results[query_id] = [(hit_fields.hit_id(hit, setRank_module.FLAGS_ID_FIELD), hit["_score"]) for hit in res['hits']['hits']]
+  return results
+
+def compare_ranking(reference, candidate, tolerance):
+  ''' Compare two rankings of the same query.
+
+  Scores must agree position by position. The sets of returned documents must be the same, except for documents
+  tied with the last returned score, which may be cut off differently.
+
+  :param reference: list of (document id, score)
+  :param candidate: list of (document id, score)
+  :param tolerance: maximum relative score difference
+  :return: a list of error messages, empty if the rankings agree
+  '''
+  errors = []
+  if len(reference) != len(candidate):
+    errors.append("returned %s documents instead of %s" % (len(candidate), len(reference)))
+
+  for rank, ((ref_doc, ref_score), (cand_doc, cand_score)) in enumerate(zip(reference, candidate)):
+    if abs(ref_score - cand_score) > tolerance * max(abs(ref_score), abs(cand_score), 1e-12):
+      errors.append("score at rank %s is %s instead of %s" % (rank + 1, cand_score, ref_score))
+
+  if reference and candidate:
+    cutoff_score = min(reference[-1][1], candidate[-1][1])
+    def is_tied(score):
+      return abs(score - cutoff_score) <= tolerance * max(abs(cutoff_score), 1e-12)
+    ref_docs = {doc for doc, score in reference if not is_tied(score)}
+    cand_docs = {doc for doc, score in candidate if not is_tied(score)}
+    if ref_docs != cand_docs:
+      errors.append("documents %s are only in the reference, documents %s are only in the candidate" %
+                    (sorted(ref_docs - cand_docs), sorted(cand_docs - ref_docs)))
+  return errors
+
+def main(args):
+  if args.dataset not in SETRANK_MODULES:
+    print("[ERROR] Unsupported dataset: %s" % args.dataset)
+    return 1
+  setRank_module = importlib.import_module(SETRANK_MODULES[args.dataset])
+  ## unset arguments default to those of the dataset
+  if not args.reference:
+    args.reference = setRank_module.FLAGS_INDEX_NAME
+  if not args.query:
+    args.query = DEFAULT_QUERY[args.dataset]
+  if not args.kb:
+    args.kb = DEFAULT_KB[args.dataset]
+  if not args.params:
+    args.params = setRank_module.FLAGS_DEFAULT_PARAMS
+  queries = setRank_module.load_query(args)
+  kb = setRank_module.load_kb(args)
+  params = {ele.split(":")[0]: float(ele.split(":")[1]) for ele in args.params.split(",")}
+
+  for index_name in [args.reference, args.candidate]:
+    print("Index %s has %s shards" % (index_name, setRank_module.term_stats.number_of_shards(es_client.get_es(), index_name)))
+  setrank_script.configure(args.reference_scorer if args.reference_scorer else args.scorer)
+  reference_results = run_queries(setRank_module, queries, kb, params, args.reference)
+  setrank_script.configure(args.scorer)
+  candidate_results = run_queries(setRank_module, queries, kb, params, args.candidate)
+
+  num_mismatch = 0
+  for query in queries:
+    query_id = query[0]
+    errors = compare_ranking(reference_results[query_id], candidate_results[query_id], float(args.tolerance))
+    if errors:
+      num_mismatch += 1
+      for error in errors:
+        print("[ERROR] Query %s: %s" % (query_id, error))
+
+  print("=== %s of %s queries match ===" % (len(queries) - num_mismatch, len(queries)))
+  return 1 if num_mismatch > 0 else 0
+
+if __name__ == "__main__":
+  # Example usage: python3 verify_sharding.py -dataset s2 -reference s2 -candidate s2_sharded
+  #                python3 verify_sharding.py -dataset s2 -reference s2 -candidate s2 -reference_scorer groovy -scorer native
+  parser = argparse.ArgumentParser(prog='verify_sharding.py',
+                                   description='Compare setRank results on a sharded index against a reference index.')
+  parser.add_argument('-dataset', required=False, default="s2", help="'s2' or 'trec'")
+  parser.add_argument('-reference', required=False, default="",
+                      help='name of the single shard reference index, defaults to the index of the dataset')
+  parser.add_argument('-candidate', required=True, help='name of the multi-shard index to check')
+  parser.add_argument('-query', required=False, default="",
+                      help="File name of test queries, defaults to the queries of the dataset.")
+  parser.add_argument('-kb', required=False, default="", help="File name of the KB, defaults to the dataset's KB.")
+  parser.add_argument('-params', required=False, default="",
+                      help="tunable parameters in our model, defaults to those of setRank_ESR.py or setRank_TREC.py")
+  parser.add_argument('-reference_scorer', required=False, default="",
+                      help="scorer of the reference index, defaults to -scorer")
+  parser.add_argument('-tolerance', required=False, default=1e-5, help='maximum relative score difference')
+  es_client.add_arguments(parser)
+  setrank_script.add_arguments(parser)
+  args = parser.parse_args()
+  es_client.configure_from_args(args)
+  setrank_script.configure_from_args(args)
+  sys.exit(main(args))
@@ -5,13 +5,17 @@ __description__: Search data with different similarity modules
 
 import argparse
 import json
+import os
 import sys
-from elasticsearch import Elasticsearch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "SetRank"))
+import es_client
+import hit_fields
 
 
 INDEX_NAME = None
 TYPE_NAME = None
-es = Elasticsearch()
+ID_FIELD = "docno" # The document id field, the only field retrieved of each hit
 
 def load_query():
   with open("../../../data/S2-CS/s2_query.json", "r") as fin:
@@ -27,11 +31,12 @@ def save_results(sim, results, mode):
       fout.write("\t".join(ele)+"\n")
 
 
-def search_data(query_string, entity_string, field_weights, topk, mode):
+def search_data(query_string, entity_string, field_weights, topk, mode, explain=False):
   '''
   :param query: (currently) a raw input string
   :param field_weights: a dict: {"title": 16, "abstract": 3, "keyphrase": 16}
   :param topk, top k number of results
+  :param explain: True to also return the explanation of the score of each hit
   :return: a ranked results
   '''
   if(mode == 'word'):
@@ -83,7 +88,8 @@ def search_data(query_string, entity_string, field_weights, topk, mode):
           print('please enter a correct mode')
           sys.exit(0)
 
-  res = es.search(index=INDEX_NAME, request_timeout=180, body=search_body)
+  hit_fields.id_only(search_body, ID_FIELD, explain=explain)
+  res = es_client.get_es().search(index=INDEX_NAME, request_timeout=180, body=search_body)
   return res
 
 
@@ -95,7 +101,11 @@ if __name__ == "__main__":
   parser.add_argument('-field_weights', required=False, default="title:16,abstract:3,keyphrase:16,"
                               "title_ana:16,abstract_ana:3,keyphrase_ana:16,bodytext_ana:1",
                       help="Relative weights of each field")
+  parser.add_argument('-explain', required=False, action='store_true',
+                      help="also write the explanation of the score of each hit to <run file>.explain as JSON lines")
+  es_client.add_arguments(parser)
   args = parser.parse_args()
+  es_client.configure_from_args(args)
 
   SIM_MODULE_NAME = args.sim  # one of ["tfidf", "bm25", "lm_dir", "lm_jm", "ib"]
   INDEX_NAME = "s2_" + SIM_MODULE_NAME
@@ -103,6 +113,8 @@ if __name__ == "__main__":
 
   queries = load_query()
   result_all = []
+  if args.explain:
+    fout_explain = open("./%s_%s.run.explain" % (SIM_MODULE_NAME, args.mode), "w")
   field_weights = {ele.split(":")[0] : float(ele.split(":")[1]) for ele in args.field_weights.split(",")}
 
   for query in queries:
@@ -116,12 +128,16 @@ if __name__ == "__main__":
 
     print("Running query %s: %s, %s" % (query_id, query_string, query_entities_string))
     res = search_data(query_string=query_string, entity_string=query_entities_string,
-                      field_weights=field_weights, topk=20, mode = args.mode)
+                      field_weights=field_weights, topk=20, mode = args.mode, explain=args.explain)
+    if args.explain:
+      hit_fields.write_explanations(fout_explain, query_id, res['hits']['hits'], ID_FIELD)
     rank = 1
     for hit in res['hits']['hits']:
-      result_all.append([query_id, "Q0", hit["_source"]["docno"], str(rank), str(hit["_score"]), SIM_MODULE_NAME])
+      result_all.append([query_id, "Q0", hit_fields.hit_id(hit, ID_FIELD), str(rank), str(hit["_score"]), SIM_MODULE_NAME])
       rank += 1
 
+  if args.explain:
+    fout_explain.close()
   save_results(SIM_MODULE_NAME, result_all, args.mode)
 
 
@@ -3,15 +3,23 @@ __author__: Jiaming Shen
 __description__: Create index with static mapping in ES 5.4.0 (a.k.a. define schema).
 '''
 
-from elasticsearch import Elasticsearch
 import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "SetRank"))
+import es_client
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog='create_index.py', description='create index with different similarities.')
     parser.add_argument('-sim', required=True, help='name of similarity module')
+    parser.add_argument('-shards', required=False, default=1,
+                        help='number of primary shards, keep this as one if no cluster')
+    es_client.add_arguments(parser)
     args = parser.parse_args()
+    es_client.configure_from_args(args)
 
-    NUMBER_SHARDS = 1  # keep this as one if no cluster
+    NUMBER_SHARDS = int(args.shards)
     NUMBER_REPLICAS = 0
     SIM_MODULE_NAME = args.sim  # one of ["tfidf", "bm25", "lm_dir", "lm_jm", "ib"]
     INDEX_NAME = "trec0405_" + SIM_MODULE_NAME
@@ -107,7 +115,7 @@ if __name__ == '__main__':
         }
     }
 
-    es = Elasticsearch()
+    es = es_client.get_es()
     if es.indices.exists(INDEX_NAME):
         res = es.indices.delete(index = INDEX_NAME)
         print("Deleting index %s , Response: %s" % (INDEX_NAME, res))
@@ -5,12 +5,17 @@ __description__: Search data with different similarity modules
 
 import argparse
 import json
-from elasticsearch import Elasticsearch
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "SetRank"))
+import es_client
+import hit_fields
 
 
 INDEX_NAME = None
 TYPE_NAME = None
-es = Elasticsearch()
+ID_FIELD = "pmid" # The document id field, the only field retrieved of each hit
 
 def load_query():
   with open("../../../data/TREC-BIO/trec_query.json", "r") as fin:
@@ -26,11 +31,12 @@ def save_results(sim, results, mode):
       fout.write("\t".join(ele)+"\n")
 
 
-def search_data(query_string, entity_string, field_weights, topk, mode):
+def search_data(query_string, entity_string, field_weights, topk, mode, explain=False):
   '''
   :param query: (currently) a raw input string
   :param field_weights: a dict: {"title": 16, "abstract": 3, "keyphrase": 16}
   :param topk, top k number of results
+  :param explain: True to also return the explanation of the score of each hit
   :return: a ranked results
   '''
   if(mode == 'word'):
@@ -77,7 +83,8 @@ def search_data(query_string, entity_string, field_weights, topk, mode):
 
 
 
-  res = es.search(index=INDEX_NAME, request_timeout=180, body=search_body)
+  hit_fields.id_only(search_body, ID_FIELD, explain=explain)
+  res = es_client.get_es().search(index=INDEX_NAME, request_timeout=180, body=search_body)
   return res
 
 
@@ -88,7 +95,11 @@ if __name__ == "__main__":
   parser.add_argument('-mode', required=True, help='mode of search')
   parser.add_argument('-field_weights', required=False, default="title:16,abstract:3,title_ana:16,abstract_ana:3",
                       help="Relative weights of each field")
+  parser.add_argument('-explain', required=False, action='store_true',
+                      help="also write the explanation of the score of each hit to <run file>.explain as JSON lines")
+  es_client.add_arguments(parser)
   args = parser.parse_args()
+  es_client.configure_from_args(args)
 
   SIM_MODULE_NAME = args.sim  # one of ["tfidf", "bm25", "lm_dir", "lm_jm", "ib"]
   INDEX_NAME = "trec0405_" + SIM_MODULE_NAME
@@ -96,6 +107,8 @@ if __name__ == "__main__":
 
   queries = load_query()
   result_all = []
+  if args.explain:
+    fout_explain = open("./%s_%s.run.explain" % (SIM_MODULE_NAME, args.mode), "w")
   field_weights = {ele.split(":")[0] : float(ele.split(":")[1]) for ele in args.field_weights.split(",")}
 
   for query in queries:
@@ -109,11 +122,15 @@ if __name__ == "__main__":
 
     print("Running query %s: %s, %s" % (query_id, query_string, query_entities_string))
     res = search_data(query_string=query_string, entity_string=query_entities_string,
-                      field_weights=field_weights, topk=20, mode = args.mode)
+                      field_weights=field_weights, topk=20, mode = args.mode, explain=args.explain)
+    if args.explain:
+      hit_fields.write_explanations(fout_explain, query_id, res['hits']['hits'], ID_FIELD)
     rank = 1
     for hit in res['hits']['hits']:
-      result_all.append([query_id, "Q0", hit["_source"]["pmid"], str(rank), str(hit["_score"]), SIM_MODULE_NAME])
+      result_all.append([query_id, "Q0", hit_fields.hit_id(hit, ID_FIELD), str(rank), str(hit["_score"]), SIM_MODULE_NAME])
       rank += 1
 
+  if args.explain:
+    fout_explain.close()
   save_results(SIM_MODULE_NAME, result_all, args.mode)
 
@@ -0,0 +1,139 @@
+"""Evaluates all runs of a directory (or glob pattern) against the same qrel file in a process pool, and writes
+one combined table with the per-query values and the mean of every run.
+
+The qrel file is parsed and compiled once; the compiled qrel is inherited (or unpickled as a flat buffer) by the worker
+processes, which build their evaluator without converting the qrel again and evaluate runs until all are done.
+With -per_run, the .eval.tsv (and .eval.tmp) file of every run is written as well, as eval.sh does."""
+
+import argparse
+import glob
+import multiprocessing
+import numpy as np
+import os
+import sys
+
+import pytrec_eval
+
+from eval_pipeline import TSV_COLUMNS, TSV_MEASURES, evaluate_run, format_tsv_value, query_id_key, write_trec_eval, \
+    write_tsv
+
+# Evaluator of the current worker process.
+_evaluator = None
+
+
+def find_runs(runs):
+    """Return the sorted .run files of a directory, or the files matching a glob pattern."""
+    if os.path.isdir(runs):
+        return sorted(glob.glob(os.path.join(runs, "*.run")))
+    return sorted(glob.glob(runs))
+
+
+def run_name(run_path):
+    return os.path.splitext(os.path.basename(run_path))[0]
+
+
+def init_worker(qrel, measures):
+    global _evaluator
+    _evaluator = pytrec_eval.RelevanceEvaluator(qrel, measures)
+
+
+def evaluate_run_file(task):
+    """Evaluate one run file in a worker process and optionally save its per-run result files.
+
+    :param task: (run file, output prefix or None, measures of the .eval.tmp file or None)
+    :return: (values, aggregated values)
+    """
+    run_path, out, tmp_measures = task
+
+    values, aggregated_values = evaluate_run(_evaluator, pytrec_eval.parse_run_file(run_path))
+
+    if out is not None:
+        with open(out + ".eval.tsv", "w") as f_out:
+            write_tsv(f_out, _evaluator.query_ids, _evaluator.measure_names, values, aggregated_values)
+        if tmp_measures is not None:
+            with open(out + ".eval.tmp", "w") as f_out:
+                write_trec_eval(f_out, _evaluator.query_ids, _evaluator.measure_names, values, aggregated_values,
+                                tmp_measures)
+
+    return values, aggregated_values
+
+
+def write_combined(f_out, names, query_ids, measure_names, results):
+    """Write one table with a row per run and query, followed by an "all" row with the mean of every run.
+
+    Queries missing from a run have a value of 0, as in the per-run tables.
+    """
+    column_idxs = [measure_names.index(measure) for _, measure in TSV_COLUMNS]
+    query_idxs = sorted(range(len(query_ids)), key=lambda query_idx: query_id_key(query_ids[query_idx]))
+
+    f_out.write("\t".join(["run", "qid"] + [column for column, _ in TSV_COLUMNS]) + "\n")
+    for name, (values, aggregated_values) in zip(names, results):
+        for query_idx in query_idxs:
+            row = np.nan_to_num(values[query_idx, column_idxs])
+            f_out.write("\t".join([name, query_ids[query_idx]] + [format_tsv_value(value) for value in row]) + "\n")
+        f_out.write("\t".join([name, "all"] + [format_tsv_value(value)
+                                                for value in aggregated_values[column_idxs]]) + "\n")
+
+
+def main(args):
+    assert os.path.exists(args.qrel)
+
+    run_paths = find_runs(args.runs)
+    if not run_paths:
+        print("[ERROR] No runs found: %s" % args.runs)
+        return 1
+
+    if args.measures == "all":
+        tmp_measures = pytrec_eval.supported_measures
+    else:
+        tmp_measures = set(args.measures.split(","))
+    write_tmp = args.tmp and args.per_run # .eval.tmp files are written next to the .eval.tsv files
+    measures = TSV_MEASURES | tmp_measures if write_tmp else TSV_MEASURES
+
+    qrel = pytrec_eval.CompiledQrel(pytrec_eval.parse_qrel_file(args.qrel))
+    evaluator = pytrec_eval.RelevanceEvaluator(qrel, measures)
+
+    names = [run_name(run_path) for run_path in run_paths]
+    tasks = []
+    for run_path, name in zip(run_paths, names):
+        out = os.path.join(os.path.dirname(run_path), args.prefix + name) if args.per_run else None
+        tasks.append((run_path, out, tmp_measures if write_tmp else None))
+
+    num_processes = min(int(args.processes) or multiprocessing.cpu_count(), len(tasks))
+    pool = multiprocessing.Pool(num_processes, initializer=init_worker, initargs=(qrel, measures))
+    try:
+        # The order of the results is the order of the runs.
+        results = pool.map(evaluate_run_file, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(args.out, "w") as f_out:
+        write_combined(f_out, names, evaluator.query_ids, evaluator.measure_names, results)
+
+    column_idxs = [evaluator.measure_names.index(measure) for _, measure in TSV_COLUMNS]
+    print("=== Evaluated %s runs with %s processes ===" % (len(run_paths), num_processes))
+    print("\t".join(["run"] + [column for column, _ in TSV_COLUMNS]))
+    for name, (_, aggregated_values) in zip(names, results):
+        print("\t".join([name] + [format_tsv_value(value) for value in aggregated_values[column_idxs]]))
+    return 0
+
+if __name__ == "__main__":
+    # Example usage: python3 eval_dir.py -qrel ../../data/S2-CS/s2.qrel -runs ../../results/s2/baselines \
+    #   -out ../../results/s2/baselines.eval.tsv -per_run -prefix S2_ -tmp
+    parser = argparse.ArgumentParser(prog='eval_dir.py', description='Evaluate many runs in parallel.')
+    parser.add_argument('-qrel', required=True, help='File name of query relevance file.')
+    parser.add_argument('-runs', required=True, help='Directory of .run files, or a glob pattern of run files.')
+    parser.add_argument('-out', required=True, help='File name of the combined result table.')
+    parser.add_argument('-processes', required=False, default=0, help='Number of processes, 0 for one per core.')
+    parser.add_argument('-per_run', required=False, action='store_true',
+                        help='Also save <prefix><run name>.eval.tsv next to every run.')
+    parser.add_argument('-prefix', required=False, default="", help='Prefix of the per-run result files.')
+    parser.add_argument('-tmp', required=False, action='store_true',
+                        help='Also save the output of trec_eval.py of every run as .eval.tmp, requires -per_run.')
+    parser.add_argument('-measures', required=False, default='ndcg_cut,map_cut,success',
+                        help='Evaluation measures of the .eval.tmp files, separated by \',\'.')
+    args = parser.parse_args()
+    if args.tmp and not args.per_run:
+        parser.error('-tmp requires -per_run')
+    sys.exit(main(args))
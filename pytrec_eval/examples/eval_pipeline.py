@@ -0,0 +1,156 @@
+"""Evaluates a run once and writes the compact .eval.tsv table (and optionally
+the trec_eval.py output as .eval.tmp) directly from the evaluated values.
+
+Replaces running trec_eval.py and parsing its output with parse_eval_res.py."""
+
+import argparse
+import numpy as np
+import os
+import sys
+
+import pytrec_eval
+
+from trec_eval import format_line
+
+# (column, measure value) of the compact result table.
+TSV_COLUMNS = [
+    ("map@5", "map_cut_5"),
+    ("map@10", "map_cut_10"),
+    ("map@15", "map_cut_15"),
+    ("map@20", "map_cut_20"),
+    ("ndcg@5", "ndcg_cut_5"),
+    ("ndcg@10", "ndcg_cut_10"),
+    ("ndcg@15", "ndcg_cut_15"),
+    ("ndcg@20", "ndcg_cut_20"),
+    ("success@1", "success_1"),
+    ("success@5", "success_5"),
+    ("success@10", "success_10"),
+]
+
+TSV_MEASURES = {"map_cut", "ndcg_cut", "success"}
+
+
+def query_id_key(query_id):
+    """Sorts numeric query ids numerically and before all other query ids."""
+    return (0, int(query_id), query_id) if query_id.isdigit() else (1, 0, query_id)
+
+
+def format_tsv_value(value):
+    # Same values as parsing the 6 decimals of the trec_eval.py output.
+    return str(round(float(value), 6))
+
+
+def evaluate(qrel, run, measures, num_threads=1):
+    """Evaluates a run on all queries of the relevance judgments.
+
+    :return: (query ids, measure names, a (queries x measures) matrix which is NaN for queries missing from the
+      run, the aggregated value of every measure over the evaluated queries)
+    """
+    evaluator = pytrec_eval.RelevanceEvaluator(qrel, measures, num_threads=num_threads)
+
+    values, aggregated_values = evaluate_run(evaluator, run)
+
+    return evaluator.query_ids, evaluator.measure_names, values, aggregated_values
+
+
+def evaluate_run(evaluator, run):
+    """Evaluates a run with an existing evaluator, see evaluate.
+
+    :return: (values, aggregated values)
+    """
+    values = evaluator.evaluate_many([run])[0]
+    evaluated = ~np.isnan(values).any(axis=1)
+
+    aggregated_values = pytrec_eval.compute_aggregated_measures(
+        evaluator.measure_names, values[evaluated])
+
+    return values, aggregated_values
+
+
+def write_tsv(f_out, query_ids, measure_names, values, aggregated_values):
+    """Writes the compact table with a row per query, ordered by query id, and a final "all" row.
+
+    Queries missing from the run have a value of 0.
+    """
+    column_idxs = [measure_names.index(measure) for _, measure in TSV_COLUMNS]
+
+    f_out.write("\t".join(["qid"] + [column for column, _ in TSV_COLUMNS]) + "\n")
+
+    query_idxs = sorted(range(len(query_ids)), key=lambda query_idx: query_id_key(query_ids[query_idx]))
+
+    for query_idx in query_idxs:
+        row = np.nan_to_num(values[query_idx, column_idxs])
+        f_out.write("\t".join([query_ids[query_idx]] + [format_tsv_value(value) for value in row]) + "\n")
+
+    row = aggregated_values[column_idxs]
+    f_out.write("\t".join(["all"] + [format_tsv_value(value) for value in row]) + "\n")
+
+
+def is_value_of(measure_name, measures):
+    """Whether a measure name is one of the measures, or one of the values of a parametrized measure (e.g., ndcg_cut_5)."""
+    if measure_name in measures:
+        return True
+    measure, _, param = measure_name.rpartition("_")
+    try:
+        float(param)
+    except ValueError:
+        return False
+    return measure in measures
+
+
+def write_trec_eval(f_out, query_ids, measure_names, values, aggregated_values, measures):
+    """Writes the output of trec_eval.py for the given subset of measures."""
+    measure_idxs = sorted(
+        [measure_idx for measure_idx, measure_name in enumerate(measure_names) if is_value_of(measure_name, measures)],
+        key=lambda measure_idx: measure_names[measure_idx])
+
+    for query_idx, query_id in enumerate(query_ids):
+        if np.isnan(values[query_idx]).any():
+            continue
+
+        for measure_idx in measure_idxs:
+            f_out.write(format_line(measure_names[measure_idx], query_id, values[query_idx, measure_idx]) + "\n")
+
+    for measure_idx in measure_idxs:
+        f_out.write(format_line(measure_names[measure_idx], 'all', aggregated_values[measure_idx]) + "\n")
+
+
+def main(args):
+    assert os.path.exists(args.qrel)
+    assert os.path.exists(args.run)
+
+    qrel = pytrec_eval.parse_qrel_file(args.qrel)
+    run = pytrec_eval.parse_run_file(args.run)
+
+    if args.measures == "all":
+        tmp_measures = pytrec_eval.supported_measures
+    else:
+        tmp_measures = set(args.measures.split(","))
+
+    measures = TSV_MEASURES | tmp_measures if args.tmp else TSV_MEASURES
+
+    query_ids, measure_names, values, aggregated_values = evaluate(
+        qrel, run, measures, num_threads=int(args.threads))
+
+    with open(args.out + ".eval.tsv", "w") as f_out:
+        write_tsv(f_out, query_ids, measure_names, values, aggregated_values)
+
+    if args.tmp:
+        with open(args.out + ".eval.tmp", "w") as f_out:
+            write_trec_eval(f_out, query_ids, measure_names, values, aggregated_values, tmp_measures)
+
+if __name__ == "__main__":
+    # Example usage: python3 eval_pipeline.py -qrel ./XXX.qrel -run ./YYY.run -out ../../results/YYY -tmp
+    parser = argparse.ArgumentParser(prog='eval_pipeline.py',
+                                     description='Evaluate a run and save the compact result table.')
+    parser.add_argument('-qrel', required=True, help='File name of query relevance file.')
+    parser.add_argument('-run', required=True, help='File name of each method\'s run.')
+    parser.add_argument('-out', required=True,
+                        help='Prefix of the output files, the table is saved as <out>.eval.tsv.')
+    parser.add_argument('-tmp', required=False, action='store_true',
+                        help='Also save the output of trec_eval.py as <out>.eval.tmp.')
+    parser.add_argument('-measures', required=False, default='ndcg_cut,map_cut,success',
+                        help='Evaluation measures of the .eval.tmp file, separated by \',\'.')
+    parser.add_argument('-threads', required=False, default=1, help='Number of threads that evaluate queries.')
+    args = parser.parse_args()
+    sys.exit(main(args))
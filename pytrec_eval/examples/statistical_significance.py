@@ -1,54 +1,81 @@
-"""Demonstrates how statistical significance tests can be ran using pytrec_eval."""
+"""Demonstrates how statistical significance tests can be ran using pytrec_eval.
+
+All runs are compared against the first one, e.g.,
+
+    python statistical_significance.py s2.qrel setRank.run baselines/*.run \\
+        --measure ndcg_cut_20
+"""
 
 import argparse
 import os
-import scipy.stats
 import sys
 
 import pytrec_eval
+from pytrec_eval import significance
 
 
 def main():
     parser = argparse.ArgumentParser()
 
     parser.add_argument('qrel')
-    parser.add_argument('run', nargs=2)
+    parser.add_argument('run', nargs='+')
+
+    # Either a supported measure or one of the values of a parametrized
+    # measure (e.g., ndcg_cut_20).
+    parser.add_argument('--measure', required=True)
 
-    # A bit too strict, as it does not allow for parametrized measures,
-    # but sufficient for the example.
-    parser.add_argument('--measure',
-                        choices=pytrec_eval.supported_measures,
-                        required=True)
+    parser.add_argument('--permutations', type=int, default=10000)
+    parser.add_argument('--bootstrap_samples', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
 
     args = parser.parse_args()
 
     assert os.path.exists(args.qrel)
     assert all(map(os.path.exists, args.run))
-
-    with open(args.qrel, 'r') as f_qrel:
-        qrel = pytrec_eval.parse_qrel(f_qrel)
-
-    with open(args.run[0], 'r') as f_run:
-        first_run = pytrec_eval.parse_run(f_run)
-
-    with open(args.run[1], 'r') as f_run:
-        second_run = pytrec_eval.parse_run(f_run)
-
-    evaluator = pytrec_eval.RelevanceEvaluator(
-        qrel, {args.measure})
-
-    first_results = evaluator.evaluate(first_run)
-    second_results = evaluator.evaluate(second_run)
-
-    query_ids = list(
-        set(first_results.keys()) & set(second_results.keys()))
-
-    first_scores = [
-        first_results[query_id][args.measure] for query_id in query_ids]
-    second_scores = [
-        second_results[query_id][args.measure] for query_id in query_ids]
-
-    print(scipy.stats.ttest_rel(first_scores, second_scores))
+    assert len(args.run) >= 2
+
+    if args.measure in pytrec_eval.supported_measures:
+        base_measure = args.measure
+    else:
+        base_measure = args.measure.rsplit('_', 1)[0]
+
+    assert base_measure in pytrec_eval.supported_measures, args.measure
+
+    qrel = pytrec_eval.parse_qrel_file(args.qrel)
+    runs = [pytrec_eval.parse_run_file(run) for run in args.run]
+
+    evaluator = pytrec_eval.RelevanceEvaluator(qrel, {base_measure})
+
+    assert args.measure in evaluator.measure_names, args.measure
+
+    values = evaluator.evaluate_many(runs)[
+        :, :, evaluator.measure_names.index(args.measure)]
+
+    _, t_test_p_values = significance.paired_ttest(values)
+    permutation_p_values = significance.permutation_test(
+        values, num_permutations=args.permutations, seed=args.seed)
+    intervals = significance.bootstrap_ci(
+        values, num_samples=args.bootstrap_samples, seed=args.seed)
+
+    print('{} over {} queries, compared against {}'.format(
+        args.measure,
+        significance.paired_queries(values).shape[1],
+        args.run[0]))
+
+    print('\t'.join(['run', 'mean', '95% CI', 'difference 95% CI',
+                     't-test p', 'permutation p']))
+
+    for run_idx, run in enumerate(args.run):
+        print('\t'.join([
+            os.path.basename(run),
+            '{:.4f}'.format(intervals['mean'][run_idx]),
+            '[{:.4f}, {:.4f}]'.format(intervals['lower'][run_idx],
+                                      intervals['upper'][run_idx]),
+            '[{:.4f}, {:.4f}]'.format(
+                intervals['difference_lower'][0, run_idx],
+                intervals['difference_upper'][0, run_idx]),
+            '{:.4g}'.format(t_test_p_values[0, run_idx]),
+            '{:.4g}'.format(permutation_p_values[0, run_idx])]))
 
 if __name__ == "__main__":
     sys.exit(main())
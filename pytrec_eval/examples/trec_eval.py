@@ -1,51 +1,71 @@
 """Approximately simulates trec_eval using pytrec_eval."""
 
 import argparse
+import numpy as np
 import os
 import sys
 
 import pytrec_eval
 
 
+def format_line(measure, scope, value):
+    """Formats a measure value of a query, or of 'all' queries, like trec_eval."""
+    return '{:25s}{:8s}{:.6f}'.format(measure, scope, value)
+
+
 def main(args):
     assert os.path.exists(args.qrel)
     assert os.path.exists(args.run)
 
-    with open(args.qrel, 'r') as f_qrel:
-        qrel = pytrec_eval.parse_qrel(f_qrel)
-
-    with open(args.run, 'r') as f_run:
-        run = pytrec_eval.parse_run(f_run)
+    qrel = pytrec_eval.parse_qrel_file(args.qrel)
 
     if args.measures == "all":
-        evaluator = pytrec_eval.RelevanceEvaluator(qrel, pytrec_eval.supported_measures)
+        measures = pytrec_eval.supported_measures
     else:
         measures = set(args.measures.split(","))
-        evaluator = pytrec_eval.RelevanceEvaluator(qrel, measures)
-
 
-    results = evaluator.evaluate(run)
+    evaluator = pytrec_eval.RelevanceEvaluator(
+        qrel, measures, num_threads=int(args.threads))
 
     def print_line(measure, scope, value):
-        print('{:25s}{:8s}{:.6f}'.format(measure, scope, value))
-
-    for query_id, query_measures in sorted(results.items()):
-        for measure, value in sorted(query_measures.items()):
-            print_line(measure, query_id, value)
-
-    # Scope hack: use query_measures of last item in previous loop to
-    # figure out all unique measure names.
-    #
-    # TODO(cvangysel): add member to RelevanceEvaluator
-    #                  with a list of measure names.
-    for measure in sorted(query_measures.keys()):
-        print_line(
-            measure,
-            'all',
-            pytrec_eval.compute_aggregated_measure(
-                measure,
-                [query_measures[measure]
-                 for query_measures in results.values()]))
+        print(format_line(measure, scope, value))
+
+    if args.stream:
+        # Per-query rows are printed as soon as the query has been evaluated.
+        measure_names = evaluator.measure_names
+        measure_order = sorted(range(len(measure_names)),
+                               key=lambda measure_idx: measure_names[measure_idx])
+
+        query_values = []
+
+        with open(args.run) as f_run:
+            for query_id, query_value in pytrec_eval.evaluate_stream(evaluator, f_run):
+                for measure_idx in measure_order:
+                    print_line(measure_names[measure_idx], query_id,
+                               query_value[measure_idx])
+
+                query_values.append(query_value)
+
+        values = np.array(query_values).reshape(len(query_values), len(measure_names))
+    else:
+        run = pytrec_eval.parse_run_file(args.run)
+
+        query_ids, measure_names, values = evaluator.evaluate_array(run)
+
+        measure_order = sorted(range(len(measure_names)),
+                               key=lambda measure_idx: measure_names[measure_idx])
+
+        for query_idx, query_id in enumerate(query_ids):
+            for measure_idx in measure_order:
+                print_line(measure_names[measure_idx], query_id,
+                           values[query_idx, measure_idx])
+
+    aggregated_values = pytrec_eval.compute_aggregated_measures(
+        measure_names, values)
+
+    for measure_idx in measure_order:
+        print_line(measure_names[measure_idx], 'all',
+                   aggregated_values[measure_idx])
 
 if __name__ == "__main__":
     # Example usage: python3 -qrel ./XXX.qrel -run ./YYY.run -measures ndcg,map,ndcg_cut,map_cut
@@ -54,5 +74,8 @@ if __name__ == "__main__":
     parser.add_argument('-run', required=True, help='File name of each method\'s run.')
     parser.add_argument('-measures', required=False, default='all', help='Evaluation measures for current run. separated by \',\','
         'please refer to https://github.com/usnistgov/trec_eval for the names of all measures.')
+    parser.add_argument('-stream', required=False, action='store_true',
+        help='Evaluate the run one query at a time instead of loading it entirely, the lines of each query should be contiguous.')
+    parser.add_argument('-threads', required=False, default=1, help='Number of threads that evaluate queries, 0 for one per core.')
     args = parser.parse_args()
     sys.exit(main(args))
@@ -3,17 +3,28 @@
 import collections
 import numpy as np
 
-from pytrec_eval_ext import RelevanceEvaluator, supported_measures
+from pytrec_eval_ext import RelevanceEvaluator, CompiledQrel, \
+    supported_measures, parse_run_file, parse_qrel_file
 
 __all__ = [
     'parse_run',
     'parse_qrel',
+    'parse_run_file',
+    'parse_qrel_file',
+    'iterate_run',
+    'evaluate_stream',
+    'compute_aggregated_measure',
+    'compute_aggregated_measures',
     'supported_measures',
     'RelevanceEvaluator',
+    'CompiledQrel',
 ]
 
 
 def parse_run(f_run):
+    """Parses a run from an iterable of lines.
+
+    parse_run_file parses a run file natively and is much faster."""
     run = collections.defaultdict(dict)
 
     for line in f_run:
@@ -25,7 +36,82 @@ def parse_run(f_run):
     return run
 
 
+def iterate_run(f_run):
+    """Parses a run from an iterable of lines, one query at a time.
+
+    Yields a (query_id, object_scores) pair for every query, in the order of
+    the run. The lines of a query should be contiguous, as is the case for
+    runs sorted by query; otherwise a ValueError is raised. Only the current
+    query is kept in memory."""
+    seen_query_ids = set()
+
+    query_id, object_scores = None, None
+
+    for line in f_run:
+        line_query_id, _, object_id, ranking, score, _ = line.strip().split()
+
+        if line_query_id != query_id:
+            if query_id is not None:
+                yield query_id, object_scores
+
+            if line_query_id in seen_query_ids:
+                raise ValueError(
+                    'Lines of query {} are not contiguous; '
+                    'sort the run by query first.'.format(line_query_id))
+
+            seen_query_ids.add(line_query_id)
+            query_id, object_scores = line_query_id, {}
+
+        if object_id in object_scores:
+            raise ValueError(
+                'Duplicate object {} for query {}.'.format(
+                    object_id, query_id))
+
+        object_scores[object_id] = float(score)
+
+    if query_id is not None:
+        yield query_id, object_scores
+
+
+def evaluate_stream(evaluator, f_run, batch_size=64):
+    """Evaluates a run from an iterable of lines without loading it entirely.
+
+    Queries are parsed with iterate_run and evaluated in batches of
+    batch_size queries, which bounds the memory use. Yields a
+    (query_id, values) pair for every query of the run that occurs in the
+    relevance judgments, in the order of the run, where values holds a value
+    for every entry of evaluator.measure_names."""
+    batch = []
+
+    for query_id, object_scores in iterate_run(f_run):
+        batch.append((query_id, object_scores))
+
+        if len(batch) >= batch_size:
+            for result in _evaluate_batch(evaluator, batch):
+                yield result
+
+            batch = []
+
+    for result in _evaluate_batch(evaluator, batch):
+        yield result
+
+
+def _evaluate_batch(evaluator, batch):
+    if not batch:
+        return
+
+    query_ids, _, values = evaluator.evaluate_array(dict(batch))
+    query_id_to_row = dict(zip(query_ids, values))
+
+    for query_id, _ in batch:
+        if query_id in query_id_to_row:
+            yield query_id, query_id_to_row[query_id]
+
+
 def parse_qrel(f_qrel):
+    """Parses relevance judgments from an iterable of lines.
+
+    parse_qrel_file parses a qrel file natively and is much faster."""
     qrel = collections.defaultdict(dict)
 
     for line in f_qrel:
@@ -47,3 +133,13 @@ def compute_aggregated_measure(measure, values):
         agg_fun = np.mean
 
     return agg_fun(values)
+
+
+def compute_aggregated_measures(measure_names, values):
+    """Aggregates a (queries x measures) matrix, as returned by
+    RelevanceEvaluator.evaluate_array, into one value per measure."""
+    values = np.asarray(values, dtype=np.float64)
+
+    return np.array([
+        compute_aggregated_measure(measure, values[:, measure_idx])
+        for measure_idx, measure in enumerate(measure_names)])
@@ -0,0 +1,189 @@
+"""Lightweight NumPy implementations of ndcg_cut, map_cut and success.
+
+Computes the same values as trec_eval for many rankings at once, e.g., for
+thousands of candidate rankings within a parameter sweep, without converting
+every ranking into trec_eval structures.
+
+Rankings are given as integer matrices of document indices of shape
+(..., queries, depth), obtained with DenseQrel.encode, which are looked up
+in a dense (queries x documents) matrix of relevance judgments."""
+
+import numpy as np
+
+__all__ = [
+    'DenseQrel',
+    'ranked_documents',
+]
+
+DEFAULT_CUTOFFS = (5, 10, 15, 20, 30, 100, 200, 500, 1000)
+
+
+def ranked_documents(object_scores):
+    """Ranks the documents of a query like trec_eval does: by decreasing
+    score, ties broken by decreasing document identifier."""
+    return [object_id for object_id, _ in sorted(
+        object_scores.items(), key=lambda item: (item[1], item[0]),
+        reverse=True)]
+
+
+class DenseQrel(object):
+    """Relevance judgments as a dense (queries x documents) matrix.
+
+    The documents are all judged documents of all queries, followed by a
+    column for unjudged documents (and padding), which are non-relevant."""
+
+    def __init__(self, qrel, relevance_level=1):
+        if relevance_level < 1:
+            raise ValueError('Argument relevance_level should be positive.')
+
+        self.relevance_level = relevance_level
+        self.query_ids = sorted(qrel.keys())
+        self.query_id_to_idx = {
+            query_id: query_idx
+            for query_idx, query_id in enumerate(self.query_ids)}
+
+        self.document_to_idx = {}
+
+        for query_id in self.query_ids:
+            for object_id in qrel[query_id]:
+                self.document_to_idx.setdefault(
+                    object_id, len(self.document_to_idx))
+
+        self.unjudged_idx = len(self.document_to_idx)
+
+        self.relevance = np.zeros(
+            (len(self.query_ids), len(self.document_to_idx) + 1),
+            dtype=np.int64)
+
+        # Relevance levels of the judged documents of every query, best
+        # first, for the ideal rankings.
+        self._ideal_relevance = []
+
+        for query_idx, query_id in enumerate(self.query_ids):
+            for object_id, relevance in qrel[query_id].items():
+                self.relevance[query_idx, self.document_to_idx[object_id]] = \
+                    relevance
+
+            self._ideal_relevance.append(np.array(sorted(
+                (relevance for relevance in qrel[query_id].values()
+                 if relevance > 0),
+                reverse=True), dtype=np.float64))
+
+        self.num_relevant = np.array([
+            sum(1 for relevance in qrel[query_id].values()
+                if relevance >= relevance_level)
+            for query_id in self.query_ids], dtype=np.int64)
+
+    def encode(self, rankings, depth):
+        """Converts the rankings of one or more runs into document indices.
+
+        :param rankings: a dictionary of query id to a list of ranked
+            document ids, or a list of such dictionaries
+        :return: a (queries x depth) matrix of document indices, or a
+            (runs x queries x depth) array for a list of runs, and a boolean
+            mask of the same shape without the last axis, which is True for
+            queries that occur in the run. Rankings are truncated at depth.
+        """
+        if isinstance(rankings, dict):
+            doc_idxs, present = self.encode([rankings], depth)
+
+            return doc_idxs[0], present[0]
+
+        doc_idxs = np.full(
+            (len(rankings), len(self.query_ids), depth), self.unjudged_idx,
+            dtype=np.int64)
+        present = np.zeros((len(rankings), len(self.query_ids)), dtype=bool)
+
+        for run_idx, run_rankings in enumerate(rankings):
+            for query_id, ranking in run_rankings.items():
+                if query_id not in self.query_id_to_idx:
+                    continue
+
+                query_idx = self.query_id_to_idx[query_id]
+                present[run_idx, query_idx] = True
+
+                for rank, object_id in enumerate(ranking[:depth]):
+                    doc_idxs[run_idx, query_idx, rank] = \
+                        self.document_to_idx.get(object_id, self.unjudged_idx)
+
+        return doc_idxs, present
+
+    def ideal_dcg(self, cutoffs):
+        """The (queries x cutoffs) matrix of ideal discounted cumulative gains."""
+        result = np.zeros((len(self.query_ids), len(cutoffs)))
+
+        for query_idx, ideal_relevance in enumerate(self._ideal_relevance):
+            cumulative_gain = np.cumsum(
+                ideal_relevance / np.log2(np.arange(len(ideal_relevance)) + 2))
+
+            for cutoff_idx, cutoff in enumerate(cutoffs):
+                if len(cumulative_gain):
+                    result[query_idx, cutoff_idx] = cumulative_gain[
+                        min(cutoff, len(cumulative_gain)) - 1]
+
+        return result
+
+    def evaluate(self, doc_idxs, cutoffs=DEFAULT_CUTOFFS,
+                 measures=('ndcg_cut', 'map_cut', 'success')):
+        """Computes measures at cutoffs for rankings encoded by encode.
+
+        Documents beyond the depth of doc_idxs are considered non-relevant,
+        as for rankings shorter than a cutoff in trec_eval.
+
+        :param doc_idxs: an integer array of shape (..., queries, depth)
+        :return: a dictionary of measure to an array of shape
+            (..., queries, cutoffs)
+        """
+        doc_idxs = np.asarray(doc_idxs)
+        depth = doc_idxs.shape[-1]
+
+        query_idxs = np.arange(len(self.query_ids))[:, np.newaxis]
+        relevance = self.relevance[query_idxs, doc_idxs]
+
+        # Position of the last document within every cutoff.
+        last = np.minimum(np.asarray(cutoffs), depth) - 1
+        empty = depth == 0
+
+        def at_cutoffs(cumulative):
+            if empty:
+                return np.zeros(cumulative.shape[:-1] + (len(cutoffs),))
+
+            return cumulative[..., last]
+
+        results = {}
+
+        if 'ndcg_cut' in measures:
+            gains = np.maximum(relevance, 0) / np.log2(np.arange(depth) + 2)
+            dcg = at_cutoffs(np.cumsum(gains, axis=-1))
+
+            ideal_dcg = self.ideal_dcg(cutoffs)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                results['ndcg_cut'] = np.where(
+                    ideal_dcg > 0.0, dcg / ideal_dcg, dcg)
+
+        is_relevant = relevance >= self.relevance_level
+
+        if 'map_cut' in measures:
+            num_relevant_so_far = np.cumsum(is_relevant, axis=-1)
+            precisions = is_relevant * num_relevant_so_far / (
+                np.arange(depth) + 1.0)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                results['map_cut'] = np.where(
+                    self.num_relevant[:, np.newaxis] > 0,
+                    at_cutoffs(np.cumsum(precisions, axis=-1)) /
+                    self.num_relevant[:, np.newaxis],
+                    0.0)
+
+        if 'success' in measures:
+            results['success'] = (
+                at_cutoffs(np.cumsum(is_relevant, axis=-1)) > 0).astype(
+                    np.float64)
+
+        return results
+
+    @staticmethod
+    def measure_names(measure, cutoffs=DEFAULT_CUTOFFS):
+        """Names of the values of a measure, as in RelevanceEvaluator."""
+        return ['{}_{}'.format(measure, cutoff) for cutoff in cutoffs]
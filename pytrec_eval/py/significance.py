@@ -0,0 +1,137 @@
+"""Statistical significance tests over the per-query values of many systems.
+
+All functions take a (systems x queries) matrix of the values of a single
+measure, e.g., evaluate_many(runs)[:, :, measure_idx], and compare all pairs
+of systems at once. Queries with a NaN value for any of the systems (i.e.,
+missing from a run) are left out, such that all tests are paired.
+
+Randomized tests use a numpy.random.RandomState seeded with the given seed
+and are therefore reproducible."""
+
+import numpy as np
+
+__all__ = [
+    'paired_queries',
+    'paired_ttest',
+    'permutation_test',
+    'bootstrap_ci',
+]
+
+
+def paired_queries(values):
+    """Returns the columns of a (systems x queries) matrix of the queries
+    for which every system has a value."""
+    values = np.asarray(values, dtype=np.float64)
+
+    if values.ndim != 2:
+        raise ValueError('Expected a (systems x queries) matrix.')
+
+    return values[:, ~np.isnan(values).any(axis=0)]
+
+
+def _pairwise_differences(values):
+    # (systems x systems x queries), where [i, j] holds system i minus system j.
+    return values[:, np.newaxis, :] - values[np.newaxis, :, :]
+
+
+def paired_ttest(values):
+    """Two-sided paired t-tests between all pairs of systems.
+
+    Returns a pair of (systems x systems) matrices with the t statistics and
+    p-values of system i against system j; equivalent to
+    scipy.stats.ttest_rel(values[i], values[j]) for every pair."""
+    import scipy.stats
+
+    values = paired_queries(values)
+    num_queries = values.shape[1]
+
+    differences = _pairwise_differences(values)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistics = differences.mean(axis=2) / (
+            differences.std(axis=2, ddof=1) / np.sqrt(num_queries))
+
+    p_values = 2.0 * scipy.stats.t.sf(np.abs(statistics), num_queries - 1)
+
+    return statistics, p_values
+
+
+def permutation_test(values, num_permutations=10000, seed=0,
+                     batch_size=1000):
+    """Two-sided paired randomization tests between all pairs of systems.
+
+    Under the null hypothesis the two values of a query are exchangeable, so
+    the sign of every per-query difference is flipped at random. The same
+    permutations are used for all pairs; they are processed in batches of
+    batch_size to bound memory use.
+
+    Returns a (systems x systems) matrix of p-values, where identical
+    systems have a p-value of 1."""
+    values = paired_queries(values)
+    num_queries = values.shape[1]
+
+    differences = _pairwise_differences(values)
+    observed = np.abs(differences.mean(axis=2))
+
+    random_state = np.random.RandomState(seed)
+
+    # Tolerance for ties due to floating point summation order.
+    tolerance = 1e-12 * max(1.0, np.abs(differences).max(initial=0.0))
+
+    num_extreme = np.zeros(observed.shape, dtype=np.int64)
+
+    for batch_start in range(0, num_permutations, batch_size):
+        num_batch = min(batch_size, num_permutations - batch_start)
+
+        signs = random_state.choice(
+            np.array([-1.0, 1.0]), size=(num_batch, num_queries))
+
+        # (systems x systems x permutations)
+        permuted = np.abs(np.dot(differences, signs.T)) / num_queries
+
+        num_extreme += (
+            permuted >= observed[:, :, np.newaxis] - tolerance).sum(axis=2)
+
+    return (num_extreme + 1.0) / (num_permutations + 1.0)
+
+
+def bootstrap_ci(values, num_samples=10000, confidence=0.95, seed=0):
+    """Percentile bootstrap confidence intervals of the mean of every system
+    and of the mean difference between all pairs of systems.
+
+    Queries are resampled with replacement; all systems share the same
+    resamples, such that the intervals of the differences are paired.
+
+    Returns a dictionary with 'mean' (systems), 'lower' and 'upper'
+    (systems) and 'difference_lower' and 'difference_upper'
+    (systems x systems, system i minus system j)."""
+    values = paired_queries(values)
+    num_queries = values.shape[1]
+
+    random_state = np.random.RandomState(seed)
+
+    # Every resample is represented by how often each query is drawn, such
+    # that the means of all resamples are a single matrix product.
+    counts = random_state.multinomial(
+        num_queries, np.full(num_queries, 1.0 / num_queries),
+        size=num_samples).astype(np.float64)
+
+    # (systems x samples)
+    sample_means = np.dot(values, counts.T) / num_queries
+
+    alpha = 1.0 - confidence
+    percentiles = [100.0 * alpha / 2.0, 100.0 * (1.0 - alpha / 2.0)]
+
+    lower, upper = np.percentile(sample_means, percentiles, axis=1)
+
+    sample_differences = _pairwise_differences(sample_means)
+    difference_lower, difference_upper = np.percentile(
+        sample_differences, percentiles, axis=2)
+
+    return {
+        'mean': values.mean(axis=1),
+        'lower': lower,
+        'upper': upper,
+        'difference_lower': difference_lower,
+        'difference_upper': difference_upper,
+    }
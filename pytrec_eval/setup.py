@@ -1,3 +1,4 @@
+import numpy
 import os
 from distutils.core import setup, Extension
 
@@ -14,9 +15,10 @@ pytrec_eval_ext = Extension(
     'pytrec_eval_ext',
     sources=['src/pytrec_eval.cpp'] + TREC_EVAL_SRC,
     libraries=['m', 'stdc++'],
-    include_dirs=[TREC_EVAL_DIR],
+    include_dirs=[TREC_EVAL_DIR, numpy.get_include()],
     undef_macros=['NDEBUG'],
-    extra_compile_args=['-g', '-Wall'],
+    extra_compile_args=['-g', '-Wall', '-pthread'],
+    extra_link_args=['-pthread'],
     define_macros=[('VERSIONID', '\"pytrec_eval\"'),
                    ('_GLIBCXX_USE_CXX11_ABI', '0'),
                    ('P_NEEDS_GNU_CXX_NAMESPACE', '1')])
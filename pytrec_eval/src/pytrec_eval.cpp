@@ -1,6 +1,9 @@
 #include <Python.h>
 #include "structmember.h"
 
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+#include <numpy/arrayobject.h>
+
 // trec_Eval includes.
 #include "common.h"
 #include "sysfunc.h"
@@ -11,12 +14,27 @@ extern "C" int te_print_single_meas_a_cut (
     const EPI *epi, const TREC_MEAS *tm,
     const TREC_EVAL *eval);
 
+extern "C" int te_meas_relstring_cleanup ();
+
 #include "functions.h"
 
+// POSIX.
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
 // Standard library.
+#include <algorithm>
+#include <atomic>
+#include <cctype>
+#include <cerrno>
+#include <cstdlib>
 #include <map>
 #include <set>
 #include <string>
+#include <thread>
+#include <vector>
 
 extern int te_num_trec_measures;
 extern TREC_MEAS* te_trec_measures[];
@@ -27,7 +45,7 @@ extern REL_INFO_FILE_FORMAT te_rel_info_format[];
 extern int te_num_results_format;
 extern RESULTS_FILE_FORMAT te_results_format[];
 extern int te_num_form_inter_procs;
-extern RESULTS_FILE_FORMAT te_form_inter_procs[];
+extern FORM_INTER_PROCS te_form_inter_procs[];
 
 #define CHECK(condition) assert(condition)
 #define CHECK_EQ(first, second) assert(first == second)
@@ -53,25 +71,458 @@ int PyDict_SetItemAndSteal(PyObject* p, PyObject* key, PyObject* val) {
     return ret;
 }
 
+static PyTypeObject CompiledQrelType;
 static PyTypeObject RelevanceEvaluatorType;
 
-// RelevanceEvaluator
+// CompiledQrel
+
+// Relevance judgments are compiled into a flat buffer, which can be pickled or placed in
+// shared memory, with the following layout:
+//
+//     CompiledQrelHeader
+//     CompiledQrelQuery[num_queries]  (sorted by query identifier)
+//     CompiledQrelPair[num_pairs]     (sorted by document identifier within every query)
+//     char[num_string_bytes]          (NUL-terminated identifiers)
+struct CompiledQrelHeader {
+    char magic[8];
+    int64 num_queries;
+    int64 num_pairs;
+    int64 num_string_bytes;
+};
+
+struct CompiledQrelQuery {
+    int64 qid_offset;
+    int64 first_pair;
+    int64 num_pairs;
+};
+
+struct CompiledQrelPair {
+    int64 docno_offset;
+    int64 rel;
+};
+
+static const char kCompiledQrelMagic[8] = {'P', 'T', 'E', 'Q', 'R', 'E', 'L', '1'};
 
 typedef struct {
     PyObject_HEAD
 
-    // Original dictionary with relevance information.
-    PyObject* object_relevance_per_qid_;
+    // View of the flat buffer; buffer_.obj is NULL when no buffer is held.
+    Py_buffer buffer_;
 
-    // trec_eval session structure.
-    EPI epi_;
+    // Number of bytes of the buffer that are used by the judgments.
+    size_t num_bytes_;
 
-    // trec_eval relevance structure.
+    // trec_eval relevance structure, pointing into the buffer.
     ALL_REL_INFO all_rel_info_;
+    TEXT_QRELS_INFO* text_qrels_info_;
+    TEXT_QRELS* text_qrels_;
 
-    // Mapping from query identifier to internal idx.
+    // Mapping from query identifier to internal idx; as queries are sorted, the
+    // internal idx is also the position of a query among the sorted identifiers.
     std::map<std::string, size_t>* query_id_to_idx_;
+} CompiledQrel;
+
+static PyObject* CompiledQrel_new(PyTypeObject* type, PyObject* args, PyObject* kwds) {
+    CompiledQrel* self;
+
+    self = (CompiledQrel*) type->tp_alloc(type, 0);
+    if (self != NULL) {
+        self->buffer_.obj = NULL;
+        self->num_bytes_ = 0;
+        self->all_rel_info_.num_q_rels = 0;
+        self->all_rel_info_.rel_info = NULL;
+        self->text_qrels_info_ = NULL;
+        self->text_qrels_ = NULL;
+        self->query_id_to_idx_ = new std::map<std::string, size_t>;
+    }
+
+    return (PyObject*) self;
+}
+
+static bool CompareCStrings(const char* const a, const char* const b) {
+    return strcmp(a, b) < 0;
+}
+
+// Compiles a dictionary of query identifier to a dictionary of document identifier to
+// relevance into a bytes object holding the flat buffer.
+static PyObject* CompileQrelDictionary(PyObject* const object_relevance_per_qid) {
+    typedef std::pair<const char*, int64> PairType;
+
+    std::vector<const char*> qids;
+    std::map<const char*, std::vector<PairType>, bool (*)(const char*, const char*)>
+        pairs_per_qid(CompareCStrings);
+
+    int64 num_pairs = 0;
+    int64 num_string_bytes = 0;
+
+    PyObject* key = NULL;
+    PyObject* value = NULL;
+
+    Py_ssize_t pos = 0;
+
+    while (PyDict_Next(object_relevance_per_qid, &pos, &key, &value)) {
+        if (!PyUnicode_Check(key)) {
+            PyErr_SetString(PyExc_TypeError, "Expected string as key.");
+
+            return NULL;
+        }
+
+        if (!PyDict_Check(value)) {
+            PyErr_SetString(PyExc_TypeError, "Expected dictionary as value.");
+
+            return NULL;
+        }
+
+        const char* const qid = PyUnicode_AsUTF8(key);
+        CHECK_NOTNULL(qid);
+
+        std::vector<PairType>& pairs = pairs_per_qid[qid];
+
+        PyObject* inner_key = NULL;
+        PyObject* inner_value = NULL;
+
+        Py_ssize_t inner_pos = 0;
+
+        while (PyDict_Next(value, &inner_pos, &inner_key, &inner_value)) {
+            if (!PyUnicode_Check(inner_key)) {
+                PyErr_SetString(PyExc_TypeError, "Expected mapping of document id to query relevance or matching score.");
+
+                return NULL;
+            }
+
+            if (!PyLong_Check(inner_value)) {
+                PyErr_SetString(PyExc_TypeError, "Expected relevance to be integer.");
+
+                return NULL;
+            }
+
+            const char* const docno = PyUnicode_AsUTF8(inner_key);
+            CHECK_NOTNULL(docno);
+
+            pairs.push_back(PairType(docno, PyLong_AsLong(inner_value)));
+            num_string_bytes += strlen(docno) + 1;
+        }
+
+        std::sort(pairs.begin(), pairs.end(),
+                  [](const PairType& a, const PairType& b) {
+                      return strcmp(a.first, b.first) < 0;
+                  });
+
+        num_pairs += pairs.size();
+        num_string_bytes += strlen(qid) + 1;
+    }
+
+    const int64 num_queries = pairs_per_qid.size();
+
+    const size_t num_bytes =
+        sizeof(CompiledQrelHeader) +
+        num_queries * sizeof(CompiledQrelQuery) +
+        num_pairs * sizeof(CompiledQrelPair) +
+        num_string_bytes;
+
+    PyObject* const result = PyBytes_FromStringAndSize(NULL, num_bytes);
+
+    if (result == NULL) {
+        return NULL;
+    }
+
+    char* const data = PyBytes_AS_STRING(result);
+
+    CompiledQrelHeader header;
+    memcpy(header.magic, kCompiledQrelMagic, sizeof(header.magic));
+    header.num_queries = num_queries;
+    header.num_pairs = num_pairs;
+    header.num_string_bytes = num_string_bytes;
+
+    memcpy(data, &header, sizeof(header));
+
+    char* query_ptr = data + sizeof(CompiledQrelHeader);
+    char* pair_ptr = query_ptr + num_queries * sizeof(CompiledQrelQuery);
+    char* const strings = pair_ptr + num_pairs * sizeof(CompiledQrelPair);
+
+    int64 pair_idx = 0;
+    int64 string_offset = 0;
+
+    for (auto it = pairs_per_qid.begin(); it != pairs_per_qid.end(); ++it) {
+        const CompiledQrelQuery query = {string_offset, pair_idx, (int64) it->second.size()};
+        memcpy(query_ptr, &query, sizeof(query));
+        query_ptr += sizeof(query);
+
+        const size_t qid_size = strlen(it->first) + 1;
+        memcpy(strings + string_offset, it->first, qid_size);
+        string_offset += qid_size;
+
+        for (size_t idx = 0; idx < it->second.size(); ++idx) {
+            const CompiledQrelPair pair = {string_offset, it->second[idx].second};
+            memcpy(pair_ptr, &pair, sizeof(pair));
+            pair_ptr += sizeof(pair);
+
+            const size_t docno_size = strlen(it->second[idx].first) + 1;
+            memcpy(strings + string_offset, it->second[idx].first, docno_size);
+            string_offset += docno_size;
+        }
+
+        pair_idx += it->second.size();
+    }
+
+    CHECK_EQ(pair_idx, num_pairs);
+    CHECK_EQ(string_offset, num_string_bytes);
+
+    return result;
+}
+
+// Validates the flat buffer held by self and builds the trec_eval structures pointing into it.
+static bool LoadCompiledQrel(CompiledQrel* const self) {
+    const char* const data = (const char*) self->buffer_.buf;
+    const size_t size = self->buffer_.len;
+
+    CompiledQrelHeader header;
+
+    if (size < sizeof(header)) {
+        return false;
+    }
+
+    memcpy(&header, data, sizeof(header));
+
+    // Bounds every count by the buffer size before computing the expected size.
+    if (memcmp(header.magic, kCompiledQrelMagic, sizeof(header.magic)) != 0 ||
+        header.num_queries < 0 || header.num_queries > (int64) size ||
+        header.num_pairs < 0 || header.num_pairs > (int64) size ||
+        header.num_string_bytes < 0 || header.num_string_bytes > (int64) size) {
+        return false;
+    }
+
+    const size_t num_bytes =
+        sizeof(CompiledQrelHeader) +
+        header.num_queries * sizeof(CompiledQrelQuery) +
+        header.num_pairs * sizeof(CompiledQrelPair) +
+        header.num_string_bytes;
+
+    // Trailing bytes are allowed, as shared memory is rounded up to whole pages.
+    if (num_bytes > size) {
+        return false;
+    }
+
+    const char* const queries = data + sizeof(CompiledQrelHeader);
+    const char* const pairs = queries + header.num_queries * sizeof(CompiledQrelQuery);
+    const char* const strings = pairs + header.num_pairs * sizeof(CompiledQrelPair);
+
+    // Every identifier is terminated within the string section.
+    if (header.num_string_bytes > 0 && strings[header.num_string_bytes - 1] != '\0') {
+        return false;
+    }
+
+    self->text_qrels_info_ = Malloc(std::max<int64>(header.num_queries, 1), TEXT_QRELS_INFO);
+    self->text_qrels_ = Malloc(std::max<int64>(header.num_pairs, 1), TEXT_QRELS);
+    self->all_rel_info_.rel_info = Malloc(std::max<int64>(header.num_queries, 1), REL_INFO);
+
+    CHECK_NOTNULL(self->text_qrels_info_);
+    CHECK_NOTNULL(self->text_qrels_);
+    CHECK_NOTNULL(self->all_rel_info_.rel_info);
+
+    const char* previous_qid = NULL;
+
+    for (int64 query_idx = 0; query_idx < header.num_queries; ++query_idx) {
+        CompiledQrelQuery query;
+        memcpy(&query, queries + query_idx * sizeof(query), sizeof(query));
+
+        if (query.qid_offset < 0 || query.qid_offset >= header.num_string_bytes ||
+            query.first_pair < 0 || query.num_pairs < 0 ||
+            query.first_pair > header.num_pairs - query.num_pairs) {
+            return false;
+        }
+
+        const char* const qid = strings + query.qid_offset;
+
+        if (previous_qid != NULL && strcmp(previous_qid, qid) >= 0) {
+            return false;
+        }
+
+        previous_qid = qid;
+
+        TEXT_QRELS* const text_qrels = self->text_qrels_ + query.first_pair;
+        const char* previous_docno = NULL;
+
+        for (int64 pair_idx = 0; pair_idx < query.num_pairs; ++pair_idx) {
+            CompiledQrelPair pair;
+            memcpy(&pair,
+                   pairs + (query.first_pair + pair_idx) * sizeof(pair),
+                   sizeof(pair));
+
+            if (pair.docno_offset < 0 || pair.docno_offset >= header.num_string_bytes) {
+                return false;
+            }
+
+            const char* const docno = strings + pair.docno_offset;
+
+            // Documents are sorted, as trec_eval expects, and unique.
+            if (previous_docno != NULL && strcmp(previous_docno, docno) >= 0) {
+                return false;
+            }
+
+            previous_docno = docno;
+
+            text_qrels[pair_idx].docno = (char*) docno;
+            text_qrels[pair_idx].rel = pair.rel;
+        }
+
+        self->text_qrels_info_[query_idx].num_text_qrels = query.num_pairs;
+        self->text_qrels_info_[query_idx].text_qrels = text_qrels;
+
+        self->all_rel_info_.rel_info[query_idx].qid = (char*) qid;
+        self->all_rel_info_.rel_info[query_idx].rel_format = "qrels";
+        self->all_rel_info_.rel_info[query_idx].q_rel_info = &self->text_qrels_info_[query_idx];
+
+        self->query_id_to_idx_->insert(
+            self->query_id_to_idx_->end(), {std::string(qid), query_idx});
+    }
+
+    self->all_rel_info_.num_q_rels = header.num_queries;
+    self->num_bytes_ = num_bytes;
+
+    return true;
+}
+
+static int CompiledQrel_init(CompiledQrel* self, PyObject* args, PyObject* kwds) {
+    PyObject* object_relevance = NULL;
+
+    static char* kwlist[] = {"query_relevance", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist, &object_relevance)) {
+        return -1;
+    }
+
+    if (self->buffer_.obj != NULL) {
+        PyErr_SetString(PyExc_TypeError, "CompiledQrel is already initialized.");
+
+        return -1;
+    }
+
+    PyObject* buffer_owner = NULL;
+
+    if (PyDict_Check(object_relevance)) {
+        buffer_owner = CompileQrelDictionary(object_relevance);
+
+        if (buffer_owner == NULL) {
+            return -1;
+        }
+    } else if (PyObject_CheckBuffer(object_relevance)) {
+        Py_INCREF(object_relevance);
+        buffer_owner = object_relevance;
+    } else {
+        PyErr_SetString(
+            PyExc_TypeError,
+            "Argument query_relevance should be of type dictionary or a compiled buffer.");
+
+        return -1;
+    }
+
+    const int status = PyObject_GetBuffer(buffer_owner, &self->buffer_, PyBUF_SIMPLE);
+
+    // The view holds a reference to its owner.
+    Py_DECREF(buffer_owner);
+
+    if (status != 0) {
+        self->buffer_.obj = NULL;
+
+        return -1;
+    }
+
+    if (!LoadCompiledQrel(self)) {
+        PyErr_SetString(PyExc_ValueError, "Invalid compiled qrel buffer.");
+
+        return -1;
+    }
+
+    return 0;
+}
+
+static void CompiledQrel_dealloc(CompiledQrel* self) {
+    Free(self->text_qrels_info_);
+    Free(self->text_qrels_);
+    Free(self->all_rel_info_.rel_info);
+
+    if (self->buffer_.obj != NULL) {
+        PyBuffer_Release(&self->buffer_);
+    }
+
+    delete self->query_id_to_idx_;
+
+    Py_TYPE(self)->tp_free((PyObject*) self);
+}
+
+static PyObject* CompiledQrel_to_bytes(CompiledQrel* self, PyObject* args) {
+    if (self->buffer_.obj == NULL) {
+        PyErr_SetString(PyExc_ValueError, "CompiledQrel is not initialized.");
+
+        return NULL;
+    }
+
+    return PyBytes_FromStringAndSize((const char*) self->buffer_.buf, self->num_bytes_);
+}
+
+static PyObject* CompiledQrel_reduce(CompiledQrel* self, PyObject* args) {
+    PyObject* const data = CompiledQrel_to_bytes(self, NULL);
+
+    if (data == NULL) {
+        return NULL;
+    }
+
+    return Py_BuildValue("(O(N))", (PyObject*) Py_TYPE(self), data);
+}
+
+static PyObject* CompiledQrel_get_query_ids(CompiledQrel* self, void* closure) {
+    PyObject* const query_ids = PyList_New(self->query_id_to_idx_->size());
+
+    size_t sorted_idx = 0;
+    for (std::map<std::string, size_t>::iterator it = self->query_id_to_idx_->begin();
+         it != self->query_id_to_idx_->end(); ++it) {
+        PyList_SET_ITEM(query_ids, sorted_idx++, PyUnicode_FromString(it->first.c_str()));
+    }
+
+    return query_ids;
+}
+
+static PyObject* CompiledQrel_get_nbytes(CompiledQrel* self, void* closure) {
+    return PyLong_FromSize_t(self->num_bytes_);
+}
+
+static PyMethodDef CompiledQrel_methods[] = {
+    {"to_bytes", (PyCFunction) CompiledQrel_to_bytes, METH_NOARGS,
+     "Returns the flat buffer of the compiled relevance judgments, "
+     "from which a CompiledQrel can be constructed without conversion."},
+    {"__reduce__", (PyCFunction) CompiledQrel_reduce, METH_NOARGS,
+     "Pickles the flat buffer of the compiled relevance judgments."},
+    {NULL}  /* Sentinel */
+};
+
+static PyGetSetDef CompiledQrel_getset[] = {
+    {(char*) "query_ids", (getter) CompiledQrel_get_query_ids, NULL,
+     (char*) "Sorted query identifiers of the relevance judgments.", NULL},
+    {(char*) "nbytes", (getter) CompiledQrel_get_nbytes, NULL,
+     (char*) "Size of the flat buffer in bytes.", NULL},
+    {NULL}  /* Sentinel */
+};
+
+// RelevanceEvaluator
+
+typedef struct {
+    PyObject_HEAD
+
+    // Compiled relevance judgments, which can be shared with other evaluators.
+    CompiledQrel* qrel_;
+
+    // trec_eval session structure.
+    EPI epi_;
+
     std::set<size_t>* measures_;
+
+    // Names of the values computed for every query (one per cutoff for cut measures),
+    // in the order in which they are produced by EvaluateRuns.
+    std::vector<std::string>* measure_names_;
+
+    // Number of threads that evaluate queries.
+    size_t num_threads_;
 } RelevanceEvaluator;
 
 static PyObject* RelevanceEvaluator_new(PyTypeObject* type, PyObject* args, PyObject* kwds) {
@@ -79,10 +530,10 @@ static PyObject* RelevanceEvaluator_new(PyTypeObject* type, PyObject* args, PyOb
 
     self = (RelevanceEvaluator*) type->tp_alloc(type, 0);
     if (self != NULL) {
-        self->object_relevance_per_qid_ = NULL;
-        self->query_id_to_idx_ = new std::map<std::string, size_t>;
+        self->qrel_ = NULL;
         self->measures_ = new std::set<size_t>;
-        self->all_rel_info_.num_q_rels = -1;
+        self->measure_names_ = new std::vector<std::string>;
+        self->num_threads_ = 1;
     }
 
     return (PyObject*) self;
@@ -123,8 +574,7 @@ class RankingBuilder {
                 return false;
             }
 
-            Py_INCREF(key);
-
+            // The caller keeps the keys alive, see ConvertedRun.
             queries[query_idx].qid = PyUnicode_AsUTF8(key);
             CHECK_NOTNULL(queries[query_idx].qid);
 
@@ -187,50 +637,6 @@ class RankingBuilder {
         PyObject* const inner_value) const = 0;
 };
 
-class QrelRankingBuilder : public RankingBuilder<REL_INFO, TEXT_QRELS_INFO, TEXT_QRELS> {
- public:
-    virtual void cleanup(const int64 num_queries, REL_INFO* queries) const {
-        for (size_t idx = 0; idx < num_queries; ++idx) {
-            Free(((TEXT_QRELS_INFO*) queries[idx].q_rel_info)->text_qrels);
-        }
-
-        Free(queries->q_rel_info);
-        Free(queries);
-    }
-
- protected:
-    virtual bool ProcessQuery(REL_INFO* const query,
-                              TEXT_QRELS_INFO* const query_pair_list) const {
-        query->rel_format = "qrels";
-        query->q_rel_info = query_pair_list;
-
-        return true;
-    }
-
-    virtual bool ProcessListOfQueryDocumentPairs(
-            TEXT_QRELS_INFO* const query_pair_list,
-            const size_t num_pairs,
-            TEXT_QRELS* const query_document_pairs) const {
-        query_pair_list->num_text_qrels = num_pairs;
-        query_pair_list->text_qrels = query_document_pairs;
-
-        return true;
-    }
-
-    virtual bool ProcessQueryDocumentPair(TEXT_QRELS* const pair,
-                                          PyObject* const inner_value) const {
-        if (!PyLong_Check(inner_value)) {
-            PyErr_SetString(PyExc_TypeError, "Expected relevance to be integer.");
-
-            return false;
-        }
-
-        pair->rel = PyLong_AsLong(inner_value);
-
-        return true;
-    }
-};
-
 class ResultRankingBuilder : public RankingBuilder<RESULTS, TEXT_RESULTS_INFO, TEXT_RESULTS> {
  public:
     virtual void cleanup(const int64 num_queries, RESULTS* queries) const {
@@ -238,7 +644,12 @@ class ResultRankingBuilder : public RankingBuilder<RESULTS, TEXT_RESULTS_INFO, T
             Free(((TEXT_RESULTS_INFO*) queries[idx].q_results)->text_results);
         }
 
-        Free(queries->q_results);
+        // The results of all queries are allocated at once, as those of the
+        // first query; an empty run has none.
+        if (num_queries > 0) {
+            Free(queries->q_results);
+        }
+
         Free(queries);
     }
 
@@ -276,14 +687,53 @@ class ResultRankingBuilder : public RankingBuilder<RESULTS, TEXT_RESULTS_INFO, T
     }
 };
 
-int qrel_docno_compare(
-        const void* raw_a, const void* raw_b) {
-    const QrelRankingBuilder::QueryDocumentPairType* a =
-        (QrelRankingBuilder::QueryDocumentPairType*) raw_a;
-    const QrelRankingBuilder::QueryDocumentPairType* b =
-        (QrelRankingBuilder::QueryDocumentPairType*) raw_b;
+// State of the requested measures during the evaluation of one or more runs.
+//
+// The measure descriptions are copied after initialization, as init_meas stores
+// the offset of a measure in te_trec_measures, which is shared by all evaluators.
+// Evaluation only reads from this state, such that it can be shared by threads.
+struct MeasureState {
+    TREC_EVAL accum_eval;
+    std::vector<TREC_MEAS> measures;
+};
 
-    return std::string(a->docno).compare(b->docno);
+// Initializes the values of all requested measures.
+static void InitializeMeasures(RelevanceEvaluator* const self,
+                               MeasureState* const state) {
+    state->accum_eval = (TREC_EVAL) {"all", 0, NULL, 0, 0};
+    state->measures.clear();
+
+    for (std::set<size_t>::iterator it = self->measures_->begin();
+         it != self->measures_->end(); ++it) {
+        const size_t measure_idx = *it;
+
+        te_trec_measures[measure_idx]->init_meas(
+            &self->epi_,
+            te_trec_measures[measure_idx],
+            &state->accum_eval);
+
+        state->measures.push_back(*te_trec_measures[measure_idx]);
+    }
+}
+
+static void CleanupMeasures(RelevanceEvaluator* const self,
+                            MeasureState* const state) {
+    for (size_t idx = 0; idx < state->measures.size(); ++idx) {
+        // Cleanup; nothing gets printed as self->epi_.summary_flag == 0.
+        state->measures[idx].print_final_and_cleanup_meas 
+            (&self->epi_, &state->measures[idx], &state->accum_eval);
+    }
+
+    Free(state->accum_eval.values);
+}
+
+// Number of values a measure produces for every query.
+static int32 NumMeasureValues(const TREC_MEAS* const measure) {
+    if (measure->print_single_meas == &te_print_single_meas_a_cut) {
+        return measure->meas_params->num_params;
+    } else {
+        return 1;
+    }
 }
 
 static int RelevanceEvaluator_init(RelevanceEvaluator* self, PyObject* args, PyObject* kwds) {
@@ -291,16 +741,18 @@ static int RelevanceEvaluator_init(RelevanceEvaluator* self, PyObject* args, PyO
     PyObject* measures = NULL;
 
     int32 relevance_level = 1;
+    int num_threads = 1;
 
     static char* kwlist[] = {
-        "query_relevance", "measures", "relevance_level",
+        "query_relevance", "measures", "relevance_level", "num_threads",
         NULL};
 
     if (!PyArg_ParseTupleAndKeywords(
-            args, kwds, "OO|i", kwlist,
+            args, kwds, "OO|ii", kwlist,
             &object_relevance_per_qid,
             &measures,
-            &relevance_level)) {
+            &relevance_level,
+            &num_threads)) {
         PyErr_SetString(
             PyExc_TypeError,
             "Expected object_relevance_per_qid dictionary "
@@ -309,9 +761,11 @@ static int RelevanceEvaluator_init(RelevanceEvaluator* self, PyObject* args, PyO
         return -1;
     }
 
-    if (!PyDict_Check(object_relevance_per_qid)) {
+    if (!PyDict_Check(object_relevance_per_qid) &&
+        !PyObject_TypeCheck(object_relevance_per_qid, &CompiledQrelType)) {
         PyErr_SetString(PyExc_TypeError,
-                        "Argument query_relevance should be of type dictionary.");
+                        "Argument query_relevance should be of type dictionary "
+                        "or CompiledQrel.");
 
         return -1;
     }
@@ -330,6 +784,17 @@ static int RelevanceEvaluator_init(RelevanceEvaluator* self, PyObject* args, PyO
         return -1;
     }
 
+    if (num_threads < 0) {
+        PyErr_SetString(PyExc_TypeError,
+                        "Argument num_threads should be non-negative.");
+
+        return -1;
+    }
+
+    // Zero threads selects one per hardware thread.
+    self->num_threads_ = (num_threads > 0) ?
+        num_threads : std::max<unsigned int>(1, std::thread::hardware_concurrency());
+
     // Configure trec_eval session.
     self->epi_.query_flag = 0;
     self->epi_.average_complete_flag = 0;
@@ -374,63 +839,50 @@ static int RelevanceEvaluator_init(RelevanceEvaluator* self, PyObject* args, PyO
         return -1;
     }
 
-    // Save reference to object_relevance_per_qid.
-    Py_INCREF(object_relevance_per_qid);
+    // Compile the relevance judgments, unless they have been compiled already.
+    if (PyObject_TypeCheck(object_relevance_per_qid, &CompiledQrelType)) {
+        Py_INCREF(object_relevance_per_qid);
+    } else {
+        object_relevance_per_qid = PyObject_CallFunctionObjArgs(
+            (PyObject*) &CompiledQrelType, object_relevance_per_qid, NULL);
+
+        if (object_relevance_per_qid == NULL) {
+            return -1;
+        }
+    }
 
-    self->object_relevance_per_qid_ = object_relevance_per_qid;
-    CHECK_NOTNULL(self->object_relevance_per_qid_);
+    Py_XDECREF(self->qrel_);
+    self->qrel_ = (CompiledQrel*) object_relevance_per_qid;
 
-    // Build internal trec_eval data structures.
-    QrelRankingBuilder builder;
+    // Resolve the names of the values produced by every measure.
+    MeasureState state;
 
-    int64 num_queries = 0;
-    QrelRankingBuilder::QueryType* queries = NULL;
+    InitializeMeasures(self, &state);
 
-    if (!builder(self->object_relevance_per_qid_, num_queries, queries)) {
-        Py_DECREF(self->object_relevance_per_qid_);
+    for (size_t idx = 0; idx < state.measures.size(); ++idx) {
+        const TREC_MEAS* const measure = &state.measures[idx];
 
-        return -1;
+        if (measure->print_single_meas == &te_print_single_meas_a_cut) {
+            for (int32 param_idx = 0; param_idx < NumMeasureValues(measure); ++param_idx) {
+                self->measure_names_->push_back(
+                    state.accum_eval.values[measure->eval_index + param_idx].name);
+            }
+        } else {
+            self->measure_names_->push_back(measure->name);
+        }
     }
 
-    CHECK_NOTNULL(queries);
-
-    for (size_t query_idx = 0; query_idx < num_queries; ++query_idx) {
-        qsort(((TEXT_QRELS_INFO*) queries[query_idx].q_rel_info)->text_qrels,
-              ((TEXT_QRELS_INFO*) queries[query_idx].q_rel_info)->num_text_qrels,
-              sizeof(QrelRankingBuilder::QueryDocumentPairType),
-              qrel_docno_compare);
-    }
-
-    self->all_rel_info_.num_q_rels = num_queries;
-    self->all_rel_info_.rel_info = queries;
-
-    for (size_t query_idx = 0; query_idx < num_queries; ++query_idx) {
-        const std::string& qid = queries[query_idx].qid;
-        CHECK_EQ(self->query_id_to_idx_->find(qid), self->query_id_to_idx_->end());
-
-        self->query_id_to_idx_->insert({qid, query_idx});
-    }
+    CleanupMeasures(self, &state);
 
     return NULL;
 }
 
 static void RelevanceEvaluator_dealloc(RelevanceEvaluator* self) {
-    if (self->object_relevance_per_qid_ != NULL) {
-        Py_DECREF(self->object_relevance_per_qid_);
+    Py_XDECREF(self->qrel_);
+    self->qrel_ = NULL;
 
-        self->object_relevance_per_qid_ = NULL;
-    }
-
-    if (self->all_rel_info_.num_q_rels >= 0) {
-        // Clean up internal trec_eval data structures.
-        QrelRankingBuilder builder;
-        builder.cleanup(self->all_rel_info_.num_q_rels, self->all_rel_info_.rel_info);
-
-        self->all_rel_info_.num_q_rels = -1;
-    }
-
-    delete self->query_id_to_idx_;
     delete self->measures_;
+    delete self->measure_names_;
 }
 
 int query_document_pair_compare(
@@ -445,6 +897,435 @@ int query_document_pair_compare(
     return std::string(a->docno).compare(b->docno);
 }
 
+// A run converted into trec_eval data structures.
+class ConvertedRun {
+ public:
+    ConvertedRun() : num_queries_(0), queries_(NULL) {}
+
+    // Needs to hold the GIL.
+    ~ConvertedRun() {
+        if (queries_ != NULL) {
+            builder_.cleanup(num_queries_, queries_);
+        }
+
+        for (size_t key_idx = 0; key_idx < keys_.size(); ++key_idx) {
+            Py_DECREF(keys_[key_idx]);
+        }
+    }
+
+    // Converts a run dictionary; needs to hold the GIL.
+    //
+    // The converted run refers to the UTF-8 buffers of the query and document
+    // ids of the dictionary, so it holds a reference to each of these strings:
+    // they stay alive while the GIL is released, even if another thread
+    // modifies or clears the dictionary.
+    bool convert(RelevanceEvaluator* const self, PyObject* const object_scores) {
+        if (!builder_(object_scores, num_queries_, queries_)) {
+            // The partially converted run cannot be cleaned up, as the builder
+            // does not record how far it got (see TODO in RankingBuilder).
+            num_queries_ = 0;
+            queries_ = NULL;
+
+            PyErr_SetString(
+                PyExc_TypeError,
+                "Unable to extract query/object scores.");
+
+            return false;
+        }
+
+        CHECK_NOTNULL(queries_);
+
+        // The dictionary cannot have changed since its conversion, as the GIL
+        // is held throughout.
+        PyObject* key = NULL;
+        PyObject* value = NULL;
+        Py_ssize_t pos = 0;
+
+        while (PyDict_Next(object_scores, &pos, &key, &value)) {
+            Py_INCREF(key);
+            keys_.push_back(key);
+
+            PyObject* inner_key = NULL;
+            PyObject* inner_value = NULL;
+            Py_ssize_t inner_pos = 0;
+
+            while (PyDict_Next(value, &inner_pos, &inner_key, &inner_value)) {
+                Py_INCREF(inner_key);
+                keys_.push_back(inner_key);
+            }
+        }
+
+        for (size_t query_idx = 0; query_idx < num_queries_; ++query_idx) {
+            qsort(((TEXT_RESULTS_INFO*) queries_[query_idx].q_results)->text_results,
+                  ((TEXT_RESULTS_INFO*) queries_[query_idx].q_results)->num_text_results,
+                  sizeof(ResultRankingBuilder::QueryDocumentPairType),
+                  query_document_pair_compare);
+
+            std::map<std::string, size_t>::iterator it =
+                self->qrel_->query_id_to_idx_->find(queries_[query_idx].qid);
+
+            if (it == self->qrel_->query_id_to_idx_->end()) {
+                // Query not found in relevance judgments; skipping.
+                continue;
+            }
+
+            result_query_idxs_.push_back(query_idx);
+            eval_query_idxs_.push_back(it->second);
+        }
+
+        return true;
+    }
+
+    // Number of queries that are evaluated.
+    size_t size() const { return result_query_idxs_.size(); }
+
+    const char* qid(const size_t idx) const {
+        return queries_[result_query_idxs_[idx]].qid;
+    }
+
+    const RESULTS* results(const size_t idx) const {
+        return &queries_[result_query_idxs_[idx]];
+    }
+
+    size_t eval_query_idx(const size_t idx) const { return eval_query_idxs_[idx]; }
+
+ private:
+    ResultRankingBuilder builder_;
+
+    int64 num_queries_;
+    ResultRankingBuilder::QueryType* queries_;
+
+    // Converted queries that occur in the relevance judgments,
+    // and their internal idx in the relevance judgments.
+    std::vector<size_t> result_query_idxs_;
+    std::vector<size_t> eval_query_idxs_;
+
+    // Query and document ids the converted queries refer to.
+    std::vector<PyObject*> keys_;
+
+    // Not copyable, as the destructor frees the converted queries.
+    ConvertedRun(const ConvertedRun&);
+    ConvertedRun& operator=(const ConvertedRun&);
+};
+
+// Computes the measure values of a range of the queries of converted runs.
+//
+// Values are written to values[query_offsets[run_idx] + idx], which is a buffer of
+// num_values doubles; it does not call into Python and can run without the GIL.
+class QueryEvaluator {
+ public:
+    QueryEvaluator(const RelevanceEvaluator* const self,
+                   const MeasureState& state,
+                   const std::vector<ConvertedRun*>& runs,
+                   const std::vector<size_t>& query_offsets,
+                   const size_t num_values,
+                   double* const values)
+        : self_(self), state_(state), runs_(runs), query_offsets_(query_offsets),
+          num_values_(num_values), values_(values) {}
+
+    // Evaluates queries, numbered over the concatenation of all runs, until
+    // next_query reaches end.
+    void operator()(std::atomic<size_t>* const next_query, const size_t end) const {
+        /* Reserve space and initialize q_eval to be copy of accum_eval */
+        TREC_EVAL q_eval;
+
+        q_eval.values = Malloc(
+            state_.accum_eval.num_values, TREC_EVAL_VALUE);
+        CHECK_NOTNULL(q_eval.values);
+
+        memcpy(q_eval.values, state_.accum_eval.values,
+               state_.accum_eval.num_values * sizeof (TREC_EVAL_VALUE));
+
+        q_eval.num_values = state_.accum_eval.num_values;
+        q_eval.num_queries = 0;
+
+        size_t run_idx = 0;
+
+        for (size_t query_idx = (*next_query)++; query_idx < end; query_idx = (*next_query)++) {
+            if (query_offsets_[run_idx + 1] <= query_idx) {
+                // Query identifiers are only unique within a run.
+                reset_cached_query();
+            }
+
+            while (query_offsets_[run_idx + 1] <= query_idx) {
+                ++run_idx;
+            }
+
+            evaluate(*runs_[run_idx], query_idx - query_offsets_[run_idx],
+                     &q_eval, values_ + query_idx * num_values_);
+        }
+
+        Free(q_eval.values);
+
+        reset_cached_query();
+        te_meas_relstring_cleanup();
+    }
+
+ private:
+    // trec_eval caches the intermediate results of the last evaluated query, by query
+    // identifier, for every thread. Evaluating a different ranking of a query with the
+    // same identifier requires the cache to be cleared.
+    static void reset_cached_query() {
+        for (int32 idx = 0; idx < te_num_form_inter_procs; ++idx) {
+            te_form_inter_procs[idx].cleanup();
+        }
+    }
+
+    void evaluate(const ConvertedRun& run, const size_t idx,
+                  TREC_EVAL* const q_eval, double* const values) const {
+        q_eval->qid = run.qid(idx);
+
+        size_t value_idx = 0;
+
+        for (size_t measure_idx = 0; measure_idx < state_.measures.size(); ++measure_idx) {
+            const TREC_MEAS* const measure = &state_.measures[measure_idx];
+
+            // Empty buffer.
+            for (int32 value_idx = 0; value_idx < q_eval->num_values; ++value_idx) {
+                q_eval->values[value_idx].value = 0;
+            }
+
+            // Compute measure.
+            measure->calc_meas(
+                &self_->epi_,
+                &self_->qrel_->all_rel_info_.rel_info[run.eval_query_idx(idx)],
+                run.results(idx),
+                measure,
+                q_eval);
+
+            CHECK_GE(measure->eval_index, 0);
+
+            for (int32 param_idx = 0; param_idx < NumMeasureValues(measure); ++param_idx) {
+                values[value_idx++] = q_eval->values[measure->eval_index + param_idx].value;
+            }
+
+            if (__DEVELOPMENT) {
+                // Print.
+                measure->print_single_meas(
+                    &self_->epi_,
+                    measure,
+                    q_eval);
+            }
+        }
+
+        CHECK_EQ(value_idx, num_values_);
+    }
+
+    const RelevanceEvaluator* const self_;
+    const MeasureState& state_;
+    const std::vector<ConvertedRun*>& runs_;
+    const std::vector<size_t>& query_offsets_;
+    const size_t num_values_;
+    double* const values_;
+};
+
+// Evaluates converted runs, releasing the GIL while the measures are computed.
+//
+// Queries are distributed over self->num_threads_ threads. Afterwards, for every run
+// and every query that occurs in the relevance judgments (in the order of the run),
+// callbacks[run_idx](qid, eval_query_idx, values) is invoked while holding the GIL,
+// where values holds the measure values in the order of self->measure_names_.
+template <typename CallbackT>
+static bool EvaluateRuns(RelevanceEvaluator* const self,
+                         const MeasureState& state,
+                         const std::vector<ConvertedRun*>& runs,
+                         const std::vector<CallbackT*>& callbacks) {
+    const size_t num_values = self->measure_names_->size();
+
+    std::vector<size_t> query_offsets(1, 0);
+
+    for (size_t run_idx = 0; run_idx < runs.size(); ++run_idx) {
+        query_offsets.push_back(query_offsets.back() + runs[run_idx]->size());
+    }
+
+    const size_t num_queries = query_offsets.back();
+    std::vector<double> values(num_queries * num_values);
+
+    const QueryEvaluator query_evaluator(
+        self, state, runs, query_offsets, num_values, values.data());
+
+    std::atomic<size_t> next_query(0);
+
+    const size_t num_threads = std::max<size_t>(
+        1, std::min<size_t>(self->num_threads_, num_queries));
+
+    Py_BEGIN_ALLOW_THREADS
+
+    std::vector<std::thread> threads;
+
+    for (size_t thread_idx = 1; thread_idx < num_threads; ++thread_idx) {
+        threads.push_back(std::thread(query_evaluator, &next_query, num_queries));
+    }
+
+    query_evaluator(&next_query, num_queries);
+
+    for (size_t thread_idx = 0; thread_idx < threads.size(); ++thread_idx) {
+        threads[thread_idx].join();
+    }
+
+    Py_END_ALLOW_THREADS
+
+    std::vector<double> query_values(num_values);
+
+    for (size_t run_idx = 0; run_idx < runs.size(); ++run_idx) {
+        for (size_t idx = 0; idx < runs[run_idx]->size(); ++idx) {
+            const double* const begin =
+                values.data() + (query_offsets[run_idx] + idx) * num_values;
+
+            query_values.assign(begin, begin + num_values);
+
+            if (!(*callbacks[run_idx])(runs[run_idx]->qid(idx),
+                                    runs[run_idx]->eval_query_idx(idx),
+                                    query_values)) {
+                return false;
+            }
+        }
+    }
+
+    return true;
+}
+
+// Evaluates a single run; see EvaluateRuns.
+template <typename CallbackT>
+static bool EvaluateRun(RelevanceEvaluator* const self,
+                        PyObject* const object_scores,
+                        CallbackT& callback) {
+    ConvertedRun run;
+
+    if (!run.convert(self, object_scores)) {
+        return false;
+    }
+
+    MeasureState state;
+
+    InitializeMeasures(self, &state);
+
+    std::vector<ConvertedRun*> runs(1, &run);
+    std::vector<CallbackT*> callbacks(1, &callback);
+
+    const bool success = EvaluateRuns(self, state, runs, callbacks);
+
+    CleanupMeasures(self, &state);
+
+    return success;
+}
+
+static PyObject* RelevanceEvaluator_get_query_ids(RelevanceEvaluator* self, void* closure) {
+    return CompiledQrel_get_query_ids(self->qrel_, closure);
+}
+
+static PyObject* RelevanceEvaluator_get_qrel(RelevanceEvaluator* self, void* closure) {
+    Py_INCREF(self->qrel_);
+
+    return (PyObject*) self->qrel_;
+}
+
+static PyObject* RelevanceEvaluator_get_measure_names(RelevanceEvaluator* self, void* closure) {
+    PyObject* const measure_names = PyList_New(self->measure_names_->size());
+
+    for (size_t value_idx = 0; value_idx < self->measure_names_->size(); ++value_idx) {
+        PyList_SET_ITEM(measure_names, value_idx,
+                        PyUnicode_FromString((*self->measure_names_)[value_idx].c_str()));
+    }
+
+    return measure_names;
+}
+
+// Collects the measure values of every query into a dictionary of dictionaries.
+class DictionaryCollector {
+ public:
+    DictionaryCollector(const std::vector<std::string>& measure_names)
+        : measure_names_(measure_names), result_(PyDict_New()) {}
+
+    bool operator()(const std::string& qid,
+                    const size_t eval_query_idx,
+                    const std::vector<double>& values) {
+        PyObject* const query_measures = PyDict_New();
+
+        for (size_t value_idx = 0; value_idx < values.size(); ++value_idx) {
+            PyDict_SetItemAndSteal(
+                query_measures,
+                PyUnicode_FromString(measure_names_[value_idx].c_str()),
+                PyFloat_FromDouble(values[value_idx]));
+        }
+
+        PyDict_SetItemAndSteal(
+            result_,
+            PyUnicode_FromString(qid.c_str()),
+            query_measures);
+
+        return true;
+    }
+
+    PyObject* result() const { return result_; }
+
+ private:
+    const std::vector<std::string>& measure_names_;
+    PyObject* const result_;
+};
+
+// Writes the measure values of every query into one (queries x measures) slice of an array.
+//
+// Rows are ordered by query identifier, which is the order of the internal query idx.
+class ArrayCollector {
+ public:
+    explicit ArrayCollector(double* const data) : data_(data) {}
+
+    bool operator()(const std::string& qid,
+                    const size_t eval_query_idx,
+                    const std::vector<double>& values) {
+        double* const row = data_ + eval_query_idx * values.size();
+
+        for (size_t value_idx = 0; value_idx < values.size(); ++value_idx) {
+            row[value_idx] = values[value_idx];
+        }
+
+        return true;
+    }
+
+ private:
+    double* const data_;
+};
+
+// Collects the measure values of every query into the rows of a matrix, ordered by query identifier.
+class MatrixCollector {
+ public:
+    bool operator()(const std::string& qid,
+                    const size_t eval_query_idx,
+                    const std::vector<double>& values) {
+        rows_.insert({qid, values});
+
+        return true;
+    }
+
+    // Returns a (query_ids, values) pair.
+    PyObject* result(const size_t num_measures) const {
+        npy_intp dims[2] = {(npy_intp) rows_.size(), (npy_intp) num_measures};
+        PyArrayObject* const values = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_DOUBLE);
+
+        if (values == NULL) {
+            return NULL;
+        }
+
+        PyObject* const query_ids = PyList_New(rows_.size());
+        double* data = (double*) PyArray_DATA(values);
+
+        size_t row_idx = 0;
+        for (std::map<std::string, std::vector<double> >::const_iterator it = rows_.begin();
+             it != rows_.end(); ++it) {
+            PyList_SET_ITEM(query_ids, row_idx++, PyUnicode_FromString(it->first.c_str()));
+
+            std::copy(it->second.begin(), it->second.end(), data);
+            data += num_measures;
+        }
+
+        return Py_BuildValue("(NN)", query_ids, values);
+    }
+
+ private:
+    std::map<std::string, std::vector<double> > rows_;
+};
+
 static PyObject* RelevanceEvaluator_evaluate(RelevanceEvaluator* self, PyObject* args) {
     PyObject* object_scores = NULL;
 
@@ -457,165 +1338,468 @@ static PyObject* RelevanceEvaluator_evaluate(RelevanceEvaluator* self, PyObject*
         return NULL;
     }
 
-    ResultRankingBuilder builder;
+    // Holds the result.
+    DictionaryCollector collector(*self->measure_names_);
 
-    int64 num_queries = 0;
-    ResultRankingBuilder::QueryType* queries = NULL;
+    const bool success = EvaluateRun(self, object_scores, collector);
 
-    if (!builder(object_scores, num_queries, queries)) {
+    if (!success) {
+        Py_DECREF(collector.result());
+
+        return NULL;
+    }
+
+    return collector.result();
+}
+
+static PyObject* RelevanceEvaluator_evaluate_array(RelevanceEvaluator* self, PyObject* args) {
+    PyObject* object_scores = NULL;
+
+    if (!PyArg_ParseTuple(args, "O", &object_scores) ||
+        !PyDict_Check(object_scores)) {
         PyErr_SetString(
             PyExc_TypeError,
-            "Unable to extract query/object scores.");
+            "Argument object scores should be of type dictionary.");
 
         return NULL;
     }
 
-    CHECK_NOTNULL(queries);
+    MatrixCollector collector;
+
+    const bool success = EvaluateRun(self, object_scores, collector);
 
-    for (size_t query_idx = 0; query_idx < num_queries; ++query_idx) {
-        qsort(((TEXT_RESULTS_INFO*) queries[query_idx].q_results)->text_results,
-              ((TEXT_RESULTS_INFO*) queries[query_idx].q_results)->num_text_results,
-              sizeof(ResultRankingBuilder::QueryDocumentPairType),
-              query_document_pair_compare);
+    if (!success) {
+        return NULL;
     }
 
-    ALL_RESULTS all_results;
-    TREC_EVAL q_eval;
+    PyObject* const query_ids_and_values = collector.result(self->measure_names_->size());
 
-    all_results.num_q_results = num_queries;
-    all_results.results = queries;
+    if (query_ids_and_values == NULL) {
+        return NULL;
+    }
 
-    TREC_EVAL accum_eval;
-    accum_eval = (TREC_EVAL) {"all", 0, NULL, 0, 0};
+    PyObject* const result = Py_BuildValue(
+        "(ONO)",
+        PyTuple_GET_ITEM(query_ids_and_values, 0),
+        RelevanceEvaluator_get_measure_names(self, NULL),
+        PyTuple_GET_ITEM(query_ids_and_values, 1));
 
-    for (std::set<size_t>::iterator it = self->measures_->begin();
-         it != self->measures_->end(); ++it) {
-        const size_t measure_idx = *it;
+    Py_DECREF(query_ids_and_values);
 
-        te_trec_measures[measure_idx]->init_meas(
-            &self->epi_,
-            te_trec_measures[measure_idx],
-            &accum_eval);
+    return result;
+}
+
+static PyObject* RelevanceEvaluator_evaluate_many(RelevanceEvaluator* self, PyObject* args) {
+    PyObject* object_runs = NULL;
+
+    if (!PyArg_ParseTuple(args, "O", &object_runs)) {
+        return NULL;
     }
 
-    /* Reserve space and initialize q_eval to be copy of accum_eval */
-    q_eval.values = Malloc(
-        accum_eval.num_values, TREC_EVAL_VALUE);
-    CHECK_NOTNULL(q_eval.values);
+    PyObject* const runs = PySequence_Fast(
+        object_runs, "Argument runs should be a sequence of dictionaries.");
 
-    memcpy(q_eval.values, accum_eval.values,
-           accum_eval.num_values * sizeof (TREC_EVAL_VALUE));
+    if (runs == NULL) {
+        return NULL;
+    }
 
-    q_eval.num_values = accum_eval.num_values;
-    q_eval.num_queries = 0;
+    const Py_ssize_t num_runs = PySequence_Fast_GET_SIZE(runs);
+
+    for (Py_ssize_t run_idx = 0; run_idx < num_runs; ++run_idx) {
+        if (!PyDict_Check(PySequence_Fast_GET_ITEM(runs, run_idx))) {
+            PyErr_SetString(
+                PyExc_TypeError,
+                "Argument runs should be a sequence of dictionaries.");
+
+            Py_DECREF(runs);
+
+            return NULL;
+        }
+    }
+
+    const size_t num_queries = self->qrel_->all_rel_info_.num_q_rels;
+    const size_t num_measures = self->measure_names_->size();
+
+    npy_intp dims[3] = {num_runs, (npy_intp) num_queries, (npy_intp) num_measures};
+    PyArrayObject* const result = (PyArrayObject*) PyArray_SimpleNew(3, dims, NPY_DOUBLE);
+
+    if (result == NULL) {
+        Py_DECREF(runs);
+
+        return NULL;
+    }
+
+    // Queries that are missing from a run are NaN.
+    double* const data = (double*) PyArray_DATA(result);
+
+    for (npy_intp idx = 0; idx < PyArray_SIZE(result); ++idx) {
+        data[idx] = Py_NAN;
+    }
+
+    // All runs are converted first, such that their queries are evaluated together.
+    std::vector<ConvertedRun> converted_runs(num_runs);
+    std::vector<ConvertedRun*> converted_run_ptrs;
+
+    std::vector<ArrayCollector> collectors;
+    std::vector<ArrayCollector*> collector_ptrs;
+
+    bool success = true;
+
+    for (Py_ssize_t run_idx = 0; run_idx < num_runs && success; ++run_idx) {
+        success = converted_runs[run_idx].convert(
+            self, PySequence_Fast_GET_ITEM(runs, run_idx));
+
+        converted_run_ptrs.push_back(&converted_runs[run_idx]);
+        collectors.push_back(ArrayCollector(
+            data + run_idx * num_queries * num_measures));
+    }
+
+    if (success) {
+        for (Py_ssize_t run_idx = 0; run_idx < num_runs; ++run_idx) {
+            collector_ptrs.push_back(&collectors[run_idx]);
+        }
+
+        MeasureState state;
+
+        InitializeMeasures(self, &state);
+
+        success = EvaluateRuns(self, state, converted_run_ptrs, collector_ptrs);
+
+        CleanupMeasures(self, &state);
+    }
+
+    Py_DECREF(runs);
+
+    if (!success) {
+        Py_DECREF(result);
+
+        return NULL;
+    }
+
+    return (PyObject*) result;
+}
+
+static PyMemberDef RelevanceEvaluator_members[] = {
+    {NULL}  /* Sentinel */
+};
+
+static PyMethodDef RelevanceEvaluator_methods[] = {
+    {"evaluate", (PyCFunction) RelevanceEvaluator_evaluate, METH_VARARGS,
+     "Evaluate a ranking according to query relevance."},
+    {"evaluate_array", (PyCFunction) RelevanceEvaluator_evaluate_array, METH_VARARGS,
+     "Evaluate a ranking according to query relevance. "
+     "Returns a (query_ids, measure_names, values) triple, where values is a "
+     "matrix with a row per evaluated query and a column per measure."},
+    {"evaluate_many", (PyCFunction) RelevanceEvaluator_evaluate_many, METH_VARARGS,
+     "Evaluate a sequence of rankings according to query relevance. "
+     "Returns an array of shape (runs, query_ids, measure_names); "
+     "queries missing from a ranking are NaN."},
+    {NULL}  /* Sentinel */
+};
+
+static PyGetSetDef RelevanceEvaluator_getset[] = {
+    {(char*) "query_ids", (getter) RelevanceEvaluator_get_query_ids, NULL,
+     (char*) "Sorted query identifiers of the relevance judgments.", NULL},
+    {(char*) "qrel", (getter) RelevanceEvaluator_get_qrel, NULL,
+     (char*) "Compiled relevance judgments, which can be shared with other evaluators.", NULL},
+    {(char*) "measure_names", (getter) RelevanceEvaluator_get_measure_names, NULL,
+     (char*) "Names of the computed measures, one per cutoff for cut measures.", NULL},
+    {NULL}  /* Sentinel */
+};
+
+// File parsers.
+
+// Read-only memory mapping of a file; empty files are represented by an empty buffer.
+class MappedFile {
+ public:
+    MappedFile() : data_(NULL), size_(0) {}
+
+    ~MappedFile() {
+        if (data_ != NULL && size_ > 0) {
+            munmap((void*) data_, size_);
+        }
+    }
+
+    bool open(const char* const path) {
+        const int fd = ::open(path, O_RDONLY);
+
+        if (fd < 0) {
+            PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+
+            return false;
+        }
+
+        struct stat file_stat;
+
+        if (fstat(fd, &file_stat) < 0) {
+            PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+            close(fd);
+
+            return false;
+        }
+
+        size_ = file_stat.st_size;
+
+        if (size_ > 0) {
+            void* const data = mmap(NULL, size_, PROT_READ, MAP_PRIVATE, fd, 0);
+
+            if (data == MAP_FAILED) {
+                PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+                close(fd);
+
+                return false;
+            }
+
+            madvise(data, size_, MADV_SEQUENTIAL);
+            data_ = (const char*) data;
+        }
+
+        close(fd);
+
+        return true;
+    }
+
+    const char* begin() const { return data_; }
+    const char* end() const { return data_ + size_; }
+
+ private:
+    const char* data_;
+    size_t size_;
+};
+
+// Splits a line into whitespace-separated fields; returns the number of fields found,
+// up to max_fields + 1 such that superfluous fields can be detected.
+static size_t SplitFields(const char* begin, const char* const end,
+                          const size_t max_fields,
+                          std::pair<const char*, const char*>* const fields) {
+    size_t num_fields = 0;
+
+    while (begin < end && num_fields <= max_fields) {
+        while (begin < end && isspace(*begin)) {
+            ++begin;
+        }
+
+        if (begin == end) {
+            break;
+        }
+
+        const char* field_end = begin;
+
+        while (field_end < end && !isspace(*field_end)) {
+            ++field_end;
+        }
+
+        if (num_fields < max_fields) {
+            fields[num_fields] = std::make_pair(begin, field_end);
+        }
+
+        ++num_fields;
+        begin = field_end;
+    }
+
+    return num_fields;
+}
+
+// Parses a run (num_fields = 6, value_field = 4) or qrel (num_fields = 4, value_field = 3) file
+// into a dictionary of query identifier to a dictionary of document identifier to value.
+template <typename ValueParserT>
+static PyObject* ParseTrecFile(const char* const path,
+                               const size_t num_fields,
+                               const size_t value_field,
+                               ValueParserT& value_parser) {
+    MappedFile file;
+
+    if (!file.open(path)) {
+        return NULL;
+    }
 
-    // Holds the result.
     PyObject* const result = PyDict_New();
 
-    for (size_t result_query_idx = 0;
-         result_query_idx < num_queries;
-         ++result_query_idx) {
-        const std::string qid = all_results.results[result_query_idx].qid;
-        std::map<std::string, size_t>::iterator it = self->query_id_to_idx_->find(qid);
+    // Entries of a query are usually consecutive; cache the last query.
+    std::string last_query_id;
+    PyObject* last_query = NULL;
+
+    std::pair<const char*, const char*> fields[6];
+    CHECK_GE(6, num_fields);
 
-        if (it == self->query_id_to_idx_->end()) {
-            // Query not found in relevance judgments; skipping.
-            continue;
+    size_t line_number = 0;
+
+    for (const char* line = file.begin(); line < file.end();) {
+        const char* line_end = (const char*) memchr(line, '\n', file.end() - line);
+
+        if (line_end == NULL) {
+            line_end = file.end();
         }
 
-        const size_t eval_query_idx = it->second;
-        q_eval.qid = all_results.results[result_query_idx].qid;
+        ++line_number;
 
-        PyObject* const query_measures = PyDict_New();
+        const size_t num_found_fields = SplitFields(line, line_end, num_fields, fields);
 
-        for (std::set<size_t>::iterator it = self->measures_->begin();
-             it != self->measures_->end(); ++it) {
-            const size_t measure_idx = *it;
+        if (num_found_fields > 0) {
+            if (num_found_fields != num_fields) {
+                PyErr_Format(PyExc_ValueError,
+                             "%s:%zu: expected %zu fields, found %zu.",
+                             path, line_number, num_fields, num_found_fields);
 
-            // Empty buffer.
-            for (int32 value_idx = 0; value_idx < q_eval.num_values; ++value_idx) {
-                q_eval.values[value_idx].value = 0;
+                Py_DECREF(result);
+
+                return NULL;
             }
 
-            // Compute measure.
-            te_trec_measures[measure_idx]->calc_meas(
-                &self->epi_,
-                &self->all_rel_info_.rel_info[eval_query_idx],
-                &all_results.results[result_query_idx],
-                te_trec_measures[measure_idx],
-                &q_eval);
-
-            CHECK_GE(te_trec_measures[measure_idx]->eval_index, 0);
-
-            if (te_trec_measures[measure_idx]->print_single_meas == &te_print_single_meas_a_cut) {
-                for (int32 param_idx = 0;
-                     param_idx < te_trec_measures[measure_idx]->meas_params->num_params;
-                     ++param_idx) {
-                    PyDict_SetItemAndSteal(
-                        query_measures,
-                        PyUnicode_FromString(
-                            q_eval.values[te_trec_measures[measure_idx]->eval_index + param_idx].name),
-                        PyFloat_FromDouble(
-                            q_eval.values[te_trec_measures[measure_idx]->eval_index + param_idx].value));
+            PyObject* const value = value_parser(fields[value_field].first, fields[value_field].second,
+                                                 fields[value_field].second == file.end());
+
+            if (value == NULL) {
+                PyErr_Format(PyExc_ValueError,
+                             "%s:%zu: unable to parse '%.*s'.",
+                             path, line_number,
+                             (int) (fields[value_field].second - fields[value_field].first),
+                             fields[value_field].first);
+
+                Py_DECREF(result);
+
+                return NULL;
+            }
+
+            const size_t query_id_length = fields[0].second - fields[0].first;
+
+            if (last_query == NULL ||
+                    query_id_length != last_query_id.size() ||
+                    memcmp(fields[0].first, last_query_id.data(), query_id_length) != 0) {
+                last_query_id.assign(fields[0].first, fields[0].second);
+
+                PyObject* const key = PyUnicode_FromStringAndSize(
+                    last_query_id.data(), last_query_id.size());
+
+                last_query = PyDict_GetItem(result, key);
+
+                if (last_query == NULL) {
+                    last_query = PyDict_New();
+                    PyDict_SetItem(result, key, last_query);
+                    Py_DECREF(last_query);  // Borrowed from result.
                 }
-            } else {
-                PyDict_SetItemAndSteal(
-                    query_measures,
-                    PyUnicode_FromString(te_trec_measures[measure_idx]->name),
-                    PyFloat_FromDouble(
-                        q_eval.values[te_trec_measures[measure_idx]->eval_index].value));
+
+                Py_DECREF(key);
             }
 
-            // Add the measure value to the aggregate.
-            // This call is probably unnecessary as we don't rely on trec_eval's averaging mechanism.
-            te_trec_measures[measure_idx]->acc_meas(
-                &self->epi_,
-                te_trec_measures[measure_idx],
-                &q_eval,
-                &accum_eval);
+            PyObject* const object_id = PyUnicode_FromStringAndSize(
+                fields[2].first, fields[2].second - fields[2].first);
 
-            if (__DEVELOPMENT) {
-                // Print.
-                te_trec_measures[measure_idx]->print_single_meas(
-                    &self->epi_,
-                    te_trec_measures[measure_idx],
-                    &q_eval);
+            // Single lookup; returns the existing value for duplicate entries.
+            const bool duplicate = PyDict_SetDefault(last_query, object_id, value) != value;
+
+            if (duplicate) {
+                PyErr_Format(PyExc_ValueError,
+                             "%s:%zu: duplicate entry for document %U of query %s.",
+                             path, line_number, object_id, last_query_id.c_str());
             }
 
-            accum_eval.num_queries++;
+            Py_DECREF(object_id);
+            Py_DECREF(value);
+
+            if (duplicate) {
+                Py_DECREF(result);
+
+                return NULL;
+            }
         }
 
-        PyDict_SetItemAndSteal(
-            result,
-            PyUnicode_FromString(qid.c_str()),
-            query_measures);
+        line = line_end + 1;
     }
 
-    for (std::set<size_t>::iterator it = self->measures_->begin();
-         it != self->measures_->end(); ++it) {
-        const size_t measure_idx = *it;
+    return result;
+}
 
-        // Cleanup; nothing gets printed as self->epi_.summary_flag == 0.
-        te_trec_measures[measure_idx]->print_final_and_cleanup_meas 
-            (&self->epi_, te_trec_measures[measure_idx],  &accum_eval);
+// Parses a numeric token using strtod/strtol. Tokens are followed by whitespace within the
+// mapped file, except for the last token of a file without trailing newline, which is copied.
+template <typename NumberT>
+static bool ParseNumber(const char* const begin, const char* const end,
+                        const bool at_end_of_file,
+                        NumberT (*parse)(const char*, char**),
+                        NumberT* const number) {
+    std::string buffer;
+    const char* token = begin;
+
+    if (at_end_of_file) {
+        buffer.assign(begin, end);
+        token = buffer.c_str();
     }
 
-    // Clean.
-    builder.cleanup(num_queries, queries);
+    char* token_end = NULL;
 
-    Free(q_eval.values);
-    Free(accum_eval.values);
+    errno = 0;
+    *number = parse(token, &token_end);
 
-    return result;
+    return token_end == token + (end - begin) && errno != ERANGE;
 }
 
-static PyMemberDef RelevanceEvaluator_members[] = {
-    {NULL}  /* Sentinel */
+static double ParseDouble(const char* token, char** token_end) {
+    return strtod(token, token_end);
+}
+
+static long ParseLong(const char* token, char** token_end) {
+    return strtol(token, token_end, 10);
+}
+
+class ScoreParser {
+ public:
+    PyObject* operator()(const char* const begin, const char* const end,
+                         const bool at_end_of_file) const {
+        double score;
+
+        if (!ParseNumber(begin, end, at_end_of_file, &ParseDouble, &score)) {
+            return NULL;
+        }
+
+        return PyFloat_FromDouble(score);
+    }
 };
 
-static PyMethodDef RelevanceEvaluator_methods[] = {
-    {"evaluate", (PyCFunction) RelevanceEvaluator_evaluate, METH_VARARGS,
-     "Evaluate a ranking according to query relevance."},
+class RelevanceParser {
+ public:
+    PyObject* operator()(const char* const begin, const char* const end,
+                         const bool at_end_of_file) const {
+        long relevance;
+
+        if (!ParseNumber(begin, end, at_end_of_file, &ParseLong, &relevance)) {
+            return NULL;
+        }
+
+        return PyLong_FromLong(relevance);
+    }
+};
+
+static PyObject* parse_run_file(PyObject* self, PyObject* args) {
+    const char* path = NULL;
+
+    if (!PyArg_ParseTuple(args, "s", &path)) {
+        return NULL;
+    }
+
+    ScoreParser parser;
+
+    return ParseTrecFile(path, 6, 4, parser);
+}
+
+static PyObject* parse_qrel_file(PyObject* self, PyObject* args) {
+    const char* path = NULL;
+
+    if (!PyArg_ParseTuple(args, "s", &path)) {
+        return NULL;
+    }
+
+    RelevanceParser parser;
+
+    return ParseTrecFile(path, 4, 3, parser);
+}
+
+static PyMethodDef PyTrecEvalModule_methods[] = {
+    {"parse_run_file", (PyCFunction) parse_run_file, METH_VARARGS,
+     "Parse a TREC run file into a dictionary of query identifier to "
+     "a dictionary of document identifier to score."},
+    {"parse_qrel_file", (PyCFunction) parse_qrel_file, METH_VARARGS,
+     "Parse a TREC qrel file into a dictionary of query identifier to "
+     "a dictionary of document identifier to relevance."},
     {NULL}  /* Sentinel */
 };
 
@@ -624,11 +1808,53 @@ static PyModuleDef PyTrecEvalModule = {
     "pytrec_eval_ext",
     "Python interface to TREC Eval.",
     -1,
-    RelevanceEvaluator_methods,
+    PyTrecEvalModule_methods,
     NULL, NULL, NULL, NULL
 };
 
 PyMODINIT_FUNC PyInit_pytrec_eval_ext(void) {
+    CompiledQrelType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        "pytrec_eval.CompiledQrel",         /* tp_name */
+        sizeof(CompiledQrel),               /* tp_basicsize */
+        0,                         /* tp_itemsize */
+        (destructor) CompiledQrel_dealloc,  /* tp_dealloc */
+        0,                         /* tp_print */
+        0,                         /* tp_getattr */
+        0,                         /* tp_setattr */
+        0,                         /* tp_reserved */
+        0,                         /* tp_repr */
+        0,                         /* tp_as_number */
+        0,                         /* tp_as_sequence */
+        0,                         /* tp_as_mapping */
+        0,                         /* tp_hash */
+        0,                         /* tp_call */
+        0,                         /* tp_str */
+        0,                         /* tp_getattro */
+        0,                         /* tp_setattro */
+        0,                         /* tp_as_buffer */
+        Py_TPFLAGS_DEFAULT,        /* tp_flags */
+        "Relevance judgments compiled into a flat buffer, "
+        "which can be shared by RelevanceEvaluator objects", /* tp_doc */
+        0,                         /* tp_traverse */
+        0,                         /* tp_clear */
+        0,                         /* tp_richcompare */
+        0,                         /* tp_weaklistoffset */
+        0,                         /* tp_iter */
+        0,                         /* tp_iternext */
+        CompiledQrel_methods,               /* tp_methods */
+        0,                         /* tp_members */
+        CompiledQrel_getset,                /* tp_getset */
+        0,                         /* tp_base */
+        0,                         /* tp_dict */
+        0,                         /* tp_descr_get */
+        0,                         /* tp_descr_set */
+        0,                         /* tp_dictoffset */
+        (initproc) CompiledQrel_init,       /* tp_init */
+        0,                         /* tp_alloc */
+        CompiledQrel_new,                   /* tp_new */
+    };
+
     RelevanceEvaluatorType = {
         PyVarObject_HEAD_INIT(NULL, 0)
         "pytrec_eval.RelevanceEvaluator",   /* tp_name */
@@ -659,7 +1885,7 @@ PyMODINIT_FUNC PyInit_pytrec_eval_ext(void) {
         0,                         /* tp_iternext */
         RelevanceEvaluator_methods,         /* tp_methods */
         RelevanceEvaluator_members,         /* tp_members */
-        0,                         /* tp_getset */
+        RelevanceEvaluator_getset,          /* tp_getset */
         0,                         /* tp_base */
         0,                         /* tp_dict */
         0,                         /* tp_descr_get */
@@ -670,6 +1896,12 @@ PyMODINIT_FUNC PyInit_pytrec_eval_ext(void) {
         RelevanceEvaluator_new,             /* tp_new */
     };
 
+    import_array();
+
+    if (PyType_Ready(&CompiledQrelType) < 0) {
+        return NULL;
+    }
+
     if (PyType_Ready(&RelevanceEvaluatorType) < 0) {
         return NULL;
     }
@@ -683,6 +1915,9 @@ PyMODINIT_FUNC PyInit_pytrec_eval_ext(void) {
     Py_INCREF(&RelevanceEvaluatorType);
     PyModule_AddObject(module, "RelevanceEvaluator", (PyObject*) &RelevanceEvaluatorType);
 
+    Py_INCREF(&CompiledQrelType);
+    PyModule_AddObject(module, "CompiledQrel", (PyObject*) &CompiledQrelType);
+
     CHECK_EQ(te_trec_measure_nicknames[2].name, "all_trec");
 
     // Add set of all supported relevance measures.
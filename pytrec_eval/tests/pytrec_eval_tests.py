@@ -1,8 +1,15 @@
 from cvangysel.trec_utils import parse_trec_eval
+import numpy as np
 import os
+import pickle
+import scipy.stats
+import sys
+import tempfile
+import threading
 import unittest
 
 import pytrec_eval
+from pytrec_eval import kernel, significance
 
 TREC_EVAL_TEST_DIR = os.path.join(
     os.path.dirname(os.path.realpath(__file__)), '..', 'trec_eval', 'test')
@@ -17,16 +24,531 @@ def prefix_match(needle, haystack):
     return match
 
 
+def load_test_data(run_filename='results.test', qrel_filename='qrels.test'):
+    with open(os.path.join(TREC_EVAL_TEST_DIR, qrel_filename)) as f_qrel:
+        qrel = pytrec_eval.parse_qrel(f_qrel)
+
+    with open(os.path.join(TREC_EVAL_TEST_DIR, run_filename)) as f_run:
+        run = pytrec_eval.parse_run(f_run)
+
+    return qrel, run
+
+
 # TODO(cvangysel): add tests to detect memory leaks.
 class PyTrecEvalTest(unittest.TestCase):
 
-    pass
+    def test_evaluate_many(self):
+        qrel, run = load_test_data()
+
+        evaluator = pytrec_eval.RelevanceEvaluator(
+            qrel, {'map', 'ndcg_cut', 'P', 'recip_rank'})
+
+        self.assertEqual(evaluator.query_ids, sorted(qrel.keys()))
+        self.assertIn('ndcg_cut_10', evaluator.measure_names)
+        self.assertIn('recip_rank', evaluator.measure_names)
+
+        # Second run misses its first query and scores documents in reverse.
+        missing_query_id = evaluator.query_ids[0]
+        reversed_run = {
+            query_id: {object_id: -score
+                       for object_id, score in object_scores.items()}
+            for query_id, object_scores in run.items()
+            if query_id != missing_query_id}
+
+        runs = [run, reversed_run]
+        results = evaluator.evaluate_many(runs)
+
+        self.assertEqual(results.shape,
+                         (len(runs),
+                          len(evaluator.query_ids),
+                          len(evaluator.measure_names)))
+
+        for run_idx, single_run in enumerate(runs):
+            expected = evaluator.evaluate(single_run)
+
+            for query_idx, query_id in enumerate(evaluator.query_ids):
+                for measure_idx, measure in enumerate(
+                        evaluator.measure_names):
+                    value = results[run_idx, query_idx, measure_idx]
+
+                    if query_id in expected:
+                        self.assertAlmostEqual(
+                            value, expected[query_id][measure],
+                            msg=measure)
+                    else:
+                        self.assertTrue(np.isnan(value))
+
+        self.assertTrue(np.isnan(results[1, 0]).all())
+
+    def test_evaluate_array(self):
+        qrel, run = load_test_data()
+
+        # Queries without relevance judgments are not evaluated.
+        run = dict(run)
+        run['unjudged'] = {'d1': 1.0}
+
+        evaluator = pytrec_eval.RelevanceEvaluator(
+            qrel, {'map', 'ndcg_cut', 'num_rel'})
+
+        expected = evaluator.evaluate(run)
+        query_ids, measure_names, values = evaluator.evaluate_array(run)
+
+        self.assertEqual(query_ids, sorted(expected.keys()))
+        self.assertEqual(measure_names, evaluator.measure_names)
+        self.assertEqual(values.dtype, np.float64)
+        self.assertTrue(values.flags['C_CONTIGUOUS'])
+        self.assertEqual(values.shape, (len(query_ids), len(measure_names)))
+
+        for query_idx, query_id in enumerate(query_ids):
+            for measure_idx, measure in enumerate(measure_names):
+                self.assertAlmostEqual(values[query_idx, measure_idx],
+                                       expected[query_id][measure],
+                                       msg=measure)
+
+        aggregated_values = pytrec_eval.compute_aggregated_measures(
+            measure_names, values)
+
+        for measure_idx, measure in enumerate(measure_names):
+            self.assertAlmostEqual(
+                aggregated_values[measure_idx],
+                pytrec_eval.compute_aggregated_measure(
+                    measure,
+                    [query_measures[measure]
+                     for query_measures in expected.values()]),
+                msg=measure)
+
+    def test_parse_files(self):
+        for run_filename, qrel_filename in [('results.test', 'qrels.test'),
+                                            ('results.test', 'qrels.rel_level')]:
+            qrel, run = load_test_data(run_filename, qrel_filename)
+
+            self.assertEqual(
+                pytrec_eval.parse_qrel_file(
+                    os.path.join(TREC_EVAL_TEST_DIR, qrel_filename)),
+                qrel)
+            self.assertEqual(
+                pytrec_eval.parse_run_file(
+                    os.path.join(TREC_EVAL_TEST_DIR, run_filename)),
+                run)
+
+    def test_parse_files_invalid(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'test')
+
+            def write(content):
+                with open(path, 'w') as f_out:
+                    f_out.write(content)
+
+            write('')
+            self.assertEqual(pytrec_eval.parse_run_file(path), {})
+
+            write('q1 Q0 d1 1 1.5 run\n\nq1 Q0 d2 2 -1e-3 run')
+            self.assertEqual(pytrec_eval.parse_run_file(path),
+                             {'q1': {'d1': 1.5, 'd2': -0.001}})
+
+            write('q1 Q0 d1 1 1.5 run\nq1 Q0 d1 2 0.5 run\n')
+            with self.assertRaises(ValueError):
+                pytrec_eval.parse_run_file(path)
+
+            write('q1 Q0 d1 1 high run\n')
+            with self.assertRaises(ValueError):
+                pytrec_eval.parse_run_file(path)
+
+            write('q1 0 d1 1 extra\n')
+            with self.assertRaises(ValueError):
+                pytrec_eval.parse_qrel_file(path)
+
+            write('q1 0 d1 1.5\n')
+            with self.assertRaises(ValueError):
+                pytrec_eval.parse_qrel_file(path)
+
+        with self.assertRaises(OSError):
+            pytrec_eval.parse_qrel_file(path)
+
+    def test_evaluate_stream(self):
+        qrel, run = load_test_data()
+
+        evaluator = pytrec_eval.RelevanceEvaluator(
+            qrel, {'map', 'ndcg_cut', 'recip_rank'})
+
+        query_ids, _, values = evaluator.evaluate_array(run)
+
+        with open(os.path.join(TREC_EVAL_TEST_DIR, 'results.test')) as f_run:
+            self.assertEqual(
+                {query_id: object_scores
+                 for query_id, object_scores in pytrec_eval.iterate_run(f_run)},
+                run)
+
+        for batch_size in (1, 2, 64):
+            with open(os.path.join(TREC_EVAL_TEST_DIR,
+                                   'results.test')) as f_run:
+                results = list(pytrec_eval.evaluate_stream(
+                    evaluator, f_run, batch_size=batch_size))
+
+            self.assertEqual([query_id for query_id, _ in results],
+                             query_ids)
+            np.testing.assert_array_equal(
+                np.array([query_values for _, query_values in results]),
+                values)
+
+        lines = ['q1 Q0 d1 1 1.0 run\n',
+                 'q2 Q0 d1 1 1.0 run\n',
+                 'q1 Q0 d2 2 0.5 run\n']
+
+        with self.assertRaises(ValueError):
+            list(pytrec_eval.iterate_run(lines))
+
+        with self.assertRaises(ValueError):
+            list(pytrec_eval.iterate_run(lines[:1] * 2))
+
+    def test_significance(self):
+        random_state = np.random.RandomState(42)
+
+        values = random_state.uniform(size=(3, 50))
+        values[1] += 0.2
+        values[2] = values[0]
+        values[0, 7] = np.nan
+
+        paired_values = significance.paired_queries(values)
+        self.assertEqual(paired_values.shape, (3, 49))
+
+        statistics, p_values = significance.paired_ttest(values)
+
+        for i in range(3):
+            for j in range(3):
+                if np.array_equal(paired_values[i], paired_values[j]):
+                    continue
+
+                expected = scipy.stats.ttest_rel(
+                    paired_values[i], paired_values[j])
+
+                self.assertAlmostEqual(statistics[i, j], expected.statistic)
+                self.assertAlmostEqual(p_values[i, j], expected.pvalue)
+
+        permutation_p_values = significance.permutation_test(
+            values, num_permutations=2000, batch_size=300)
+
+        np.testing.assert_array_equal(
+            permutation_p_values,
+            significance.permutation_test(values, num_permutations=2000))
+        np.testing.assert_array_equal(permutation_p_values,
+                                      permutation_p_values.T)
+
+        self.assertEqual(permutation_p_values[0, 2], 1.0)
+        self.assertLess(permutation_p_values[0, 1], 0.01)
+        self.assertAlmostEqual(permutation_p_values[0, 1], p_values[0, 1],
+                               delta=0.01)
+
+        intervals = significance.bootstrap_ci(values, num_samples=2000)
+
+        np.testing.assert_array_almost_equal(
+            intervals['mean'], paired_values.mean(axis=1))
+        self.assertTrue((intervals['lower'] < intervals['mean']).all())
+        self.assertTrue((intervals['mean'] < intervals['upper']).all())
+
+        self.assertEqual(intervals['difference_lower'][0, 2], 0.0)
+        self.assertLess(intervals['difference_upper'][0, 1], 0.0)
+        self.assertGreater(intervals['difference_lower'][1, 0], 0.0)
+
+    def test_kernel(self):
+        for qrel_filename, relevance_level in [('qrels.test', 1),
+                                               ('qrels.rel_level', 2)]:
+            qrel, run = load_test_data(qrel_filename=qrel_filename)
+
+            evaluator = pytrec_eval.RelevanceEvaluator(
+                qrel, {'ndcg_cut', 'map_cut', 'success'},
+                relevance_level=relevance_level)
+            dense_qrel = kernel.DenseQrel(
+                qrel, relevance_level=relevance_level)
+
+            self.assertEqual(dense_qrel.query_ids, evaluator.query_ids)
+
+            # A shuffled run, truncated run and the original one.
+            random_state = np.random.RandomState(42)
+            rankings = [
+                {query_id: kernel.ranked_documents(object_scores)
+                 for query_id, object_scores in run.items()}]
+            rankings.append({
+                query_id: list(random_state.permutation(ranking))
+                for query_id, ranking in rankings[0].items()})
+            rankings.append({
+                query_id: ranking[:7]
+                for query_id, ranking in rankings[0].items()})
+
+            expected = evaluator.evaluate_many([
+                {query_id: {object_id: -float(rank)
+                            for rank, object_id in enumerate(ranking)}
+                 for query_id, ranking in run_rankings.items()}
+                for run_rankings in rankings])
+
+            doc_idxs, present = dense_qrel.encode(rankings, depth=1000)
+            self.assertEqual(doc_idxs.shape,
+                             (3, len(dense_qrel.query_ids), 1000))
+            self.assertTrue(
+                (present == ~np.isnan(expected).any(axis=2)).all())
+
+            for measure, cutoffs in [('ndcg_cut', kernel.DEFAULT_CUTOFFS),
+                                     ('map_cut', kernel.DEFAULT_CUTOFFS),
+                                     ('success', (1, 5, 10))]:
+                values = dense_qrel.evaluate(
+                    doc_idxs, cutoffs, measures=(measure,))[measure]
+                self.assertEqual(values.shape[:2], present.shape)
+
+                measure_idxs = [
+                    evaluator.measure_names.index(measure_name)
+                    for measure_name in dense_qrel.measure_names(
+                        measure, cutoffs)]
+
+                np.testing.assert_array_almost_equal(
+                    values[present], expected[:, :, measure_idxs][present])
+
+        # A single run and a depth smaller than the cutoffs.
+        doc_idxs, present = dense_qrel.encode(rankings[0], depth=3)
+        self.assertEqual(doc_idxs.shape, (len(dense_qrel.query_ids), 3))
+        self.assertEqual(
+            dense_qrel.evaluate(doc_idxs)['ndcg_cut'].shape,
+            (len(dense_qrel.query_ids), len(kernel.DEFAULT_CUTOFFS)))
+
+        with self.assertRaises(ValueError):
+            kernel.DenseQrel(qrel, relevance_level=0)
+
+    def test_compiled_qrel(self):
+        qrel, run = load_test_data()
+
+        compiled_qrel = pytrec_eval.CompiledQrel(qrel)
+
+        self.assertEqual(compiled_qrel.query_ids, sorted(qrel.keys()))
+
+        expected = pytrec_eval.RelevanceEvaluator(
+            qrel, {'map', 'ndcg_cut'}).evaluate(run)
+
+        evaluator = pytrec_eval.RelevanceEvaluator(
+            compiled_qrel, {'map', 'ndcg_cut'})
+        other_evaluator = pytrec_eval.RelevanceEvaluator(
+            compiled_qrel, {'P'})
+
+        self.assertIs(evaluator.qrel, compiled_qrel)
+        self.assertIs(other_evaluator.qrel, compiled_qrel)
+        self.assertEqual(evaluator.evaluate(run), expected)
+
+        data = compiled_qrel.to_bytes()
+        self.assertEqual(len(data), compiled_qrel.nbytes)
+
+        # Pickled, loaded from the flat buffer, or from a larger buffer
+        # such as shared memory.
+        buffer = bytearray(len(data) + 4096)
+        buffer[:len(data)] = data
+
+        for loaded_qrel in (pickle.loads(pickle.dumps(compiled_qrel)),
+                            pytrec_eval.CompiledQrel(data),
+                            pytrec_eval.CompiledQrel(memoryview(buffer))):
+            self.assertEqual(loaded_qrel.query_ids, compiled_qrel.query_ids)
+            self.assertEqual(loaded_qrel.to_bytes(), data)
+            self.assertEqual(
+                pytrec_eval.RelevanceEvaluator(
+                    loaded_qrel, {'map', 'ndcg_cut'}).evaluate(run),
+                expected)
+
+    def test_compiled_qrel_invalid(self):
+        qrel, _ = load_test_data()
+
+        data = pytrec_eval.CompiledQrel(qrel).to_bytes()
+
+        with self.assertRaises(ValueError):
+            pytrec_eval.CompiledQrel(b'')
+
+        with self.assertRaises(ValueError):
+            pytrec_eval.CompiledQrel(data[:-1])
+
+        with self.assertRaises(ValueError):
+            pytrec_eval.CompiledQrel(b'X' + data[1:])
+
+        with self.assertRaises(TypeError):
+            pytrec_eval.CompiledQrel(42)
+
+        with self.assertRaises(TypeError):
+            pytrec_eval.CompiledQrel({'q1': {'d1': 1.0}})
+
+        with self.assertRaises(TypeError):
+            pytrec_eval.RelevanceEvaluator(data, {'map'})
+
+    def test_evaluate_many_empty(self):
+        qrel, _ = load_test_data()
+
+        evaluator = pytrec_eval.RelevanceEvaluator(qrel, {'map'})
+
+        self.assertEqual(evaluator.evaluate_many([]).shape,
+                         (0, len(qrel), 1))
+
+        self.assertEqual(evaluator.evaluate({}), {})
+        self.assertTrue(np.isnan(evaluator.evaluate_many([{}])).all())
+
+        with self.assertRaises(TypeError):
+            evaluator.evaluate_many([{}, None])
+
+    def test_evaluate_invalid_run(self):
+        qrel, run = load_test_data()
+
+        evaluator = pytrec_eval.RelevanceEvaluator(qrel, {'map'})
+
+        expected = evaluator.evaluate(run)
+
+        for invalid_run in [{'q1': {'d1': 1}},
+                            {'q1': {'d1': 1.0, 'd2': None}},
+                            {'q1': {'d1': 1.0}, 'q2': []}]:
+            with self.assertRaises(TypeError):
+                evaluator.evaluate(invalid_run)
+
+            with self.assertRaises(TypeError):
+                evaluator.evaluate_many([run, invalid_run])
+
+        self.assertEqual(evaluator.evaluate(run), expected)
+
+    def test_evaluate_threads(self):
+        qrel, run = load_test_data()
+
+        measures = {'map', 'ndcg_cut', 'P', 'relstring', 'bpref'}
+
+        evaluator = pytrec_eval.RelevanceEvaluator(qrel, measures)
+        threaded_evaluator = pytrec_eval.RelevanceEvaluator(
+            qrel, measures, num_threads=4)
+
+        self.assertEqual(threaded_evaluator.evaluate(run),
+                         evaluator.evaluate(run))
+
+        reversed_run = {
+            query_id: {object_id: -score
+                       for object_id, score in object_scores.items()}
+            for query_id, object_scores in run.items()}
+
+        np.testing.assert_array_equal(
+            threaded_evaluator.evaluate_many([run, reversed_run, run]),
+            evaluator.evaluate_many([run, reversed_run, run]))
+
+        with self.assertRaises(TypeError):
+            pytrec_eval.RelevanceEvaluator(qrel, measures, num_threads=-1)
+
+    def test_evaluate_same_query_twice(self):
+        qrel, run = load_test_data()
+
+        evaluator = pytrec_eval.RelevanceEvaluator(qrel, {'map'})
+
+        query_id = sorted(run.keys())[0]
+        object_scores = run[query_id]
+        reversed_object_scores = {
+            object_id: -score for object_id, score in object_scores.items()}
+
+        # Consecutive evaluations of the same query identifier should not
+        # reuse the intermediate results of the previous ranking.
+        result = evaluator.evaluate({query_id: object_scores})
+        reversed_result = evaluator.evaluate(
+            {query_id: reversed_object_scores})
+
+        self.assertNotEqual(result[query_id]['map'],
+                            reversed_result[query_id]['map'])
+
+        results = evaluator.evaluate_many(
+            [{query_id: object_scores}, {query_id: reversed_object_scores}])
+        query_idx = evaluator.query_ids.index(query_id)
+
+        self.assertEqual(results[0, query_idx, 0], result[query_id]['map'])
+        self.assertEqual(results[1, query_idx, 0],
+                         reversed_result[query_id]['map'])
+
+    def test_evaluate_concurrently(self):
+        qrel, run = load_test_data()
+
+        measure_sets = [{'map', 'P'}, {'ndcg_cut', 'recip_rank'},
+                        {'Rprec', 'map', 'bpref'}]
+
+        evaluators = [
+            pytrec_eval.RelevanceEvaluator(qrel, measures, num_threads=2)
+            for measures in measure_sets]
+        expected = [evaluator.evaluate(run) for evaluator in evaluators]
+
+        results = [[] for _ in evaluators]
+
+        def evaluate(evaluator_idx):
+            for _ in range(10):
+                results[evaluator_idx].append(
+                    evaluators[evaluator_idx].evaluate(run))
+
+        threads = [threading.Thread(target=evaluate, args=(evaluator_idx,))
+                   for evaluator_idx in range(len(evaluators))]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        for evaluator_idx in range(len(evaluators)):
+            for result in results[evaluator_idx]:
+                self.assertEqual(result, expected[evaluator_idx])
+
+    def test_evaluate_modified_run(self):
+        qrel, run = load_test_data()
+
+        evaluator = pytrec_eval.RelevanceEvaluator(
+            qrel, {'map', 'P', 'ndcg_cut'}, num_threads=2)
+        expected = evaluator.evaluate(run)
+
+        def copy_run():
+            # New strings, which are freed once the copy is cleared.
+            return {''.join(list(query_id)): {
+                        ''.join(list(object_id)): score
+                        for object_id, score in object_scores.items()}
+                    for query_id, object_scores in run.items()}
+
+        current_run = [None]
+        done = threading.Event()
+
+        def clear_current_run():
+            while not done.is_set():
+                run_copy = current_run[0]
+                if run_copy is None:
+                    continue
+                for object_scores in list(run_copy.values()):
+                    object_scores.clear()
+                run_copy.clear()
+                # Reuses the memory of the freed strings.
+                garbage = [''.join(['x'] * len(object_id))
+                           for object_scores in run.values()
+                           for object_id in object_scores]
+
+        thread = threading.Thread(target=clear_current_run)
+        thread.start()
+
+        try:
+            for _ in range(50):
+                run_copy = copy_run()
+                current_run[0] = run_copy
+                result = evaluator.evaluate(run_copy)
+                # The run is cleared before or while it is evaluated, which
+                # must not change its converted queries.
+                for query_id, measures in result.items():
+                    self.assertEqual(measures, expected[query_id])
+        finally:
+            done.set()
+            thread.join()
+
+        run_copy = copy_run()
+        query_id = sorted(run_copy.keys())[0]
+        object_id = sorted(run_copy[query_id].keys())[0]
+        refcounts = (sys.getrefcount(query_id), sys.getrefcount(object_id))
+
+        evaluator.evaluate(run_copy)
+        evaluator.evaluate_many([run_copy, run_copy])
+
+        self.assertEqual(
+            (sys.getrefcount(query_id), sys.getrefcount(object_id)), refcounts)
 
 
 TRADITIONAL_TREC_EVAL_TEST_CASES = [
     ('results.test', 'qrels.test', 'out.test', {}),
     ('results.test', 'qrels.rel_level', 'out.test.aql',
      {'relevance_level': 2}),
+    ('results.test', 'qrels.test', 'out.test', {'num_threads': 4}),
 ]
 
 
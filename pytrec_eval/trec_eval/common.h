@@ -34,4 +34,16 @@
                                               (unsigned) ((n)*sizeof(type)))
 #define Free(loc) (void) free( (char *)(loc) )
 
+/*
+ * Storage class of the per-query caches of intermediate results, such that
+ * queries can be evaluated by multiple threads at the same time.
+ */
+#ifndef TE_THREAD_LOCAL
+#ifdef _MSC_VER
+#define TE_THREAD_LOCAL __declspec(thread)
+#else
+#define TE_THREAD_LOCAL __thread
+#endif
+#endif
+
 #endif /* COMMONH */
@@ -155,40 +155,40 @@ static void debug_print_prefs_and_ranks (PREFS_AND_RANKS *par, long num_prefs,
  /* Temp Structure for mapping results docno to results rank */
 
 /* Current cached query */
-static char *current_query = "no query";
-static long max_current_query = 0;
+static TE_THREAD_LOCAL char *current_query = "no query";
+static TE_THREAD_LOCAL long max_current_query = 0;
 
 /* Space reserved for cached returned values */
-static long num_judged_ret;
-static long num_judged;
-static long num_jgs;
-static JG *jgs;
-static long max_num_jgs = 0;
-static long *rank_pool;
-static long max_rank_pool = 0;
-static EC *ec_pool;
-static long max_ec_pool = 0;
-static unsigned short *ca_pool;      
-static long max_ca_pool = 0;
-static unsigned short **ca_ptr_pool; 
-static long max_ca_ptr_pool = 0;
-static unsigned char *pa_pool;
-static long max_pa_pool = 0;
-static unsigned char **pa_ptr_pool;
-static long max_pa_ptr_pool = 0;
-static float *rel_pool;
-static long max_rel_pool = 0;
+static TE_THREAD_LOCAL long num_judged_ret;
+static TE_THREAD_LOCAL long num_judged;
+static TE_THREAD_LOCAL long num_jgs;
+static TE_THREAD_LOCAL JG *jgs;
+static TE_THREAD_LOCAL long max_num_jgs = 0;
+static TE_THREAD_LOCAL long *rank_pool;
+static TE_THREAD_LOCAL long max_rank_pool = 0;
+static TE_THREAD_LOCAL EC *ec_pool;
+static TE_THREAD_LOCAL long max_ec_pool = 0;
+static TE_THREAD_LOCAL unsigned short *ca_pool;      
+static TE_THREAD_LOCAL long max_ca_pool = 0;
+static TE_THREAD_LOCAL unsigned short **ca_ptr_pool; 
+static TE_THREAD_LOCAL long max_ca_ptr_pool = 0;
+static TE_THREAD_LOCAL unsigned char *pa_pool;
+static TE_THREAD_LOCAL long max_pa_pool = 0;
+static TE_THREAD_LOCAL unsigned char **pa_ptr_pool;
+static TE_THREAD_LOCAL long max_pa_ptr_pool = 0;
+static TE_THREAD_LOCAL float *rel_pool;
+static TE_THREAD_LOCAL long max_rel_pool = 0;
 /* Space reserved for intermediate values */
-static PREFS_AND_RANKS *prefs_and_ranks;
-static long max_prefs_and_ranks = 0;
-static DOCNO_RESULTS *docno_results;
-static long max_docno_results = 0;
-static unsigned char *temp_pa_pool;
-static long max_temp_pa_pool;
-static unsigned char **temp_pa_ptr_pool;
-static long max_temp_pa_ptr_pool;
-
-static long saved_num_judged = 0;
+static TE_THREAD_LOCAL PREFS_AND_RANKS *prefs_and_ranks;
+static TE_THREAD_LOCAL long max_prefs_and_ranks = 0;
+static TE_THREAD_LOCAL DOCNO_RESULTS *docno_results;
+static TE_THREAD_LOCAL long max_docno_results = 0;
+static TE_THREAD_LOCAL unsigned char *temp_pa_pool;
+static TE_THREAD_LOCAL long max_temp_pa_pool;
+static TE_THREAD_LOCAL unsigned char **temp_pa_ptr_pool;
+static TE_THREAD_LOCAL long max_temp_pa_ptr_pool;
+
+static TE_THREAD_LOCAL long saved_num_judged = 0;
 
 
 
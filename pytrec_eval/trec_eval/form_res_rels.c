@@ -38,19 +38,19 @@ typedef struct {
 } DOCNO_INFO;
 
 /* Current cached query */
-static char *current_query = "no query";
-static long max_current_query = 0;
+static TE_THREAD_LOCAL char *current_query = "no query";
+static TE_THREAD_LOCAL long max_current_query = 0;
 
 /* Space reserved for cached returned values */
-static long *rel_levels;
-static long max_rel_levels = 0;
-static RES_RELS saved_res_rels;
-static long *ranked_rel_list;
-static long max_ranked_rel_list = 0;
+static TE_THREAD_LOCAL long *rel_levels;
+static TE_THREAD_LOCAL long max_rel_levels = 0;
+static TE_THREAD_LOCAL RES_RELS saved_res_rels;
+static TE_THREAD_LOCAL long *ranked_rel_list;
+static TE_THREAD_LOCAL long max_ranked_rel_list = 0;
 
 /* Space reserved for intermediate values */
-static DOCNO_INFO *docno_info;
-static long max_docno_info = 0;
+static TE_THREAD_LOCAL DOCNO_INFO *docno_info;
+static TE_THREAD_LOCAL long max_docno_info = 0;
 
 
 int
@@ -39,19 +39,19 @@ typedef struct {
 } DOCNO_INFO;
 
 /* Current cached query */
-static char *current_query = "no query";
-static long max_current_query = 0;
+static TE_THREAD_LOCAL char *current_query = "no query";
+static TE_THREAD_LOCAL long max_current_query = 0;
 
 /* Space reserved for cached returned values */
-static long *rel_levels;
-static long max_rel_levels = 0;
-static RES_RELS *jgs;
-static long num_jgs;
-static long max_num_jgs = 0;
-static long *ranked_rel_list;
-static long max_ranked_rel_list = 0;
-static DOCNO_INFO *docno_info;
-static long max_docno_info = 0;
+static TE_THREAD_LOCAL long *rel_levels;
+static TE_THREAD_LOCAL long max_rel_levels = 0;
+static TE_THREAD_LOCAL RES_RELS *jgs;
+static TE_THREAD_LOCAL long num_jgs;
+static TE_THREAD_LOCAL long max_num_jgs = 0;
+static TE_THREAD_LOCAL long *ranked_rel_list;
+static TE_THREAD_LOCAL long max_ranked_rel_list = 0;
+static TE_THREAD_LOCAL DOCNO_INFO *docno_info;
+static TE_THREAD_LOCAL long max_docno_info = 0;
 
 int
 te_form_res_rels_jg (const EPI *epi, const REL_INFO *rel_info,
@@ -15,8 +15,8 @@
 static double relstring_len[] = {10.0};
 static PARAMS default_relstring_params = {NULL, 1, &relstring_len[0]};
 
-static char *current_string;
-static long string_len = 0;
+static TE_THREAD_LOCAL char *current_string;
+static TE_THREAD_LOCAL long string_len = 0;
 
 static int te_calc_relstring(const EPI *epi, const REL_INFO *rel_info,
 			     const RESULTS *results, const TREC_MEAS *tm,
@@ -89,13 +89,21 @@ te_print_q_relstring (const EPI *epi, const TREC_MEAS *tm,const TREC_EVAL *eval)
 }
 
 
-static int
-te_print_relstring (const EPI *epi, TREC_MEAS *tm, TREC_EVAL *eval)
+/* Free the relevance string of the calling thread */
+int
+te_meas_relstring_cleanup ()
 {
     if (string_len > 0) {
 	string_len = 0;
 	Free (current_string);
     }
+    return (1);
+}
+
+static int
+te_print_relstring (const EPI *epi, TREC_MEAS *tm, TREC_EVAL *eval)
+{
+    (void) te_meas_relstring_cleanup ();
     if (tm->meas_params->printable_params) {
         Free (eval->values[tm->eval_index].name);
         Free (tm->meas_params->printable_params);
@@ -29,7 +29,7 @@ TREC_MEAS te_meas_runid =
      te_print_runid,
      NULL, -1};
 
-static char *runid;
+static TE_THREAD_LOCAL char *runid;
 static int 
 te_calc_runid (const EPI *epi, const REL_INFO *rel_info,
 	       const RESULTS *results, const TREC_MEAS *tm, TREC_EVAL *eval)